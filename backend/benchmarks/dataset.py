@@ -0,0 +1,117 @@
+"""
+Synthetic directory generator for the benchmark suite.
+"""
+import json
+import os
+import random
+import struct
+import zlib
+
+DEFAULT_MIX = {"txt": 30, "md": 10, "py": 20, "json": 10, "csv": 10, "png": 20}
+
+WORDS = (
+    "invoice report meeting project budget quarterly summary design review roadmap release "
+    "customer contract travel receipt research notes analysis draft schedule proposal"
+).split()
+
+
+def parse_mix(spec):
+    """Parse a file-type mix such as "txt=40,py=20,png=40" into a weights dict."""
+    mix = {}
+    for part in spec.split(","):
+        ext, _, weight = part.partition("=")
+        mix[ext.strip().lower()] = float(weight or 1)
+    return mix
+
+
+def sentence(rng, length):
+    return " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+
+
+def text_content(rng, size):
+    paragraphs = []
+    while sum(len(p) for p in paragraphs) < size:
+        paragraphs.append(" ".join(sentence(rng, rng.randint(6, 14)) for _ in range(5)))
+    return "\n\n".join(paragraphs)[:size]
+
+
+def python_content(rng, size):
+    lines = ['"""Synthetic module generated for benchmarking."""', "import os", ""]
+    index = 0
+    while sum(len(line) + 1 for line in lines) < size:
+        name = f"{rng.choice(WORDS)}_{index}"
+        lines += [f"def {name}(value):", f'    """Compute {rng.choice(WORDS)} for value."""', "    return value * 2", ""]
+        index += 1
+    return "\n".join(lines)
+
+
+def json_content(rng, size):
+    records = []
+    while len(json.dumps(records)) < size:
+        records.append({"id": len(records), "name": rng.choice(WORDS), "amount": rng.randint(1, 1000)})
+    return json.dumps(records)
+
+
+def csv_content(rng, size):
+    rows = ["id,name,category,amount"]
+    while sum(len(row) + 1 for row in rows) < size:
+        rows.append(f"{len(rows)},{rng.choice(WORDS)},{rng.choice(WORDS)},{rng.randint(1, 1000)}")
+    return "\n".join(rows)
+
+
+def png_content(rng, width=64, height=64):
+    """Encode a small random RGB image as PNG without third-party libraries."""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    base = [rng.randint(0, 255) for _ in range(3)]
+    raw = b"".join(
+        b"\x00" + bytes((base[c] + x + y) % 256 for x in range(width) for c in range(3))
+        for y in range(height)
+    )
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+GENERATORS = {
+    "txt": text_content,
+    "md": text_content,
+    "log": text_content,
+    "py": python_content,
+    "json": json_content,
+    "csv": csv_content,
+}
+
+
+def generate_directory(path, file_count, mix=None, file_size=2048, duplicate_ratio=0.0, seed=0):
+    """
+    Populate path with file_count synthetic files drawn from the extension mix.
+    duplicate_ratio of the files are byte-identical "name (n).ext" copies of earlier files.
+    Returns the list of created file names.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    extensions = list(mix)
+    weights = [mix[ext] for ext in extensions]
+    os.makedirs(path, exist_ok=True)
+
+    created = []
+    for index in range(file_count):
+        if created and rng.random() < duplicate_ratio:
+            original = rng.choice(created)
+            stem, ext = os.path.splitext(original)
+            fname = f"{stem} ({index}){ext}"
+            with open(os.path.join(path, original), "rb") as src:
+                content = src.read()
+        else:
+            ext = rng.choices(extensions, weights)[0]
+            fname = f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{index}.{ext}"
+            if ext == "png":
+                content = png_content(rng)
+            else:
+                generator = GENERATORS.get(ext, text_content)
+                content = generator(rng, rng.randint(file_size // 2, file_size * 3 // 2)).encode()
+        with open(os.path.join(path, fname), "wb") as f:
+            f.write(content)
+        created.append(fname)
+    return created
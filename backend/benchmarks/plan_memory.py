@@ -0,0 +1,121 @@
+"""
+Memory benchmark for batch plans.
+
+Compares the peak memory of the previous dict-based plan (lists of move and summary dicts,
+a nested summary tree and the response tree serialized in one piece) with MovePlan records
+and the streamed response. The legacy tree is built with an index instead of the previous
+linear child search so that large runs finish; its memory use is the same.
+
+Usage (from the backend directory):
+    python -m benchmarks.plan_memory --files 200000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from src.dedup import expand_duplicate_moves
+from src.organizer import DirectoryOrganizer
+from src.records import FileSummary
+
+CATEGORIES = ["Documents", "Photos", "Code", "Finance", "Music", "Archives", "Notes", "Work"]
+BASE_PATH = "/nonexistent/cortexfs-benchmark"
+
+
+def generate_plan(file_count, seed=0):
+    """Synthetic organizer output: moves into a few hundred nested directories, one summary each."""
+    rng = random.Random(seed)
+    moves = []
+    summaries = []
+    for i in range(file_count):
+        name = f"file_{i:07d}.{rng.choice(['pdf', 'txt', 'png', 'py', 'csv'])}"
+        directory = f"{rng.choice(CATEGORIES)}/{rng.randint(2015, 2024)}/project_{rng.randint(0, 20)}"
+        moves.append({"src_path": name, "dst_path": f"{directory}/{name}"})
+        summaries.append((name, f"Summary of {name}: notes about project {rng.randint(0, 1000)} and its budget."))
+    return moves, summaries
+
+
+def legacy_response(moves, summaries):
+    """The previous representation: dict records, a nested summary tree and a dict response tree."""
+    files = [dict(move) for move in moves]
+    summary_dicts = [{"file_path": path, "summary": summary} for path, summary in summaries]
+    tree = {}
+    for file, summary in zip(files, summary_dicts):
+        current = tree
+        for part in file["dst_path"].split("/"):
+            current = current.setdefault(part, {})
+        current["__summary__"] = summary["summary"]
+        file["summary"] = summary["summary"]
+
+    root_name = os.path.basename(BASE_PATH)
+    root = {"name": root_name, "type": "folder", "path": root_name, "children": []}
+    folders = {(): root}
+    for file in files:
+        parts = file["dst_path"].split("/")
+        parent = root
+        for depth in range(1, len(parts)):
+            key = tuple(parts[:depth])
+            if key not in folders:
+                folders[key] = {"name": parts[depth - 1], "type": "folder",
+                                "path": os.path.join(parent["path"], parts[depth - 1]), "children": []}
+                parent["children"].append(folders[key])
+            parent = folders[key]
+        parent["children"].append({
+            "name": parts[-1], "type": "file", "path": os.path.join(parent["path"], parts[-1]),
+            "summary": file["summary"], "source": file["src_path"], "destination": file["dst_path"],
+            "size": "Unknown", "lastModified": "Unknown", "fileType": "Unknown", "status": "Ready to move",
+        })
+    return len(json.dumps({"status": "ok", "treeStructure": root}))
+
+
+def compact_response(moves, summaries, organizer):
+    """MovePlan records with the response tree streamed in chunks."""
+    file_summaries = [FileSummary(path, summary) for path, summary in summaries]
+    plan = expand_duplicate_moves(moves, file_summaries, {})
+    del file_summaries
+    return sum(len(chunk) for chunk in organizer.iter_tree_json(plan, BASE_PATH))
+
+
+def measure(func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"peak_mb": peak / (1024 * 1024), "seconds": elapsed, "response_chars": size}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the memory of dict-based and compact batch plans.")
+    parser.add_argument("--files", type=int, default=100000, help="Number of planned file moves.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    moves, summaries = generate_plan(args.files, args.seed)
+    organizer = DirectoryOrganizer(base_dir=None, model_name="benchmark")
+    report = {
+        "files": args.files,
+        "legacy": measure(legacy_response, moves, summaries),
+        "compact": measure(compact_response, moves, summaries, organizer),
+    }
+    report["reduction"] = 1 - report["compact"]["peak_mb"] / report["legacy"]["peak_mb"]
+    for name in ("legacy", "compact"):
+        result = report[name]
+        print(f"{name:8} peak {result['peak_mb']:8.1f} MB  {result['seconds']:6.2f} s")
+    print(f"Peak memory reduced by {report['reduction']:.0%}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Offline throughput benchmark for the batch and watch pipelines.
+
+Generates a synthetic directory, points the summarizer and organizer at local stub LLM
+servers and reports files/sec, p50/p99 per-file latency, peak RSS and token usage.
+
+Usage (from the backend directory):
+    python -m benchmarks.run_benchmark --files 200 --ollama-latency 0.05 --groq-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.dataset import DEFAULT_MIX, generate_directory, parse_mix
+from benchmarks.stub_llm import Latency, StubServer, create_groq_app, create_ollama_app
+
+logger = logging.getLogger("benchmark")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def token_totals():
+    from src.metrics import LLM_TOKENS
+    with LLM_TOKENS.lock:
+        values = dict(LLM_TOKENS.values)
+    totals = defaultdict(int)
+    for (call, kind), value in values.items():
+        totals[kind] += value
+    return dict(totals)
+
+
+def token_delta(before, after):
+    return {kind: after.get(kind, 0) - before.get(kind, 0) for kind in set(before) | set(after)}
+
+
+def latency_stats(latencies):
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies) if latencies else None,
+    }
+
+
+def run_batch(data_dir, file_count, trace_dir):
+    """Run /batch-organize through the FastAPI app and derive per-file latency from its trace."""
+    from fastapi.testclient import TestClient
+    from server import create_app
+
+    client = TestClient(create_app())
+    tokens_before = token_totals()
+    start = time.perf_counter()
+    response = client.post("/batch-organize", json={"path": data_dir})
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise RuntimeError(f"Batch organization failed: {response.status_code} {response.text}")
+
+    per_file = defaultdict(float)
+    for trace_file in os.listdir(trace_dir):
+        with open(os.path.join(trace_dir, trace_file)) as f:
+            trace = json.load(f)
+        if trace["pipeline"] != "batch":
+            continue
+        for span in trace["spans"]:
+            if "file" in span:
+                per_file[span["file"]] += span["duration"]
+
+    return {
+        "files": file_count,
+        "seconds": elapsed,
+        "files_per_sec": file_count / elapsed if elapsed else None,
+        "per_file_latency": latency_stats(list(per_file.values())),
+        "tokens": token_delta(tokens_before, token_totals()),
+    }
+
+
+def run_watch(data_dir, target_dir, file_names, concurrency, requests_per_minute, tokens_per_minute):
+    """Request a suggestion for every file as the watch pipeline does, without RabbitMQ."""
+    from src.organizer import DirectoryOrganizer
+    from src.ratelimit import QuotaLimiter
+    from src.summarizer import FileSummarizer
+    from src.watchdog import FileEventProducer
+
+    organizer = DirectoryOrganizer(
+        base_dir=None,
+        model_name="llama-3.1-70b-versatile",
+        limiter=QuotaLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute),
+    )
+    summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+    producer = FileEventProducer(
+        rabbitmq_url=None,
+        queue_name="benchmark",
+        organizer=organizer,
+        summarizer=summarizer,
+        logger=logger,
+    )
+    producer.directory_to_watch = data_dir
+    producer.target_directory = target_dir
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def suggest(file_name):
+            async with semaphore:
+                start = time.perf_counter()
+                await producer.get_suggestions(file_name)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(suggest(file_name) for file_name in file_names))
+        return latencies
+
+    tokens_before = token_totals()
+    start = time.perf_counter()
+    latencies = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    return {
+        "files": len(file_names),
+        "seconds": elapsed,
+        "files_per_sec": len(file_names) / elapsed if elapsed else None,
+        "per_file_latency": latency_stats(latencies),
+        "tokens": token_delta(tokens_before, token_totals()),
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Return human readable regressions of report against a previous baseline report."""
+    regressions = []
+    for pipeline, result in report["pipelines"].items():
+        previous = baseline.get("pipelines", {}).get(pipeline)
+        if not previous:
+            continue
+        if previous["files_per_sec"] and result["files_per_sec"] < previous["files_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{pipeline}: throughput {result['files_per_sec']:.2f} files/s "
+                f"vs baseline {previous['files_per_sec']:.2f} files/s"
+            )
+        old_p99 = previous["per_file_latency"]["p99"]
+        new_p99 = result["per_file_latency"]["p99"]
+        if old_p99 and new_p99 and new_p99 > old_p99 * (1 + tolerance):
+            regressions.append(f"{pipeline}: p99 latency {new_p99:.3f}s vs baseline {old_p99:.3f}s")
+    previous_rss = baseline.get("peak_rss_mb")
+    if previous_rss and report["peak_rss_mb"] > previous_rss * (1 + tolerance):
+        regressions.append(f"peak RSS {report['peak_rss_mb']:.1f} MB vs baseline {previous_rss:.1f} MB")
+    return regressions
+
+
+def print_report(report):
+    print(f"\nBenchmark: {report['config']['files']} files, mix {report['config']['mix']}")
+    print(f"{'pipeline':<10}{'files/s':>10}{'p50 (s)':>10}{'p99 (s)':>10}{'prompt tok':>12}{'compl. tok':>12}")
+    for pipeline, result in report["pipelines"].items():
+        latency = result["per_file_latency"]
+        print(
+            f"{pipeline:<10}{result['files_per_sec']:>10.2f}"
+            f"{latency['p50'] or 0:>10.3f}{latency['p99'] or 0:>10.3f}"
+            f"{result['tokens'].get('prompt', 0):>12}{result['tokens'].get('completion', 0):>12}"
+        )
+    print(f"Peak RSS: {report['peak_rss_mb']:.1f} MB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline CortexFS pipeline benchmark")
+    parser.add_argument("--files", type=int, default=100, help="number of synthetic files")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="file-type mix as ext=weight pairs")
+    parser.add_argument("--file-size", type=int, default=2048, help="average text file size in bytes")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="fraction of duplicate copies")
+    parser.add_argument("--pipelines", default="batch,watch", help="pipelines to run")
+    parser.add_argument("--watch-concurrency", type=int, default=4, help="concurrent watch-mode files")
+    parser.add_argument("--ollama-latency", type=float, default=0.05, help="stub Ollama latency in seconds")
+    parser.add_argument("--groq-latency", type=float, default=0.2, help="stub Groq latency in seconds")
+    parser.add_argument("--requests-per-minute", type=float, default=100000,
+                        help="Groq request quota the organizer paces itself to")
+    parser.add_argument("--tokens-per-minute", type=float, default=100000000,
+                        help="Groq token quota the organizer paces itself to")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform latency jitter in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    work_dir = tempfile.mkdtemp(prefix="cortexfs-bench-")
+    data_dir = os.path.join(work_dir, "files")
+    target_dir = os.path.join(work_dir, "target")
+    trace_dir = os.path.join(work_dir, "traces")
+    for directory in ("Documents/Notes", "Code", "Images"):
+        os.makedirs(os.path.join(target_dir, directory), exist_ok=True)
+
+    ollama = StubServer(create_ollama_app(Latency(args.ollama_latency, args.jitter, args.seed))).start()
+    groq = StubServer(create_groq_app(Latency(args.groq_latency, args.jitter, args.seed + 1))).start()
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama.url,
+        "GROQ_BASE_URL": groq.url,
+        "GROQ_API_KEY": os.getenv("GROQ_API_KEY") or "benchmark",
+        "HISTORY_DB_PATH": os.path.join(work_dir, "history.db"),
+        "SEARCH_DB_PATH": os.path.join(work_dir, "search.db"),
+        "TRACE_DIR": trace_dir,
+        "GROQ_REQUESTS_PER_MINUTE": str(args.requests_per_minute),
+        "GROQ_TOKENS_PER_MINUTE": str(args.tokens_per_minute),
+    })
+
+    try:
+        mix = parse_mix(args.mix)
+        file_names = generate_directory(
+            data_dir, args.files, mix=mix, file_size=args.file_size,
+            duplicate_ratio=args.duplicate_ratio, seed=args.seed,
+        )
+        pipelines = {}
+        for pipeline in args.pipelines.split(","):
+            if pipeline == "batch":
+                pipelines["batch"] = run_batch(data_dir, len(file_names), trace_dir)
+            elif pipeline == "watch":
+                pipelines["watch"] = run_watch(
+                    data_dir, target_dir, file_names, args.watch_concurrency,
+                    args.requests_per_minute, args.tokens_per_minute,
+                )
+            else:
+                raise SystemExit(f"Unknown pipeline: {pipeline}")
+        report = {
+            "config": {**vars(args), "mix": mix},
+            "pipelines": pipelines,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        ollama.stop()
+        groq.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Local stand-ins for the Ollama and Groq APIs used by the benchmark suite.
+
+Both servers answer deterministically after a configurable latency so that benchmark runs
+are reproducible and do not depend on model availability or provider quotas.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Rough token estimate used to report usage from the stubs
+CHARS_PER_TOKEN = 4
+
+CATEGORY_DIRECTORIES = {
+    "png": "Images", "jpg": "Images", "jpeg": "Images", "heic": "Images",
+    "pdf": "Documents/PDFs", "txt": "Documents/Notes", "md": "Documents/Notes",
+    "py": "Code/Python", "js": "Code/JavaScript", "json": "Data/JSON", "csv": "Data/Tables",
+    "log": "Logs",
+}
+
+
+class Latency:
+    """Latency model: a fixed delay plus uniform jitter, both in seconds."""
+    def __init__(self, mean=0.0, jitter=0.0, seed=0):
+        self.mean = mean
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        with self.lock:
+            offset = self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(self.mean + offset, 0.0)
+
+
+def estimate_tokens(text):
+    return max(len(text) // CHARS_PER_TOKEN, 1)
+
+
+def message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def destination_for(file_path):
+    ext = os.path.splitext(file_path)[1][1:].lower()
+    return f"{CATEGORY_DIRECTORIES.get(ext, 'Misc')}/{os.path.basename(file_path)}"
+
+
+def path_suggestions(file_path):
+    directory = os.path.dirname(destination_for(file_path))
+    return {"src_path": file_path, "suggestions": [directory, f"{directory}/Archive", "Inbox"]}
+
+
+def structured_answer(schema_name, user_text):
+    """Build a deterministic answer for the organizer's structured output schemas."""
+    try:
+        payload = json.loads(user_text)
+    except ValueError:
+        payload = {}
+    if schema_name == "PathSuggestions":
+        file_path = payload.get("file_path", "file") if isinstance(payload, dict) else "file"
+        return path_suggestions(file_path)
+    summaries = payload if isinstance(payload, list) else []
+    if schema_name == "BatchPathSuggestions":
+        return {"files": [
+            path_suggestions(summary["file_path"])
+            for summary in summaries if isinstance(summary, dict) and "file_path" in summary
+        ]}
+    return {"files": [
+        {"src_path": summary["file_path"], "dst_path": destination_for(summary["file_path"])}
+        for summary in summaries if isinstance(summary, dict) and "file_path" in summary
+    ]}
+
+
+def create_ollama_app(latency):
+    """Stub of the Ollama /api/chat endpoint."""
+    app = FastAPI()
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        prompt = " ".join(message_text(message) for message in messages)
+        has_image = any(message.get("images") for message in messages)
+        kind = "image" if has_image else "document"
+        content = f"Synthetic summary of a {kind} with {estimate_tokens(prompt)} prompt tokens."
+        await asyncio.sleep(latency.sample())
+        final = {
+            "model": body.get("model"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "prompt_eval_count": estimate_tokens(prompt),
+            "eval_count": estimate_tokens(content),
+        }
+        if not body.get("stream", True):
+            final["message"]["content"] = content
+            return JSONResponse(final)
+
+        async def stream():
+            chunk = dict(final, done=False, message={"role": "assistant", "content": content})
+            del chunk["prompt_eval_count"], chunk["eval_count"]
+            yield json.dumps(chunk) + "\n"
+            yield json.dumps(final) + "\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency.sample())
+        content = f"Synthetic completion for {estimate_tokens(body.get('prompt', ''))} prompt tokens."
+        return JSONResponse({"model": body.get("model"), "response": content, "done": True})
+
+    return app
+
+
+def create_groq_app(latency):
+    """Stub of the OpenAI-compatible Groq chat completions endpoint with tool calling."""
+    app = FastAPI()
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        user_text = next((message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+        prompt_tokens = sum(estimate_tokens(message_text(m)) for m in messages)
+        tools = body.get("tools") or []
+        schema_name = tools[0]["function"]["name"] if tools else None
+        answer = json.dumps(structured_answer(schema_name, user_text))
+        await asyncio.sleep(latency.sample())
+
+        if tools:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "type": "function",
+                    "function": {"name": schema_name, "arguments": answer},
+                }],
+            }
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": answer}
+            finish_reason = "stop"
+        completion_tokens = estimate_tokens(answer)
+        response = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        return JSONResponse(response)
+
+    return app
+
+
+class StubServer:
+    """Run a stub app with uvicorn on a background thread."""
+    def __init__(self, app, host="127.0.0.1", port=0):
+        self.config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout=10):
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Stub LLM server did not start in time")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
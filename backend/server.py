@@ -1,21 +1,31 @@
+import time
+BOOT_STARTED = time.perf_counter()
+
 import os
 import json
 import shutil
-import agentops
+import threading
+from functools import partial
+from itertools import chain
 from pathlib import Path
 from typing import Optional
 import asyncio
-import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from src.organizer import DirectoryOrganizer
+from src.ratelimit import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, QuotaLimiter
 from src.summarizer import FileSummarizer
 from src.watchdog import FileEventProducer
+from src.history import SuggestionHistory
+from src.pipeline import BatchContext, BatchPipeline
+from src.metrics import render_metrics, track
+from src.fileops import FileMover, MoveCancelled, MoveJobStore
+from src.workers import DistributedSummarizer
+from src.search import SummaryIndex
 import logging
-import time
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     level=logging.INFO,  # Set the desired level: DEBUG, INFO, WARNING, ERROR, CRITICAL
@@ -23,8 +33,29 @@ logging.basicConfig(
 )
 load_dotenv()
 
-# Initialize AgentOps
-agentops.init(default_tags=["llama-fs"], auto_start_session=False, api_key=os.getenv("AGENTOPS_API_KEY"))
+# AgentOps is initialized on first use instead of at import time to keep startup fast
+agentops_client = None
+agentops_lock = threading.Lock()
+
+
+def get_agentops():
+    """Import and initialize AgentOps on first use. Returns None when it is unavailable."""
+    global agentops_client
+    with agentops_lock:
+        if agentops_client is None:
+            try:
+                import agentops
+                agentops.init(default_tags=["llama-fs"], auto_start_session=False, api_key=os.getenv("AGENTOPS_API_KEY"))
+                agentops_client = agentops
+            except Exception as e:
+                logger.warning(f"AgentOps is unavailable: {e}")
+                agentops_client = False
+    return agentops_client or None
+
+
+def start_agentops_session(tags):
+    client = get_agentops()
+    return client.start_session(tags=tags) if client else None
 
 
 class Request(BaseModel):
@@ -37,10 +68,13 @@ class CommitRequest(BaseModel):
     base_path: str
     src_path: str  
     dst_path: str 
+    job_id: Optional[str] = None
 
 class CommitSuggestionRequest(BaseModel):
     src_path : str
     dst_path : str
+    summary : Optional[str] = None
+    job_id : Optional[str] = None
 class WatchRequest(BaseModel):
     watch_directory: str
     target_directory: str
@@ -58,10 +92,25 @@ def create_app():
         allow_headers=["*"],
     )
 
+    # Per-job traces are only written when a trace directory is configured
+    trace_dir = os.getenv("TRACE_DIR")
+
     # Initialize classes
+    history = SuggestionHistory(db_path=os.getenv("HISTORY_DB_PATH", "data/history.db"))
+
+    # Summaries of organized and watched files, searchable through /search
+    search_index = SummaryIndex(db_path=os.getenv("SEARCH_DB_PATH", "data/search.db"), logger=logger)
+
     organizer = DirectoryOrganizer(
         base_dir=None,  # Base directory will be set dynamically
-        model_name="llama-3.1-70b-versatile"
+        model_name="llama-3.1-70b-versatile",
+        history=history,
+        # Starting quota; replaced by the limits Groq reports with every response
+        limiter=QuotaLimiter(
+            requests_per_minute=float(os.getenv("GROQ_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)),
+            tokens_per_minute=float(os.getenv("GROQ_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE)),
+            logger=logger,
+        ),
     )
 
     summarizer = FileSummarizer(
@@ -75,47 +124,125 @@ def create_app():
         summarizer=summarizer,
         rabbitmq_url=os.getenv("RABBITMQ_URL"),
         queue_name="suggestion-notifications",
-        logger=logger
+        logger=logger,
+        history=history,
+        trace_dir=trace_dir,
+        search_index=search_index,
+    )
+
+    # Summarize batches on worker processes (python -m src.workers) instead of in this process
+    dispatcher = None
+    if os.getenv("DISTRIBUTED_SUMMARIZATION", "").lower() in ("1", "true", "yes"):
+        dispatcher = DistributedSummarizer(
+            rabbitmq_url=os.getenv("RABBITMQ_URL"),
+            summarizer=summarizer,
+            logger=logger,
+            task_timeout=float(os.getenv("WORKER_TASK_TIMEOUT", "600")),
+            queue_timeout=float(os.getenv("WORKER_QUEUE_TIMEOUT", "3600")),
+        )
+
+    pipeline = BatchPipeline(
+        summarizer, organizer, logger, trace_dir=trace_dir, dispatcher=dispatcher, search_index=search_index
+    )
+
+    # Move jobs live in the history database so every worker process can report or cancel them
+    mover = FileMover(
+        max_workers=int(os.getenv("IO_WORKERS", "4")),
+        logger=logger,
+        job_store=MoveJobStore(db_path=os.getenv("HISTORY_DB_PATH", "data/history.db")),
     )
 
+    async def move_resource(src, dst, job_id=None):
+        """Move src to dst off the event loop, mapping failures to HTTP errors."""
+        try:
+            with track("commit"):
+                job = await mover.move(src, dst, job_id=job_id)
+        except MoveCancelled:
+            raise HTTPException(status_code=409, detail="Move was cancelled")
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"An error occurred while moving the resource: {e}"
+            )
+        # Search results follow the file to its new location
+        try:
+            await asyncio.to_thread(search_index.move, src, job.dst)
+        except Exception as e:
+            logger.error(f"Failed to update the search index after moving {src}: {e}")
+
     @app.get("/")
     def health_check():
         return {"status": "ok"}
 
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/token-usage")
+    def token_usage():
+        return organizer.token_usage.snapshot()
+
     @app.post("/batch-organize")
     async def batch_organize(request: Request):
-        start_time = time.time()  # Start timer
-        session = agentops.start_session(tags=["LlamaFS"])
         path = request.path
 
-        if not os.path.exists(path):
+        if not path or not os.path.exists(path):
             raise HTTPException(status_code=404, detail="Path not found")
 
-        logger.info("Loading documents...")
-        summarizer.base_path = path
-        documents, unsupported_files = summarizer.load_documents()
-
-        logger.info(f"Summarizing {len(documents)} documents...")
-        summaries = await summarizer.summarize_documents(documents)
-
-        logger.info("Generating reorganization actions...")
-        organizer.base_dir = path
-        file_moves = organizer.get_reorganization_actions(summaries)
-
-        logger.info("Creating directory structure...")
-        tree = organizer.create_directory_structure(file_moves["files"], summaries, path, agentops=session)
+        session = await asyncio.to_thread(start_agentops_session, tags=["LlamaFS"])
+        context = BatchContext(path, session=session)
+        tree_chunks = await pipeline.run(context)
+        # The tree is serialized while it is sent instead of being built as one document first
+        return StreamingResponse(
+            chain(['{"status": "ok", "treeStructure": '], tree_chunks, [context.skipped_files_json() + "}"]),
+            media_type="application/json",
+        )
+
+    @app.post("/batch-organize/stream")
+    async def batch_organize_stream(request: Request):
+        """
+        /batch-organize as NDJSON: a {"type": "move"} line per file as soon as the organizer
+        has generated it, then a {"type": "tree"} line with the complete tree structure.
+        """
+        path = request.path
 
-        # Add summaries to the file moves
-        files = file_moves["files"]
-        for file in files:
-            file["summary"] = summaries[files.index(file)]["summary"]
+        if not path or not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="Path not found")
 
-        logger.info("Converting tree structure for response...")
-        response_data = organizer.convert_to_tree_with_details(files, base_path=path)
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        logger.info(f"Time taken for batch organization: {elapsed_time:.2f} seconds")
-        return {"status": "ok", "treeStructure": response_data}
+        session = await asyncio.to_thread(start_agentops_session, tags=["LlamaFS"])
+        return StreamingResponse(
+            pipeline.stream(BatchContext(path, session=session)),
+            media_type="application/x-ndjson",
+        )
+
+    @app.get("/search")
+    async def search(
+        q: str,
+        k: int = Query(10, ge=1, le=100),
+        category: Optional[str] = None,
+        modified_after: Optional[str] = None,
+        modified_before: Optional[str] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        path: Optional[str] = None,
+    ):
+        """
+        Semantic search over the summaries of organized and watched files. Dates are ISO
+        dates or unix timestamps of the last modification, sizes are in bytes.
+        """
+        try:
+            with track("search"):
+                results = await asyncio.to_thread(
+                    search_index.search, q, k=k, category=category,
+                    modified_after=modified_after, modified_before=modified_before,
+                    min_size=min_size, max_size=max_size, path_prefix=path,
+                )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+            raise HTTPException(status_code=503, detail="Search is unavailable")
+        return {"query": q, "results": results}
 
     @app.post("/commit")
     async def commit(request: CommitRequest):
@@ -136,19 +263,10 @@ def create_app():
 
         # Ensure the destination directory exists
         dst_directory = os.path.dirname(dst)
-        os.makedirs(dst_directory, exist_ok=True)
+        await mover.run(partial(os.makedirs, dst_directory, exist_ok=True))
 
-        try:
-            # If src is a file and dst is a directory, move the file into dst with the original filename.
-            if os.path.isfile(src) and os.path.isdir(dst):
-                shutil.move(src, os.path.join(dst, os.path.basename(src)))
-            else:
-                shutil.move(src, dst)
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"An error occurred while moving the resource: {e}"
-            )
+        # If dst is a directory, the resource is moved into it with its original name.
+        await move_resource(src, dst, request.job_id)
 
         return {"message": "Commit successful"}
 
@@ -177,22 +295,32 @@ def create_app():
             )
 
         # Ensure the destination directory exists
-        os.makedirs(dst, exist_ok=True)
+        await mover.run(partial(os.makedirs, dst, exist_ok=True))
 
+        # If dst is a directory, the resource is moved into it with its original name.
+        await move_resource(src, dst, request.job_id)
+
+        # Learn from the accepted suggestion so similar files can be answered from history
         try:
-            # If src is a file and dst is a directory, move the file into dst with the original filename.
-            if os.path.isfile(src) and os.path.isdir(dst):
-                shutil.move(src, os.path.join(dst, os.path.basename(src)))
-            else:
-                shutil.move(src, dst)
+            await asyncio.to_thread(history.record, src, dst, summary=request.summary)
         except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"An error occurred while moving the resource: {e}"
-            )
+            logger.error(f"Failed to record committed suggestion: {e}")
 
         return {"message": "Commit successful"}
     
+    @app.get("/commit-progress/{job_id}")
+    def commit_progress(job_id: str):
+        state = mover.job_state(job_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Commit job not found")
+        return state
+
+    @app.post("/commit-cancel/{job_id}")
+    def commit_cancel(job_id: str):
+        if not mover.cancel(job_id):
+            raise HTTPException(status_code=404, detail="Commit job not found")
+        return {"status": "Cancellation requested", "jobId": job_id}
+
     @app.post("/start-producer")
     async def start_producer(request: WatchRequest):
         """
@@ -218,16 +346,36 @@ def create_app():
             await producer.connection.close()
             raise HTTPException(status_code=500, detail=f"Failed to start producer: {str(e)}")
 
+    def warm_up():
+        """Load extractors and LLM clients in the background so the first request does not pay for them."""
+        start_time = time.perf_counter()
+        try:
+            organizer.warm_up()
+            summarizer.warm_up()
+            get_agentops()
+            logger.info(f"Warm-up finished in {time.perf_counter() - start_time:.2f} seconds")
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+
     @app.on_event("startup")
     async def startup_event():
         producer.initialize_event_loop_thread()
         await producer.connect_to_rabbitmq()
+        if os.getenv("WARMUP", "").lower() in ("1", "true", "yes"):
+            threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+        logger.info(f"Backend started in {time.perf_counter() - BOOT_STARTED:.3f} seconds")
 
     @app.on_event("shutdown")
     async def shutdown_event():
         producer.stop_event_loop()
         if producer.connection:
             await producer.connection.close()
+        history.close()
+        search_index.close()
+        mover.shutdown()
+        mover.job_store.close()
+        if dispatcher:
+            await dispatcher.close()
 
     @app.post("/stop-producer")
     async def stop_producer():
@@ -244,5 +392,12 @@ def create_app():
 
 
 if __name__ == "__main__":
-    app = create_app()
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import uvicorn
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        # Each worker process builds its own app; batch requests are request-scoped and the
+        # suggestion history is shared through its SQLite database.
+        uvicorn.run("server:create_app", factory=True, host="0.0.0.0", port=8000, workers=workers)
+    else:
+        app = create_app()
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,285 @@
+import bz2
+import gzip
+import lzma
+import os
+import struct
+import tarfile
+import zlib
+from collections import Counter
+
+try:
+    import py7zr
+except ImportError:  # 7z support is optional, 7z archives are then left unsupported
+    py7zr = None
+
+# Only the first member names are kept; counts and sizes cover every member
+MAX_LISTED_NAMES = 40
+# Distinct extensions and top-level entries counted, so the counters stay bounded
+MAX_COUNTED_KEYS = 1000
+MAX_SAMPLES = 3
+MAX_SAMPLE_BYTES = 16 * 1024
+READ_CHUNK_BYTES = 64 * 1024
+
+ZIP_EOCD = struct.Struct("<4s4H2LH")
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+ZIP_CENTRAL_ENTRY = struct.Struct("<4s6H3L5H2L")
+ZIP_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+ZIP_MAX_COMMENT = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+SINGLE_FILE_COMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+ARCHIVE_EXTENSIONS = {"zip", "tar", "tgz", "gz", "tbz2", "bz2", "txz", "xz"} | ({"7z"} if py7zr else set())
+
+
+class ArchiveListing:
+    """Aggregated view of an archive's members, built in one pass without extracting to disk."""
+    def __init__(self, archive_format):
+        self.format = archive_format
+        self.members = 0
+        self.total_size = 0
+        self.extensions = Counter()
+        self.top_level = Counter()
+        self.names = []
+        self.samples = []
+
+    def add(self, name, size, is_dir=False):
+        name = member_name(name)
+        if is_dir or not name:
+            return
+        self.members += 1
+        self.total_size += size or 0
+        count(self.extensions, os.path.splitext(name)[1][1:].lower() or "(none)")
+        top, _, rest = name.partition("/")
+        if rest:
+            count(self.top_level, top + "/")
+        if len(self.names) < MAX_LISTED_NAMES:
+            self.names.append(name)
+
+
+def member_name(name):
+    return name[2:] if name.startswith("./") else name.lstrip("/")
+
+
+def count(counter, key):
+    if key in counter or len(counter) < MAX_COUNTED_KEYS:
+        counter[key] += 1
+
+
+def wants_sample(listing, name, sample_extensions):
+    return (
+        len(listing.samples) < MAX_SAMPLES
+        and os.path.splitext(name)[1][1:].lower() in sample_extensions
+    )
+
+
+def trim_sample(data, max_bytes=MAX_SAMPLE_BYTES):
+    """Cut a bounded read back to the last complete line."""
+    if len(data) < max_bytes:
+        return data
+    data = data[:max_bytes]
+    newline = data.rfind(b"\n")
+    return data[:newline + 1] if newline > 0 else data
+
+
+def zip_central_directory(f):
+    """Yield (name, size, compressed_size, is_dir, method, flags, local_offset) for every member of a zip file."""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    tail_size = min(file_size, ZIP_EOCD.size + ZIP_MAX_COMMENT)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    position = tail.rfind(b"PK\x05\x06")
+    if position < 0:
+        raise ValueError("Not a zip file")
+    eocd_offset = file_size - tail_size + position
+    _, _, _, _, entries, cd_size, cd_offset, _ = ZIP_EOCD.unpack(tail[position:position + ZIP_EOCD.size])
+    # Data prepended to the archive (e.g. self-extracting stubs) shifts every offset
+    shift = eocd_offset - cd_size - cd_offset
+
+    if cd_offset == ZIP64_MARKER or entries == 0xFFFF:
+        f.seek(eocd_offset - ZIP64_LOCATOR.size)
+        signature, _, eocd64_offset, _ = ZIP64_LOCATOR.unpack(f.read(ZIP64_LOCATOR.size))
+        if signature == b"PK\x06\x07":
+            f.seek(eocd64_offset)
+            record = ZIP64_EOCD.unpack(f.read(ZIP64_EOCD.size))
+            entries, cd_size, cd_offset = record[7], record[8], record[9]
+            shift = 0
+
+    f.seek(cd_offset + shift)
+    for _ in range(entries):
+        header = f.read(ZIP_CENTRAL_ENTRY.size)
+        if len(header) < ZIP_CENTRAL_ENTRY.size or header[:4] != b"PK\x01\x02":
+            break
+        (_, _, _, flags, method, _, _, _, compressed, size,
+         name_length, extra_length, comment_length, _, _, _, local_offset) = ZIP_CENTRAL_ENTRY.unpack(header)
+        raw_name = f.read(name_length)
+        extra = f.read(extra_length)
+        f.seek(comment_length, os.SEEK_CUR)
+        if ZIP64_MARKER in (size, compressed, local_offset):
+            size, compressed, local_offset = zip64_extra(extra, size, compressed, local_offset)
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437", errors="replace")
+        yield name, size, compressed, name.endswith("/"), method, flags, local_offset + shift
+
+
+def zip64_extra(extra, size, compressed, local_offset):
+    """Read the 64-bit sizes and offset stored in the zip64 extra field."""
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack("<HH", extra[position:position + 4])
+        if header_id == 0x0001:
+            values = iter(struct.unpack(f"<{length // 8}Q", extra[position + 4:position + 4 + length - length % 8]))
+            if size == ZIP64_MARKER:
+                size = next(values, size)
+            if compressed == ZIP64_MARKER:
+                compressed = next(values, compressed)
+            if local_offset == ZIP64_MARKER:
+                local_offset = next(values, local_offset)
+            break
+        position += 4 + length
+    return size, compressed, local_offset
+
+
+def read_zip_member(f, local_offset, compressed, method, flags, max_bytes=MAX_SAMPLE_BYTES):
+    """Decompress at most max_bytes of a zip member, or return None when it cannot be read."""
+    if flags & 0x1:  # Encrypted
+        return None
+    if method == 0:
+        decompressor = None
+    elif method == 8:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    elif method == 12:
+        decompressor = bz2.BZ2Decompressor()
+    else:
+        return None
+    f.seek(local_offset)
+    header = f.read(ZIP_LOCAL_HEADER.size)
+    if len(header) < ZIP_LOCAL_HEADER.size or header[:4] != b"PK\x03\x04":
+        return None
+    name_length, extra_length = ZIP_LOCAL_HEADER.unpack(header)[-2:]
+    f.seek(name_length + extra_length, os.SEEK_CUR)
+
+    data = b""
+    remaining = compressed
+    while remaining > 0 and len(data) < max_bytes:
+        chunk = f.read(min(READ_CHUNK_BYTES, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        data += chunk if decompressor is None else decompressor.decompress(chunk, max_bytes - len(data))
+    return trim_sample(data, max_bytes)
+
+
+def inspect_zip(path, sample_extensions):
+    listing = ArchiveListing("zip")
+    candidates = []
+    with open(path, "rb") as f:
+        for name, size, compressed, is_dir, method, flags, offset in zip_central_directory(f):
+            listing.add(name, size, is_dir)
+            if not is_dir and len(candidates) < 50 and wants_sample(listing, name, sample_extensions):
+                candidates.append((name, compressed, method, flags, offset))
+        # README-like files describe the archive best
+        candidates.sort(key=lambda candidate: "readme" not in candidate[0].lower())
+        for name, compressed, method, flags, offset in candidates[:MAX_SAMPLES]:
+            data = read_zip_member(f, offset, compressed, method, flags)
+            if data:
+                listing.samples.append((name, data))
+    return listing
+
+
+def inspect_tar(path, sample_extensions):
+    listing = ArchiveListing("tar")
+    # Stream mode reads headers sequentially and never seeks, whatever the compression
+    with tarfile.open(path, mode="r|*") as tar:
+        for member in tar_members(tar, listing):
+            listing.add(member.name, member.size, is_dir=not member.isfile())
+            if member.isfile() and wants_sample(listing, member.name, sample_extensions):
+                data = tar.extractfile(member).read(MAX_SAMPLE_BYTES)
+                if data:
+                    listing.samples.append((member_name(member.name), trim_sample(data)))
+            # TarFile keeps every member it has seen; drop them to keep memory flat
+            tar.members = []
+    return listing
+
+
+def tar_members(tar, listing):
+    """Iterate a streamed tarball; an error after the first member means it is truncated or damaged."""
+    members = iter(tar)
+    while True:
+        try:
+            member = next(members)
+        except StopIteration:
+            return
+        except (tarfile.TarError, EOFError, OSError, zlib.error, lzma.LZMAError) as e:
+            if listing.members:
+                raise ValueError(f"Damaged tar archive after {listing.members} files: {e}") from e
+            raise tarfile.ReadError(str(e)) from e
+        yield member
+
+
+def inspect_7z(path, sample_extensions):
+    """List a 7z archive. Members are not sampled, solid 7z blocks cannot be read partially."""
+    listing = ArchiveListing("7z")
+    with py7zr.SevenZipFile(path, mode="r") as archive:
+        for info in archive.list():
+            listing.add(info.filename, info.uncompressed, is_dir=info.is_directory)
+    return listing
+
+
+def inspect_compressed_file(path, sample_extensions):
+    """A single gzip/bzip2/xz-compressed file that is not a tarball."""
+    stem, suffix = os.path.splitext(os.path.basename(path))
+    listing = ArchiveListing(suffix[1:])
+    with SINGLE_FILE_COMPRESSORS[suffix.lower()](path, "rb") as f:
+        data = f.read(MAX_SAMPLE_BYTES)
+    listing.add(stem, None)
+    if data and wants_sample(listing, stem, sample_extensions):
+        listing.samples.append((stem, trim_sample(data)))
+    return listing
+
+
+def inspect_archive(path, sample_extensions=()):
+    """
+    List an archive without extracting it and read up to MAX_SAMPLES members whose
+    extension is in sample_extensions, each bounded to MAX_SAMPLE_BYTES.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".7z":
+        if py7zr is None:
+            raise ValueError("py7zr is required to read 7z archives")
+        return inspect_7z(path, sample_extensions)
+    if suffix == ".zip":
+        return inspect_zip(path, sample_extensions)
+    try:
+        return inspect_tar(path, sample_extensions)
+    except tarfile.ReadError:
+        # A damaged tarball must not be mistaken for a single compressed file named "tar"
+        is_tarball = os.path.splitext(os.path.splitext(path)[0])[1].lower() == ".tar"
+        if suffix in SINGLE_FILE_COMPRESSORS and not is_tarball:
+            return inspect_compressed_file(path, sample_extensions)
+        raise
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def render_archive_listing(listing, archive_name, samples):
+    """Render a listing and extracted samples [(member_name, text)] as summarization input."""
+    lines = [
+        f'{listing.format} archive "{archive_name}": {listing.members} files, '
+        f"{format_size(listing.total_size)} uncompressed"
+    ]
+    if listing.extensions:
+        lines.append("File types: " + ", ".join(f"{ext} x{n}" for ext, n in listing.extensions.most_common(10)))
+    if listing.top_level:
+        lines.append("Top-level folders: " + ", ".join(name for name, _ in listing.top_level.most_common(10)))
+    if listing.names:
+        more = listing.members - len(listing.names)
+        lines.append("Files:" + "".join(f"\n {name}" for name in listing.names) + (f"\n ... {more} more" if more > 0 else ""))
+    for name, text in samples:
+        lines.append(f"Content of {name}:\n{text}")
+    return "\n".join(lines)
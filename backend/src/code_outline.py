@@ -0,0 +1,237 @@
+import ast
+import os
+import re
+
+from src.compaction import truncate_to_tokens
+
+# Sources shorter than this are sent as-is, an outline would not save anything
+MIN_OUTLINE_CHARS = 2000
+MAX_OUTLINE_LINES = 150
+MAX_DOCSTRING_CHARS = 300
+# Sources no outline can be built for (minified bundles, unparsable files) are cut to this
+MAX_UNOUTLINED_TOKENS = 1500
+
+LANGUAGES = {
+    "py": "python",
+    "c": "c", "h": "c", "cpp": "cpp", "hpp": "cpp",
+    "java": "java",
+    "go": "go",
+    "js": "javascript", "ts": "typescript",
+    "sql": "sql",
+    "html": "html",
+    "css": "css",
+}
+
+# Block comments, line comments and string literals of C-like languages. Matched text is
+# blanked out before signatures are searched so that code in comments or strings is ignored.
+C_LIKE_NOISE = re.compile(
+    r'/\*.*?\*/|//[^\n]*|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`',
+    re.DOTALL,
+)
+LEADING_COMMENT = re.compile(r"\A\s*(/\*.*?\*/|(?://[^\n]*\n\s*)+)", re.DOTALL)
+# Control statements look like function definitions to the signature patterns
+CONTROL_KEYWORDS = {"if", "else", "for", "while", "switch", "catch", "return", "do", "new", "sizeof"}
+
+# Signatures are matched within a line ([ \t] rather than \s) so a pattern cannot run on
+# across the lines of long enums, initializers or field lists and backtrack over them.
+C_LIKE_PATTERNS = {
+    "c": [
+        ("include", re.compile(r"^[ \t]*#[ \t]*include[ \t]*[<\"]([^>\"\n]+)[>\"]", re.M)),
+        ("type", re.compile(r"^[ \t]*(?:typedef[ \t]+)?(struct|union|enum)[ \t]+(\w+)\s*\{", re.M)),
+        ("function", re.compile(r"^[ \t]*((?:\w+[ \t\*]+)+\w+[ \t]*\([^;{)]*\))[ \t\n]*\{", re.M)),
+    ],
+    "cpp": [
+        ("include", re.compile(r"^[ \t]*#[ \t]*include[ \t]*[<\"]([^>\"\n]+)[>\"]", re.M)),
+        ("type", re.compile(r"^[ \t]*(?:template[ \t]*<[^>\n]*>\s*)?(class|struct|namespace|enum(?:[ \t]+class)?)[ \t]+(\w+)[^;{\n]*\{", re.M)),
+        ("function", re.compile(r"^[ \t]*((?:[\w:<>,~]+[ \t\*&]+)*[\w:~]+[ \t]*\([^;{)]*\)(?:[ \t]*const)?)[ \t\n]*\{", re.M)),
+    ],
+    "java": [
+        ("import", re.compile(r"^[ \t]*(?:package|import)[ \t]+([\w.*]+)[ \t]*;", re.M)),
+        ("type", re.compile(r"^[ \t]*((?:(?:public|protected|private|abstract|final|static|sealed)[ \t]+)*(class|interface|enum|record)[ \t]+\w+[^{;\n]*)\{", re.M)),
+        ("function", re.compile(r"^[ \t]*((?:[\w<>\[\].?@]+(?:[ \t]*,[ \t]*[\w<>\[\].?]+)*[ \t]+)+\w+[ \t]*\([^;{)]*\)(?:\s*throws[ \t]+[\w.]+(?:[ \t]*,[ \t]*[\w.]+)*)?)\s*\{", re.M)),
+    ],
+    "go": [
+        ("import", re.compile(r'^[ \t]*(?:import[ \t]+)?(?:\w+[ \t]+)?"([\w./-]+)"[ \t]*$', re.M)),
+        ("type", re.compile(r"^[ \t]*type[ \t]+(\w+[ \t]+(?:struct|interface))[ \t]*\{", re.M)),
+        ("function", re.compile(r"^[ \t]*(func[ \t]+(?:\([^)]*\)[ \t]*)?\w+[ \t]*\([^)]*\)[^{\n]*)\{", re.M)),
+    ],
+    "javascript": [
+        ("import", re.compile(r"^[ \t]*import[ \t]+(?:[^\n]+?[ \t]+from[ \t]+)?[\"']([^\"'\n]+)[\"']|require\([ \t]*[\"']([^\"'\n]+)[\"'][ \t]*\)", re.M)),
+        ("type", re.compile(r"^[ \t]*((?:export[ \t]+)?(?:default[ \t]+)?class[ \t]+\w+(?:[ \t]+extends[ \t]+[\w.]+)?)", re.M)),
+        ("function", re.compile(r"^[ \t]*((?:export[ \t]+)?(?:default[ \t]+)?(?:async[ \t]+)?function[ \t]*\*?[ \t]*\w+[ \t]*\([^)]*\)|(?:export[ \t]+)?(?:const|let|var)[ \t]+\w+[ \t]*=[ \t]*(?:async[ \t]+)?(?:\([^)]*\)|\w+)[ \t]*=>)", re.M)),
+    ],
+}
+C_LIKE_PATTERNS["typescript"] = C_LIKE_PATTERNS["javascript"] + [
+    ("type", re.compile(r"^[ \t]*((?:export[ \t]+)?(?:interface|type|enum)[ \t]+\w+)", re.M)),
+]
+
+
+def first_lines(text, max_chars=MAX_DOCSTRING_CHARS):
+    text = " ".join(line.strip() for line in text.strip().splitlines() if line.strip())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+
+def blank_out(match):
+    """Replace matched text with spaces, keeping newlines so line structure is preserved."""
+    return re.sub(r"[^\n]", " ", match.group(0))
+
+
+def outline_python(source):
+    """Outline a Python module: docstring, imports and class/function signatures."""
+    tree = ast.parse(source)
+    lines = []
+    docstring = ast.get_docstring(tree)
+    if docstring:
+        lines.append(f'"""{first_lines(docstring)}"""')
+
+    imports = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append(f"{'.' * node.level}{node.module or ''}")
+    if imports:
+        lines.append("imports: " + ", ".join(dict.fromkeys(imports)))
+
+    def signature(node, indent):
+        prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+        entry = f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+        doc = ast.get_docstring(node)
+        return entry + (f"  # {first_lines(doc, 120)}" if doc else "")
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            lines.append(signature(node, ""))
+        elif isinstance(node, ast.ClassDef):
+            bases = ", ".join(ast.unparse(base) for base in node.bases)
+            doc = ast.get_docstring(node)
+            lines.append(f"class {node.name}({bases})" + (f"  # {first_lines(doc, 120)}" if doc else ""))
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    lines.append(signature(child, "    "))
+        elif isinstance(node, ast.If) and "__main__" in ast.unparse(node.test):
+            lines.append("if __name__ == '__main__': ...")
+    return lines
+
+
+def outline_c_like(source, language):
+    """Outline a C-like source with lightweight patterns for imports, types and functions."""
+    lines = []
+    leading = LEADING_COMMENT.match(source)
+    if leading:
+        comment = re.sub(r"^\s*(/\*+|\*+/?|//)|\*+/\s*$", "", leading.group(1), flags=re.M)
+        if comment.strip():
+            lines.append(f"/* {first_lines(comment)} */")
+
+    code = C_LIKE_NOISE.sub(blank_out, source)
+    imports = []
+    for kind, pattern in C_LIKE_PATTERNS[language]:
+        # Imports are matched on the original source because they live inside string literals
+        target = source if kind in ("include", "import") else code
+        for match in pattern.finditer(target):
+            if kind in ("include", "import"):
+                imports.append(next(group for group in match.groups() if group))
+            elif kind == "type" and match.lastindex and match.lastindex >= 2 and language in ("c", "cpp"):
+                lines.append(f"{match.group(1)} {match.group(2)}")
+            elif re.split(r"[\s(]", match.group(1).strip())[0] not in CONTROL_KEYWORDS:
+                lines.append(" ".join(match.group(1).split()))
+    if imports:
+        lines.insert(1 if leading else 0, "imports: " + ", ".join(dict.fromkeys(imports)))
+    return lines
+
+
+def outline_sql(source):
+    code = C_LIKE_NOISE.sub(blank_out, re.sub(r"--[^\n]*", "", source))
+    lines = [
+        " ".join(match.group(0).split())
+        for match in re.finditer(
+            r"\b(?:CREATE|ALTER|DROP)\s+(?:OR\s+REPLACE\s+)?(?:TEMP(?:ORARY)?\s+)?"
+            r"(?:TABLE|VIEW|INDEX|FUNCTION|PROCEDURE|TRIGGER|SCHEMA)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?[\w.\"`]+",
+            code, re.I,
+        )
+    ]
+    counts = {}
+    for match in re.finditer(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH|MERGE)\b", code, re.I | re.M):
+        keyword = match.group(1).upper()
+        counts[keyword] = counts.get(keyword, 0) + 1
+    if counts:
+        lines.append("statements: " + ", ".join(f"{k} x{v}" for k, v in counts.items()))
+    return lines
+
+
+def outline_html(source):
+    lines = []
+    title = re.search(r"<title[^>]*>(.*?)</title>", source, re.I | re.S)
+    if title:
+        lines.append(f"title: {first_lines(title.group(1), 120)}")
+    for level, text in re.findall(r"<h([1-3])[^>]*>(.*?)</h\1>", source, re.I | re.S):
+        heading = first_lines(re.sub(r"<[^>]+>", "", text), 120)
+        if heading:
+            lines.append(f"{'  ' * (int(level) - 1)}h{level}: {heading}")
+    resources = re.findall(r"<(?:script|link)[^>]+(?:src|href)=[\"']([^\"']+)[\"']", source, re.I)
+    if resources:
+        lines.append("resources: " + ", ".join(dict.fromkeys(resources)))
+    forms = len(re.findall(r"<form\b", source, re.I))
+    if forms:
+        lines.append(f"forms: {forms}")
+    return lines
+
+
+def outline_css(source):
+    code = C_LIKE_NOISE.sub(blank_out, source)
+    lines = [f"@import {m}" for m in re.findall(r"@import\s+([^;]+);", source)]
+    lines += [" ".join(m.split()) for m in re.findall(r"(@media[^{]+)\{", code)]
+    selectors = [" ".join(m.split()) for m in re.findall(r"([^{};]+)\{", code) if not m.strip().startswith("@")]
+    if selectors:
+        lines.append("selectors: " + ", ".join(dict.fromkeys(selectors)))
+    return lines
+
+
+def outline_source(source, language):
+    """Return outline lines for source in language, or None when no outline can be built."""
+    if language == "python":
+        try:
+            return outline_python(source)
+        except (SyntaxError, ValueError):
+            # Python 2 or truncated files: fall back to matching def/class lines
+            return [m.group(0).strip() for m in re.finditer(r"^\s*(?:class|def|async def)\s+\w+[^\n]*:", source, re.M)]
+    if language in C_LIKE_PATTERNS:
+        return outline_c_like(source, language)
+    if language == "sql":
+        return outline_sql(source)
+    if language == "html":
+        return outline_html(source)
+    if language == "css":
+        return outline_css(source)
+    return None
+
+
+def build_code_outline(file_path):
+    """
+    Read a source file and return a compact outline of its structure for summarization.
+    Short files are returned unchanged; files no outline can be built for are cut to
+    their first MAX_UNOUTLINED_TOKENS tokens.
+    """
+    with open(file_path, "r", errors="replace") as file:
+        source = file.read()
+    return outline_code(source, os.path.basename(file_path))
+
+
+def outline_code(source, file_name):
+    """Outline source code read from file_name; short sources are returned unchanged."""
+    if len(source) < MIN_OUTLINE_CHARS:
+        return source
+
+    language = LANGUAGES.get(os.path.splitext(file_name)[1][1:].lower())
+    lines = outline_source(source, language) if language else None
+    total_lines = source.count("\n") + 1
+    if not lines:
+        excerpt = truncate_to_tokens(source, MAX_UNOUTLINED_TOKENS)
+        if excerpt == source:
+            return source
+        return f"Beginning of {file_name} ({total_lines} lines, {len(source)} characters):\n{excerpt}"
+    if len(lines) > MAX_OUTLINE_LINES:
+        lines = lines[:MAX_OUTLINE_LINES] + [f"... {len(lines) - MAX_OUTLINE_LINES} more definitions"]
+    header = f"{language} source outline of {file_name} ({total_lines} lines)"
+    return "\n".join([header] + lines)
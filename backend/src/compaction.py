@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+
+from src.metrics import record_tokens
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken is optional, fall back to a character heuristic
+    _ENCODING = None
+
+# Average characters per token used when no tokenizer is available.
+CHARS_PER_TOKEN = 4
+
+
+def count_tokens(text):
+    """Count the tokens in text with tiktoken, or estimate them when it is not installed."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Truncate text to at most max_tokens, cutting at a word boundary where possible."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        truncated = _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:max_tokens])
+    else:
+        truncated = text[: max_tokens * CHARS_PER_TOKEN]
+    cut = truncated.rfind(" ")
+    if cut > len(truncated) // 2:
+        truncated = truncated[:cut]
+    return truncated.rstrip() + "…"
+
+
+def build_directory_trie(directories, base_dir):
+    """Build a nested dict trie of directory paths relative to base_dir."""
+    trie = {}
+    for directory in directories:
+        rel_path = os.path.relpath(directory, base_dir)
+        if rel_path == "." or rel_path.startswith(".."):
+            continue
+        node = trie
+        for part in rel_path.split(os.sep):
+            node = node.setdefault(part, {})
+    return trie
+
+
+def render_directory_trie(trie, depth=0):
+    """
+    Render a directory trie as an indented listing. Shared prefixes are printed once and
+    chains of single-child directories are collapsed onto one line.
+    """
+    lines = []
+    for name in sorted(trie):
+        node = trie[name]
+        label = name
+        while len(node) == 1:
+            child = next(iter(node))
+            label = f"{label}/{child}"
+            node = node[child]
+        lines.append(f"{' ' * depth}{label}/")
+        lines.extend(render_directory_trie(node, depth + 1))
+    return lines
+
+
+def compact_directory_listing(directories, base_dir, max_tokens=None):
+    """
+    Return a trie-compressed listing of directories relative to base_dir, cutting the
+    deepest levels first when the listing does not fit into max_tokens.
+    """
+    rel_parts = [os.path.relpath(d, base_dir).split(os.sep) for d in directories]
+    listing = "\n".join(render_directory_trie(build_directory_trie(directories, base_dir)))
+    max_depth = max((len(parts) for parts in rel_parts), default=0)
+    while max_tokens and count_tokens(listing) > max_tokens and max_depth > 1:
+        max_depth -= 1
+        shallow = {os.path.join(base_dir, *parts[:max_depth]) for parts in rel_parts}
+        listing = "\n".join(render_directory_trie(build_directory_trie(shallow, base_dir)))
+    return listing
+
+
+def compact_summaries(summaries, max_tokens, min_tokens_per_file=24):
+    """
+    Fit file summaries into a token budget. Summaries that already fit are left whole;
+    otherwise the budget is shared evenly between files and whatever short summaries do
+    not use is handed on to the longer ones.
+    """
+    compacted = [dict(summary) for summary in summaries]
+    if not compacted:
+        return compacted
+    # Account for the file path and JSON punctuation of every entry
+    overhead = sum(count_tokens(s["file_path"]) + 8 for s in compacted)
+    if overhead + sum(count_tokens(s["summary"]) for s in compacted) <= max_tokens:
+        return compacted
+    remaining = max(max_tokens - overhead, min_tokens_per_file * len(compacted))
+    by_length = sorted(range(len(compacted)), key=lambda i: count_tokens(compacted[i]["summary"]))
+    for position, i in enumerate(by_length):
+        share = max(remaining // (len(by_length) - position), min_tokens_per_file)
+        summary = truncate_to_tokens(compacted[i]["summary"], share)
+        compacted[i]["summary"] = summary
+        remaining -= count_tokens(summary)
+    return compacted
+
+
+def dumps_compact(data):
+    """Serialize data to JSON without indentation or padding whitespace."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class TokenUsage:
+    """Per-call token accounting for organizer prompts."""
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.calls = []
+        self.totals = {"calls": 0, "estimated_prompt_tokens": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def record(self, call, estimated_prompt_tokens, raw_message=None):
+        """Record a call's estimated prompt size and, when available, the provider-reported usage."""
+        prompt_tokens, completion_tokens = self.usage_from_message(raw_message)
+        entry = {
+            "call": call,
+            "estimated_prompt_tokens": estimated_prompt_tokens,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+        with self.lock:
+            self.calls.append(entry)
+            del self.calls[:-100]
+            self.totals["calls"] += 1
+            self.totals["estimated_prompt_tokens"] += estimated_prompt_tokens
+            self.totals["prompt_tokens"] += prompt_tokens or 0
+            self.totals["completion_tokens"] += completion_tokens or 0
+        record_tokens(call, prompt_tokens or estimated_prompt_tokens, completion_tokens)
+        if self.logger:
+            self.logger.info(
+                f"{call}: ~{estimated_prompt_tokens} prompt tokens estimated, "
+                f"{prompt_tokens} prompt / {completion_tokens} completion tokens reported"
+            )
+        return entry
+
+    @staticmethod
+    def usage_from_message(message):
+        """Extract (prompt_tokens, completion_tokens) from a LangChain AIMessage, if reported."""
+        if message is None:
+            return None, None
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            return usage.get("input_tokens"), usage.get("output_tokens")
+        metadata = getattr(message, "response_metadata", None) or {}
+        if "prompt_eval_count" in metadata or "eval_count" in metadata:
+            # Ollama reports usage as evaluation counts
+            return metadata.get("prompt_eval_count"), metadata.get("eval_count")
+        token_usage = metadata.get("token_usage") or {}
+        return token_usage.get("prompt_tokens"), token_usage.get("completion_tokens")
+
+    def snapshot(self):
+        with self.lock:
+            return {"totals": dict(self.totals), "recent": list(self.calls)}
@@ -0,0 +1,215 @@
+import hashlib
+import os
+import re
+from collections import defaultdict
+
+from src.records import MovePlan
+
+try:
+    from PIL import Image, ImageChops, ImageStat
+except ImportError:  # Pillow is optional, images are then only matched byte-for-byte
+    Image = None
+
+PARTIAL_HASH_BYTES = 64 * 1024
+FULL_HASH_CHUNK_BYTES = 1024 * 1024
+# Maximum number of differing bits between two 64-bit perceptual hashes of the same picture.
+# A close hash only makes two images candidates; their thumbnails must then match as well.
+PHASH_MAX_DISTANCE = 4
+# Candidates are compared as THUMBNAIL_SIZE x THUMBNAIL_SIZE RGB thumbnails. Re-encoding (e.g.
+# JPEG quality 95 -> 50) stays well below these differences, while an edited line of text
+# or a small changed region of a screenshot exceeds the maximum.
+THUMBNAIL_SIZE = 32
+MAX_THUMBNAIL_RMS = 2.0
+MAX_THUMBNAIL_DIFFERENCE = 8
+
+# Matches copy markers such as "report (1).pdf", "report copy.pdf" or "report-copy 2.pdf"
+COPY_SUFFIX_PATTERN = re.compile(r"(\s*\(\d+\)|[\s_-]+copy(\s*\d+)?)$", re.IGNORECASE)
+
+
+def partial_hash(path):
+    """Hash the first and last block of a file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        size = os.fstat(f.fileno()).st_size
+        if size > 2 * PARTIAL_HASH_BYTES:
+            f.seek(-PARTIAL_HASH_BYTES, os.SEEK_END)
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """Hash the whole file in chunks."""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(FULL_HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(path):
+    """Compute a 64-bit difference hash (dHash) of an image, or None when it cannot be decoded."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            pixels = list(image.convert("L").resize((9, 8)).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def thumbnail(path):
+    """Return an image's dimensions and a small RGB thumbnail of it, or None when it cannot be decoded."""
+    try:
+        with Image.open(path) as image:
+            return image.size, image.convert("RGB").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.BOX)
+    except Exception:
+        return None
+
+
+def same_picture(first, second):
+    """Whether two thumbnails show the same picture, allowing for lossy re-encoding."""
+    (first_size, first_thumbnail), (second_size, second_thumbnail) = first, second
+    if first_size != second_size:
+        return False
+    difference = ImageChops.difference(first_thumbnail, second_thumbnail)
+    if max(high for _, high in difference.getextrema()) > MAX_THUMBNAIL_DIFFERENCE:
+        return False
+    rms = (sum(band ** 2 for band in ImageStat.Stat(difference).rms) / 3) ** 0.5
+    return rms <= MAX_THUMBNAIL_RMS
+
+
+def canonical_sort_key(file_name):
+    """Prefer names without copy markers, then shorter names, as the group representative."""
+    stem = os.path.splitext(file_name)[0]
+    return (bool(COPY_SUFFIX_PATTERN.search(stem)), len(file_name), file_name)
+
+
+def group_exact_duplicates(base_path, file_names):
+    """
+    Group byte-identical files. Files are bucketed by size first, then by a partial hash,
+    and only the remaining candidates are fully hashed.
+    """
+    by_size = defaultdict(list)
+    for fname in file_names:
+        try:
+            by_size[os.path.getsize(os.path.join(base_path, fname))].append(fname)
+        except OSError:
+            continue
+
+    groups = []
+    for size, same_size in by_size.items():
+        if len(same_size) < 2:
+            continue
+        by_partial = defaultdict(list)
+        for fname in same_size:
+            by_partial[partial_hash(os.path.join(base_path, fname))].append(fname)
+        for candidates in by_partial.values():
+            if len(candidates) < 2:
+                continue
+            if size <= 2 * PARTIAL_HASH_BYTES:
+                # The partial hash already covered the whole file
+                groups.append(candidates)
+                continue
+            by_full = defaultdict(list)
+            for fname in candidates:
+                by_full[full_hash(os.path.join(base_path, fname))].append(fname)
+            groups.extend(group for group in by_full.values() if len(group) > 1)
+    return groups
+
+
+def group_similar_images(base_path, file_names):
+    """
+    Group copies of the same picture stored in different files (e.g. re-saved or
+    re-encoded JPEGs). Perceptual hashes pick the candidates; they are merged only when
+    their dimensions are equal and their thumbnails barely differ, so distinct but
+    similar pictures such as screenshots or scans stay apart.
+    """
+    candidates = []
+    for fname in file_names:
+        value = perceptual_hash(os.path.join(base_path, fname))
+        if value is None:
+            continue
+        for group in candidates:
+            if bin(group[0] ^ value).count("1") <= PHASH_MAX_DISTANCE:
+                group[1].append(fname)
+                break
+        else:
+            candidates.append((value, [fname]))
+
+    groups = []
+    for _, members in candidates:
+        if len(members) < 2:
+            continue
+        matched = []
+        for fname in members:
+            signature = thumbnail(os.path.join(base_path, fname))
+            if signature is None:
+                continue
+            for first, group in matched:
+                if same_picture(first, signature):
+                    group.append(fname)
+                    break
+            else:
+                matched.append((signature, [fname]))
+        groups.extend(group for _, group in matched if len(group) > 1)
+    return groups
+
+
+def find_duplicates(base_path, categorized_files):
+    """
+    Find duplicate files within each category.
+    Returns a dict mapping each representative file name to the names of its duplicates.
+    """
+    duplicates = {}
+    for category, file_names in categorized_files.items():
+        groups = group_exact_duplicates(base_path, file_names)
+        if category == "images":
+            grouped = {fname for group in groups for fname in group}
+            # Exact copies are already grouped, so only compare one member of each group
+            representatives = [fname for fname in file_names if fname not in grouped]
+            representatives += [min(group, key=canonical_sort_key) for group in groups]
+            for similar in group_similar_images(base_path, representatives):
+                merged = []
+                for fname in similar:
+                    existing = next((group for group in groups if fname in group), None)
+                    if existing:
+                        groups.remove(existing)
+                        merged.extend(existing)
+                    else:
+                        merged.append(fname)
+                groups.append(merged)
+        for group in groups:
+            ordered = sorted(group, key=canonical_sort_key)
+            duplicates[ordered[0]] = ordered[1:]
+    return duplicates
+
+
+def expand_duplicate_moves(file_moves, summaries, duplicates):
+    """
+    Build the batch's MovePlan, applying the decision made for each representative file to
+    its duplicates: a duplicate moves into the same destination directory under its own
+    name and shares the summary.
+    """
+    summary_by_path = {summary["file_path"]: summary["summary"] for summary in summaries}
+    plan = MovePlan()
+    for index, move in enumerate(file_moves):
+        summary = summary_by_path.get(move["src_path"])
+        if summary is None:
+            summary = summaries[index]["summary"] if index < len(summaries) else ""
+        add_move_with_duplicates(plan, move, summary, duplicates)
+    return plan
+
+
+def add_move_with_duplicates(plan, move, summary, duplicates):
+    """Add a move and the moves of its representative file's duplicates; returns the added PlannedMoves."""
+    planned = [plan.add(move["src_path"], move["dst_path"], summary)]
+    for duplicate in duplicates.get(move["src_path"], []):
+        dst_path = os.path.join(plan.paths.path(planned[0].directory), duplicate)
+        planned.append(plan.add(duplicate, dst_path, summary, duplicate_of=move["src_path"]))
+    return planned
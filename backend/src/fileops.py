@@ -0,0 +1,328 @@
+import asyncio
+import errno
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+COPY_CHUNK_BYTES = 8 * 1024 * 1024
+# Number of finished move jobs kept around for progress queries
+MAX_FINISHED_JOBS = 256
+# Seconds between writes of a running job's progress to the shared job store
+JOB_SYNC_INTERVAL = 0.5
+# Finished jobs are dropped from the shared job store after this many seconds
+MAX_FINISHED_JOB_AGE = 24 * 3600
+
+
+class MoveCancelled(Exception):
+    """Raised when a move job is cancelled before it completes."""
+
+
+class MoveJob:
+    """
+    Progress and cancellation state of a single move. With a store, the state is
+    published to it and cancellation requested through it is picked up while copying.
+    """
+    def __init__(self, src, dst, job_id=None, store=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.src = src
+        self.dst = dst
+        self.status = "queued"
+        self.total_bytes = None
+        self.copied_bytes = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.store = store
+        self.synced_at = 0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def sync(self, force=False):
+        """Publish the job's state to the store and pick up cancellation requested through it."""
+        if self.store is None or (not force and time.monotonic() - self.synced_at < JOB_SYNC_INTERVAL):
+            return
+        self.synced_at = time.monotonic()
+        if self.store.save(self):
+            self.cancel()
+
+    def add_progress(self, copied):
+        self.copied_bytes += copied
+        self.sync()
+        if self.cancel_event.is_set():
+            raise MoveCancelled(f"Move of {self.src} was cancelled")
+
+    def to_dict(self):
+        progress = None
+        if self.status == "done":
+            progress = 1.0
+        elif self.total_bytes:
+            progress = round(self.copied_bytes / self.total_bytes, 4)
+        return {
+            "jobId": self.job_id,
+            "src": self.src,
+            "dst": self.dst,
+            "status": self.status,
+            "copiedBytes": self.copied_bytes,
+            "totalBytes": self.total_bytes,
+            "progress": progress,
+            "error": self.error,
+        }
+
+
+def tree_size(path):
+    """Bytes to copy for path; symbolic links are recreated, not copied, and count as nothing."""
+    if os.path.islink(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.lstat(os.path.join(root, name)).st_size
+        for root, _, files in os.walk(path)
+        for name in files
+        if not os.path.islink(os.path.join(root, name))
+    )
+
+
+def copy_link(src, dst):
+    os.symlink(os.readlink(src), dst)
+    shutil.copystat(src, dst, follow_symlinks=False)
+
+
+def copy_file_chunked(src, dst, job):
+    """Copy one file in chunks, reporting progress to job and stopping when it is cancelled."""
+    if os.path.islink(src):
+        copy_link(src, dst)
+        return
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        for chunk in iter(lambda: fsrc.read(COPY_CHUNK_BYTES), b""):
+            fdst.write(chunk)
+            job.add_progress(len(chunk))
+    shutil.copystat(src, dst)
+
+
+def copy_tree_chunked(src, dst, job):
+    """Copy a directory tree into dst, which must not exist yet. Symbolic links are kept as links."""
+    os.makedirs(dst)
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        for name in dirs:
+            if os.path.islink(os.path.join(root, name)):
+                # os.walk does not descend into linked directories
+                copy_link(os.path.join(root, name), os.path.join(target_root, name))
+            else:
+                os.makedirs(os.path.join(target_root, name))
+        for name in files:
+            copy_file_chunked(os.path.join(root, name), os.path.join(target_root, name), job)
+    for root, dirs, _ in os.walk(src, topdown=False):
+        for name in dirs:
+            if not os.path.islink(os.path.join(root, name)):
+                target = os.path.join(dst, os.path.relpath(os.path.join(root, name), src))
+                shutil.copystat(os.path.join(root, name), target)
+    shutil.copystat(src, dst)
+
+
+def partial_path(dst):
+    """Hidden sibling of dst that a cross-device copy is written to before it is renamed into place."""
+    parent, name = os.path.split(dst.rstrip(os.sep))
+    return os.path.join(parent, f".{name}.{uuid.uuid4().hex[:8]}.partial")
+
+
+def remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+class MoveJobStore:
+    """
+    Move job states shared between worker processes through SQLite, so a progress or cancel
+    request reaches a job whichever worker runs it. The running worker writes the state;
+    cancellation is a flag it reads back with every write.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS move_jobs ("
+            "job_id TEXT PRIMARY KEY, "
+            "state TEXT NOT NULL, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, "
+            "finished INTEGER NOT NULL DEFAULT 0, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def add(self, job):
+        """Register a new job, replacing a finished one with the same id."""
+        with self.lock:
+            now = time.time()
+            self.conn.execute(
+                "DELETE FROM move_jobs WHERE finished = 1 AND updated_at < ?", (now - MAX_FINISHED_JOB_AGE,)
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO move_jobs (job_id, state, cancel_requested, finished, updated_at) "
+                "VALUES (?, ?, 0, 0, ?)",
+                (job.job_id, json.dumps(job.to_dict()), now),
+            )
+            self.conn.commit()
+
+    def save(self, job):
+        """Write the job's state. Returns True when its cancellation was requested."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE move_jobs SET state = ?, finished = ?, updated_at = ? WHERE job_id = ?",
+                (json.dumps(job.to_dict()), int(job.finished_at is not None), time.time(), job.job_id),
+            )
+            self.conn.commit()
+            row = self.conn.execute(
+                "SELECT cancel_requested FROM move_jobs WHERE job_id = ?", (job.job_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def load(self, job_id):
+        """The last published state of a job as MoveJob.to_dict() returns it, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT state FROM move_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def request_cancel(self, job_id):
+        """Flag an unfinished job for cancellation. Returns False when there is no such job."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE move_jobs SET cancel_requested = 1 WHERE job_id = ? AND finished = 0", (job_id,)
+            )
+            self.conn.commit()
+        return cursor.rowcount > 0 or self.load(job_id) is not None
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class FileMover:
+    """
+    Moves files and directories on a bounded thread pool so that large moves never block
+    the event loop. Moves within a filesystem are renames; moves across devices are copied
+    in chunks with progress reporting and can be cancelled. With a job_store, progress and
+    cancellation work across worker processes.
+    """
+    def __init__(self, max_workers=4, logger=None, job_store=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-io")
+        self.logger = logger
+        self.job_store = job_store
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def get_job(self, job_id):
+        """A job started by this process."""
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def job_state(self, job_id):
+        """The state of a job started by this or, through the job store, any other process."""
+        job = self.get_job(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.job_store.load(job_id) if self.job_store else None
+
+    def cancel(self, job_id):
+        """Request cancellation of a job. Returns False when the job is unknown."""
+        job = self.get_job(job_id)
+        if job is not None:
+            job.cancel()
+        requested = self.job_store.request_cancel(job_id) if self.job_store else False
+        return job is not None or requested
+
+    async def move(self, src, dst, job_id=None):
+        """Move src to dst on the I/O executor and return the finished MoveJob."""
+        job = MoveJob(src, dst, job_id=job_id, store=self.job_store)
+        with self.lock:
+            self.jobs[job.job_id] = job
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self._move, job)
+        finally:
+            self._forget_finished()
+        return job
+
+    async def run(self, func, *args):
+        """Run a short blocking filesystem call (e.g. os.makedirs) on the I/O executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def _move(self, job):
+        if self.job_store:
+            self.job_store.add(job)
+        job.status = "running"
+        job.started_at = time.time()
+        src, dst = job.src, job.dst
+        if os.path.isdir(dst):
+            # Same semantics as shutil.move: moving into an existing directory
+            dst = job.dst = os.path.join(dst, os.path.basename(src.rstrip(os.sep)))
+        try:
+            job.sync(force=True)
+            if job.cancel_event.is_set():
+                raise MoveCancelled(f"Move of {src} was cancelled")
+            try:
+                os.rename(src, dst)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                self._copy_across_devices(job, src, dst)
+            job.status = "done"
+        except MoveCancelled:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            raise
+        finally:
+            job.finished_at = time.time()
+            job.sync(force=True)
+
+    def _copy_across_devices(self, job, src, dst):
+        is_tree = os.path.isdir(src) and not os.path.islink(src)
+        if is_tree and os.path.lexists(dst):
+            # Like shutil.move, never merge into or replace an existing directory
+            raise FileExistsError(errno.EEXIST, "Destination path already exists", dst)
+        job.total_bytes = tree_size(src)
+        if self.logger:
+            self.logger.info(f"Copying {job.total_bytes} bytes across devices: {src} -> {dst}")
+        # The copy is only renamed into place once complete, so a failed or cancelled move
+        # removes nothing but its own partial copy
+        partial = partial_path(dst)
+        try:
+            if is_tree:
+                copy_tree_chunked(src, partial, job)
+            else:
+                copy_file_chunked(src, partial, job)
+            os.replace(partial, dst)
+        except BaseException:
+            # Leave the source untouched and drop the partial copy
+            remove_path(partial)
+            raise
+        remove_path(src)
+
+    def _forget_finished(self):
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.finished_at]
+            for job_id in itertools.islice(finished, max(len(finished) - MAX_FINISHED_JOBS, 0)):
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,212 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "for", "on", "with", "is", "it",
+    "this", "that", "by", "as", "at", "from", "be", "are", "file", "document", "contains",
+}
+
+# Relative weight of each filename feature kind when scoring a history match.
+FEATURE_WEIGHTS = {
+    "prefix": 3.0,
+    "ext": 1.0,
+    "name": 1.5,
+}
+NAME_KINDS = set(FEATURE_WEIGHTS)
+
+SENDER_PATTERN = re.compile(r"\b(?:[Ff]rom|[Ss]ender)\s*:\s*([A-Z][\w&.-]+(?:\s+[A-Z][\w&.-]+)?)")
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+
+
+def tokenize(text):
+    """Split text into lowercase alphabetic tokens, dropping stopwords and pure numbers."""
+    return [t for t in re.split(r"[^a-z0-9]+", text.lower()) if t and not t.isdigit() and t not in STOPWORDS]
+
+
+def extract_features(file_name, summary=None):
+    """Build the weighted feature set used to match a file against committed moves."""
+    base = os.path.basename(file_name)
+    stem, ext = os.path.splitext(base)
+    features = set()
+    if ext:
+        features.add(f"ext:{ext[1:].lower()}")
+    name_tokens = tokenize(stem)
+    if name_tokens:
+        features.add(f"prefix:{name_tokens[0]}")
+    for token in name_tokens:
+        features.add(f"name:{token}")
+    if summary:
+        for email in EMAIL_PATTERN.findall(summary):
+            features.add(f"sender:{email.lower()}")
+        for sender in SENDER_PATTERN.findall(summary):
+            features.add(f"sender:{sender.strip().lower()}")
+        for token in set(tokenize(summary)):
+            if len(token) > 3:
+                features.add(f"word:{token}")
+    return features
+
+
+def is_under(base_dir, path):
+    try:
+        return os.path.commonpath([base_dir, path]) == base_dir
+    except ValueError:
+        # Mixed absolute and relative paths, or different drives
+        return False
+
+
+def feature_weight(feature):
+    return FEATURE_WEIGHTS.get(feature.split(":", 1)[0], 1.0)
+
+
+def similarity(query_name, query_words, query_senders, record_features):
+    """
+    Score a committed record against a query. Filename features (weighted Jaccard) or a
+    shared sender decide the match; summary words only refine it. Records sharing neither a
+    filename word nor a sender score 0.
+    """
+    record_name = {f for f in record_features if f.split(":", 1)[0] in NAME_KINDS}
+    shared = query_name & record_name
+    sender_sim = 1.0 if query_senders & record_features else 0.0
+    if sender_sim == 0.0 and not any(not f.startswith("ext:") for f in shared):
+        # A shared extension alone says nothing, e.g. 000123.pdf and 20240101.pdf
+        return 0.0
+    union = query_name | record_name
+    name_sim = sum(map(feature_weight, shared)) / sum(map(feature_weight, union)) if union else 0.0
+    record_words = {f for f in record_features if f.startswith("word:")}
+    word_union = query_words | record_words
+    word_sim = len(query_words & record_words) / len(word_union) if word_union else 0.0
+    return 0.85 * max(name_sim, sender_sim) + 0.15 * word_sim
+
+
+class SuggestionHistory:
+    """
+    Local store of committed (source features -> destination) pairs with an in-memory
+    inverted index for similarity lookup. The SQLite database may be shared by several
+    worker processes; each one picks up the others' records before a lookup.
+    """
+    def __init__(self, db_path, min_score=0.6, min_support=2):
+        self.db_path = db_path
+        self.min_score = min_score
+        self.min_support = min_support
+        self.lock = threading.Lock()
+        self.pending_summaries = {}
+        self.index = defaultdict(set)
+        self.records = {}
+        self.last_record_id = 0
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        # WAL lets worker processes read while another one records a commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS committed_moves ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "file_name TEXT NOT NULL, "
+            "destination TEXT NOT NULL, "
+            "features TEXT NOT NULL, "
+            "committed_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.load_index()
+
+    def load_index(self):
+        """Rebuild the inverted index from the persisted records."""
+        with self.lock:
+            self.index.clear()
+            self.records.clear()
+            self.last_record_id = 0
+            self._load_new_records()
+
+    def refresh(self):
+        """Index records committed by other processes since the last load."""
+        with self.lock:
+            self._load_new_records()
+
+    def _load_new_records(self):
+        for record_id, destination, features in self.conn.execute(
+            "SELECT id, destination, features FROM committed_moves WHERE id > ? ORDER BY id",
+            (self.last_record_id,),
+        ):
+            self._index_record(record_id, destination, set(features.split("\n")) - {""})
+
+    def _index_record(self, record_id, destination, features):
+        self.records[record_id] = (destination, features)
+        self.last_record_id = max(self.last_record_id, record_id)
+        for feature in features:
+            self.index[feature].add(record_id)
+
+    def remember_summary(self, src_path, summary):
+        """Keep the summary of a suggested file until the user commits it."""
+        with self.lock:
+            self.pending_summaries[src_path] = summary
+
+    def record(self, src_path, dst_path, summary=None):
+        """Record a committed move of src_path into the dst_path directory."""
+        with self.lock:
+            if summary is None:
+                summary = self.pending_summaries.pop(src_path, None)
+            else:
+                self.pending_summaries.pop(src_path, None)
+        features = extract_features(src_path, summary)
+        if not features:
+            return None
+        destination = os.path.abspath(dst_path)
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO committed_moves (file_name, destination, features, committed_at) VALUES (?, ?, ?, ?)",
+                (os.path.basename(src_path), destination, "\n".join(sorted(features)), time.time()),
+            )
+            self.conn.commit()
+            # Also picks up records other processes committed in the meantime
+            self._load_new_records()
+        return cursor.lastrowid
+
+    def lookup(self, file_name, summary=None, base_dir=None, limit=3):
+        """
+        Return up to `limit` destination directories learned from similar committed files,
+        best match first. A destination needs min_support matching committed moves, so a
+        single move is never generalized. Only destinations under base_dir are considered
+        when it is given.
+        """
+        features = extract_features(file_name, summary)
+        if not features:
+            return []
+        base_dir = os.path.abspath(base_dir) if base_dir else None
+
+        with self.lock:
+            self._load_new_records()
+            record_ids = set()
+            for feature in features:
+                record_ids.update(self.index.get(feature, ()))
+            candidates = [self.records[record_id] for record_id in record_ids]
+
+        query_name = {f for f in features if f.split(":", 1)[0] in NAME_KINDS}
+        query_words = {f for f in features if f.startswith("word:")}
+        query_senders = {f for f in features if f.startswith("sender:")}
+
+        scores = defaultdict(float)
+        support = defaultdict(int)
+        for destination, record_features in candidates:
+            if base_dir and not is_under(base_dir, destination):
+                continue
+            score = similarity(query_name, query_words, query_senders, record_features)
+            if score < self.min_score:
+                continue
+            scores[destination] = max(scores[destination], score)
+            # Only committed moves that match on their own count as support
+            support[destination] += 1
+
+        ranked = sorted(
+            (d for d in scores if support[d] >= self.min_support),
+            key=lambda d: (scores[d], support[d]),
+            reverse=True,
+        )
+        return ranked[:limit]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,183 @@
+import base64
+import io
+import os
+import re
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, images are then classified by file name only
+    Image = None
+
+try:
+    import pytesseract
+except ImportError:  # OCR is optional, screenshots and scans are then described without their text
+    pytesseract = None
+
+# Longest side of an image sent to llava
+LLAVA_MAX_SIDE = 1024
+MAX_OCR_CHARS = 1000
+OCR_TIMEOUT_SECONDS = 15
+
+SCREENSHOT_NAME = re.compile(r"screen[\s_-]?shot|screen[\s_-]?capture|capture d.?écran|snip", re.IGNORECASE)
+SCAN_NAME = re.compile(r"(^|[\s_-])scan(ned)?([\s_-]|\d|$)", re.IGNORECASE)
+PHOTO_NAME = re.compile(r"^(IMG|DSC|DSCN|DSCF|PXL|MVIMG|DJI|GOPR|P\d{3})[_-]?\d|^WhatsApp Image|^Photo[\s_-]", re.IGNORECASE)
+NAME_DATE = re.compile(r"(20\d{2}|19\d{2})[-_.]?(0[1-9]|1[0-2])[-_.]?(0[1-9]|[12]\d|3[01])")
+
+# Common display resolutions (either orientation, including 2x/3x scaled phones and laptops)
+SCREEN_SIZES = {
+    (1280, 720), (1280, 800), (1366, 768), (1440, 900), (1536, 864), (1600, 900), (1680, 1050),
+    (1920, 1080), (1920, 1200), (2560, 1440), (2560, 1600), (2880, 1800), (3024, 1964),
+    (3456, 2234), (3840, 2160), (1170, 2532), (1179, 2556), (1284, 2778), (1290, 2796),
+    (1080, 2340), (1080, 2400), (1440, 3200), (750, 1334), (1242, 2688), (828, 1792),
+}
+# Page aspect ratios of A4 and US Letter
+PAGE_RATIOS = (297 / 210, 11 / 8.5)
+
+EXIF_MAKE = 0x010F
+EXIF_MODEL = 0x0110
+EXIF_SOFTWARE = 0x0131
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+GPS_IFD = 0x8825
+
+
+def read_exif(image):
+    """Return camera, capture date, GPS presence and software from an image's EXIF data."""
+    try:
+        exif = image.getexif()
+    except Exception:
+        return {}
+    if not exif:
+        return {}
+    make = str(exif.get(EXIF_MAKE, "")).strip("\x00 ")
+    model = str(exif.get(EXIF_MODEL, "")).strip("\x00 ")
+    camera = model if model.lower().startswith(make.lower()) else f"{make} {model}".strip()
+    captured = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    if captured:
+        # EXIF dates are written as "2024:05:01 14:22:10"
+        captured = re.sub(r"^(\d{4}):(\d{2}):(\d{2})", r"\1-\2-\3", str(captured).strip("\x00 "))
+    return {
+        "camera": camera or None,
+        "captured": captured or None,
+        "has_gps": bool(exif.get_ifd(GPS_IFD)),
+        "software": str(exif.get(EXIF_SOFTWARE, "")).strip("\x00 ") or None,
+    }
+
+
+def looks_like_screen(width, height):
+    return (width, height) in SCREEN_SIZES or (height, width) in SCREEN_SIZES
+
+
+def looks_like_page(width, height, dpi):
+    if not dpi or min(dpi) < 150:
+        return False
+    ratio = max(width, height) / max(min(width, height), 1)
+    return any(abs(ratio - page) / page < 0.02 for page in PAGE_RATIOS)
+
+
+def inspect_image(path):
+    """
+    Collect what can be known about an image without a vision model: dimensions, EXIF,
+    dates from the file name and whether it is a photo, screenshot or scan ("kind").
+    """
+    name = os.path.basename(path)
+    info = {"name": name, "width": None, "height": None, "format": None,
+            "camera": None, "captured": None, "has_gps": False, "software": None}
+    date = NAME_DATE.search(name)
+    if date:
+        info["captured"] = "-".join(date.groups())
+
+    text_chunks = ""
+    dpi = None
+    if Image is not None:
+        try:
+            with Image.open(path) as image:
+                info["width"], info["height"] = image.size
+                info["format"] = image.format
+                dpi = image.info.get("dpi")
+                # macOS stores "Screenshot" in the XMP user comment of PNG screenshots
+                text_chunks = " ".join(
+                    str(value) for key, value in image.info.items()
+                    if key not in ("icc_profile", "exif") and isinstance(value, (str, bytes))
+                )
+                info.update({key: value for key, value in read_exif(image).items() if value})
+        except Exception:
+            pass
+
+    if SCREENSHOT_NAME.search(name) or "screenshot" in text_chunks.lower() or (
+        info["software"] and "screenshot" in info["software"].lower()
+    ):
+        info["kind"] = "screenshot"
+    elif SCAN_NAME.search(name):
+        info["kind"] = "scan"
+    elif info["camera"] or PHOTO_NAME.search(name):
+        info["kind"] = "photo"
+    elif info["width"] and info["format"] == "PNG" and looks_like_screen(info["width"], info["height"]):
+        info["kind"] = "screenshot"
+    elif info["width"] and looks_like_page(info["width"], info["height"], dpi):
+        info["kind"] = "scan"
+    else:
+        info["kind"] = None
+    return info
+
+
+def ocr_text(path, max_chars=MAX_OCR_CHARS):
+    """Run Tesseract on an image and return its text, or None when OCR is unavailable or finds nothing."""
+    if pytesseract is None or Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            text = pytesseract.image_to_string(image.convert("L"), timeout=OCR_TIMEOUT_SECONDS)
+    except Exception:
+        return None
+    text = " ".join(text.split())
+    return text[:max_chars] or None
+
+
+def describe_image(path, ocr=True):
+    """
+    Describe a photo, screenshot or scan from its metadata (and, for screenshots and scans,
+    its OCR text). Returns (kind, description), or (None, None) when the image needs a vision model.
+    """
+    info = inspect_image(path)
+    kind = info["kind"]
+    if kind is None:
+        return None, None
+
+    description = {"photo": "Photo", "screenshot": "Screenshot", "scan": "Scanned document"}[kind]
+    if kind == "photo":
+        description += f" taken with {info['camera']}" if info["camera"] else " taken"
+    if info["captured"]:
+        description += f" {'on' if kind == 'photo' else 'from'} {info['captured']}"
+    details = []
+    if info["has_gps"]:
+        details.append("with GPS location")
+    if info["width"]:
+        details.append(f"{info['width']}x{info['height']} pixels")
+    if details:
+        description += ", " + ", ".join(details)
+    description += f". File name: {info['name']}."
+
+    if kind in ("screenshot", "scan") and ocr:
+        text = ocr_text(path)
+        if text:
+            description += f" Text visible in the image: {text}"
+    return kind, description
+
+
+def downscaled_base64(path, max_side=LLAVA_MAX_SIDE):
+    """
+    Return the image as base64 JPEG no larger than max_side pixels on its longest side, or
+    None when it cannot be decoded (e.g. HEIC without a plugin) and must be sent as-is.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(path) as image:
+            image.thumbnail((max_side, max_side))
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, format="JPEG", quality=85)
+    except Exception:
+        return None
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
@@ -0,0 +1,64 @@
+import json
+
+
+class ArrayObjectParser:
+    """
+    Incremental parser for JSON text that arrives in pieces, e.g. streamed from an LLM.
+    feed() returns each object that is an element of an array as soon as its closing brace
+    has arrived, such as the entries of {"files": [{...}, {...}]}. Text outside the JSON
+    (code fences, a sentence before it) is skipped, and only the unfinished object is
+    buffered. Objects nested inside an entry, such as {"tags": [{...}]}, stay part of it.
+    """
+    def __init__(self):
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.current = []
+        # Stack depth of the entry being read, None between entries
+        self.entry_depth = None
+        self.errors = 0
+
+    def feed(self, text):
+        completed = []
+        start = 0 if self.entry_depth is not None else None
+        for i, char in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '"':
+                # Strings only count once the JSON has started
+                self.in_string = bool(self.stack)
+            elif char in "{[":
+                if char == "{" and self.entry_depth is None and self.stack and self.stack[-1] == "[":
+                    self.entry_depth = len(self.stack)
+                    self.current = []
+                    start = i
+                self.stack.append(char)
+            elif char in "}]" and self.stack:
+                self.stack.pop()
+                if self.entry_depth is None or len(self.stack) > self.entry_depth:
+                    continue
+                if char == "}" and len(self.stack) == self.entry_depth:
+                    self.current.append(text[start:i + 1])
+                    completed.append("".join(self.current))
+                else:
+                    # Unbalanced brackets closed the entry early
+                    self.errors += 1
+                self.current = []
+                self.entry_depth = None
+                start = None
+        if start is not None:
+            self.current.append(text[start:])
+
+        objects = []
+        for raw in completed:
+            try:
+                objects.append(json.loads(raw))
+            except ValueError:
+                self.errors += 1
+        return objects
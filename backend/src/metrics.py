@@ -0,0 +1,262 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(label_names, label_values, extra=None):
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.extend(f'{name}="{escape_label_value(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class for a labelled metric rendered in the Prometheus text format."""
+    kind = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def label_key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self.render_sample(key, value))
+        return lines
+
+    def render_sample(self, key, value):
+        return [f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            state = self.values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+
+    def render_sample(self, key, state):
+        lines = []
+        for bound, count in zip(self.buckets, state["counts"]):
+            labels = format_labels(self.label_names, key, extra=[("le", format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['counts'][-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics exposed through the /metrics endpoint."""
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "cortexfs_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"]))
+EXTRACT_DURATION = REGISTRY.register(Histogram(
+    "cortexfs_extract_duration_seconds", "Time spent extracting file content by category.", ["category"]))
+SUMMARIZE_DURATION = REGISTRY.register(Histogram(
+    "cortexfs_summarize_duration_seconds", "Time spent summarizing a file by model.", ["model"]))
+QUEUE_WAIT = REGISTRY.register(Histogram(
+    "cortexfs_queue_wait_seconds", "Time a task waited between being queued and being started.", ["queue"]))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "cortexfs_llm_tokens_total", "Tokens sent to and received from LLMs.", ["call", "kind"]))
+FILES_PROCESSED = REGISTRY.register(Counter(
+    "cortexfs_files_processed_total", "Files processed by each pipeline.", ["pipeline"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "cortexfs_stage_errors_total", "Pipeline stages that raised an exception.", ["stage"]))
+JOBS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "cortexfs_jobs_in_progress", "Jobs currently being processed.", ["pipeline"]))
+
+# Stages with their own histogram, keyed by the label that histogram is broken down by
+STAGE_HISTOGRAMS = {
+    "extract": EXTRACT_DURATION,
+    "summarize": SUMMARIZE_DURATION,
+}
+
+_current_trace = contextvars.ContextVar("cortexfs_current_trace", default=None)
+
+
+class JobTrace:
+    """Per-job record of the stages a request went through, for optional trace dumps."""
+    def __init__(self, pipeline, job_id=None):
+        self.pipeline = pipeline
+        self.job_id = job_id or uuid.uuid4().hex
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.finished = None
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def add_span(self, stage, start, duration, labels, error=None):
+        span = {
+            "stage": stage,
+            "start": round(start - self.origin, 6),
+            "duration": round(duration, 6),
+            **labels,
+        }
+        if error:
+            span["error"] = error
+        with self.lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        return {
+            "jobId": self.job_id,
+            "pipeline": self.pipeline,
+            "startedAt": self.started_at,
+            "duration": round((self.finished or time.perf_counter()) - self.origin, 6),
+            "spans": spans,
+        }
+
+    def dump(self, trace_dir):
+        """Write the trace as JSON into trace_dir and return the file path."""
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"{self.pipeline}-{self.job_id}.json")
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+
+@contextmanager
+def job(pipeline, trace_dir=None, logger=None):
+    """
+    Track a job: counts it as in progress, makes its trace the active one for every stage
+    timed inside it and dumps the trace to trace_dir when one is configured.
+    """
+    trace = JobTrace(pipeline)
+    token = _current_trace.set(trace)
+    JOBS_IN_PROGRESS.inc(pipeline=pipeline)
+    try:
+        yield trace
+    finally:
+        trace.finished = time.perf_counter()
+        JOBS_IN_PROGRESS.dec(pipeline=pipeline)
+        _current_trace.reset(token)
+        if trace_dir:
+            try:
+                path = trace.dump(trace_dir)
+                if logger:
+                    logger.info(f"Trace for job {trace.job_id} written to {path}")
+            except OSError as e:
+                if logger:
+                    logger.error(f"Failed to write trace for job {trace.job_id}: {e}")
+
+
+@contextmanager
+def track(stage, span_attrs=None, **labels):
+    """
+    Time a pipeline stage into its histogram and the active job trace.
+    span_attrs are added to the trace span only, e.g. the file being processed.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        # Cancellation and early-closed generators (client disconnects) are not stage errors
+        error = type(e).__name__
+        raise
+    finally:
+        record_stage(stage, start, time.perf_counter() - start, error, span_attrs, **labels)
+
+
+def record_stage(stage, start, duration, error=None, span_attrs=None, **labels):
+    """Record a stage timed by the caller, for stages that do not fit in one with-block."""
+    if error:
+        STAGE_ERRORS.inc(stage=stage)
+    histogram = STAGE_HISTOGRAMS.get(stage)
+    if histogram:
+        histogram.observe(duration, **labels)
+    else:
+        STAGE_DURATION.observe(duration, stage=stage)
+    trace = _current_trace.get()
+    if trace:
+        trace.add_span(stage, start, duration, dict(labels, **(span_attrs or {})), error)
+
+
+def record_tokens(call, prompt_tokens=None, completion_tokens=None):
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, call=call, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, call=call, kind="completion")
+
+
+def render_metrics():
+    return REGISTRY.render()
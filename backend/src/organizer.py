@@ -1,15 +1,41 @@
+import asyncio
 import json
+import logging
 import os
+import threading
+import weakref
 from mimetypes import guess_type
 from datetime import datetime
-from pathlib import Path
-from rich.tree import Tree
-from rich import print as rprint
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List
-from langchain_groq import ChatGroq
-from langchain_core.messages import SystemMessage, HumanMessage
-from src.prompts import FILE_ORGANIZATION_PROMPT, FILE_MOVE_SUGGESTION_PROMPT
+from src.prompts import FILE_ORGANIZATION_PROMPT, FILE_MOVE_SUGGESTION_PROMPT, FILE_MOVE_BATCH_SUGGESTION_PROMPT
+from src.metrics import track
+from src.ratelimit import QuotaLimiter, RequestCoalescer
+from src.json_stream import ArrayObjectParser
+from src.compaction import (
+    TokenUsage,
+    compact_directory_listing,
+    compact_summaries,
+    count_tokens,
+    dumps_compact,
+    truncate_to_tokens,
+)
+
+logger = logging.getLogger(__name__)
+
+# Completion tokens reserved per file against the token quota, before the actual usage is known
+SUGGESTION_COMPLETION_TOKENS = 64
+REORGANIZATION_COMPLETION_TOKENS = 32
+MAX_RATE_LIMIT_RETRIES = 3
+# Context windows of the Groq models in use; prompts are only compacted when they would not fit
+MODEL_CONTEXT_TOKENS = {
+    "llama-3.1-70b-versatile": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "llama-3.1-8b-instant": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
 
 # Models
 class FileMove(BaseModel):
@@ -23,27 +49,220 @@ class PathSuggestions(BaseModel):
     src_path: str
     suggestions: List[str]
 
+class BatchPathSuggestions(BaseModel):
+    files: List[PathSuggestions]
+
+
+def retry_after(response):
+    """Seconds a rate-limited response asks to wait, if it says."""
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
 # Class Definition
 class DirectoryOrganizer:
-    def __init__(self, base_dir: str, model_name: str, exclude_dirs=None):
+    def __init__(self, base_dir: str, model_name: str, exclude_dirs=None, history=None,
+                 prompt_token_budget=None, listing_token_budget=2000, limiter=None, suggestion_window=0.05,
+                 max_suggestion_batch=16):
         self.base_dir = base_dir
         self.model_name = model_name
         self.exclude_dirs = exclude_dirs if exclude_dirs else ["node_modules", ".cache", "build"]
-        self.chat_groq = ChatGroq(model=model_name, temperature=0)
+        self.history = history
+        self.context_tokens = MODEL_CONTEXT_TOKENS.get(model_name, DEFAULT_CONTEXT_TOKENS)
+        # Optional cap below the model context, e.g. to keep single calls small
+        self.prompt_token_budget = prompt_token_budget
+        self.listing_token_budget = listing_token_budget
+        self.token_usage = TokenUsage(logger=logger)
+        self.limiter = limiter if limiter else QuotaLimiter(logger=logger)
+        # Concurrent suggestion requests for the same destination directory share one LLM call
+        self.suggestion_coalescer = RequestCoalescer(
+            self.suggest_batch, limiter=self.limiter, window=suggestion_window, max_batch=max_suggestion_batch
+        )
+        self._chat_groq = None
+        self._async_chat_groqs = weakref.WeakKeyDictionary()
+        self.client_lock = threading.Lock()
+
+    @staticmethod
+    def groq_options():
+        # GROQ_BASE_URL points the client at a Groq-compatible server, e.g. the benchmark stubs
+        return {"base_url": os.getenv("GROQ_BASE_URL")} if os.getenv("GROQ_BASE_URL") else {}
+
+    @property
+    def chat_groq(self):
+        """ChatGroq client, constructed on first use to keep backend startup fast."""
+        if self._chat_groq is None:
+            with self.client_lock:
+                if self._chat_groq is None:
+                    from langchain_groq import ChatGroq
+                    self._chat_groq = ChatGroq(model=self.model_name, temperature=0, **self.groq_options())
+        return self._chat_groq
+
+    def async_chat_groq(self):
+        """
+        ChatGroq client for the running event loop, whose HTTP responses feed the rate limiter.
+        One client per loop, since async HTTP connections cannot be shared between loops.
+        """
+        loop = asyncio.get_running_loop()
+        with self.client_lock:
+            client = self._async_chat_groqs.get(loop)
+            if client is None:
+                import httpx
+                from langchain_groq import ChatGroq
+                http_client = httpx.AsyncClient(event_hooks={"response": [self.observe_response]})
+                # Rate-limited calls are retried by ainvoke_structured once the quota allows
+                client = self._async_chat_groqs[loop] = ChatGroq(
+                    model=self.model_name, temperature=0, max_retries=0, http_async_client=http_client,
+                    **self.groq_options(),
+                )
+        return client
+
+    async def observe_response(self, response):
+        self.limiter.update_from_headers(response.headers)
+        if response.status_code == 429:
+            self.limiter.penalize(retry_after(response))
+
+    def warm_up(self):
+        """Construct the LLM client and load heavy modules ahead of the first request."""
+        import rich.tree  # noqa: F401
+        from langchain_core.messages import SystemMessage, HumanMessage  # noqa: F401
+        self.chat_groq
+
+    def invoke_structured(self, call, schema, messages, stage="organize"):
+        """
+        Invoke the model with structured output and record the call's token usage.
+        """
+        structured_chat_groq = self.chat_groq.with_structured_output(schema, include_raw=True)
+        estimated_tokens = sum(count_tokens(message.content) for message in messages)
+        with track(stage):
+            response = structured_chat_groq.invoke(messages)
+        return self.parse_structured(call, schema, estimated_tokens, response)
+
+    async def ainvoke_structured(self, call, schema, messages, stage="organize", completion_tokens=0):
+        """
+        Invoke the model with structured output without blocking the event loop. The call
+        waits for room in the request and token quotas first, and is retried after a 429.
+        """
+        structured_chat_groq = self.async_chat_groq().with_structured_output(schema, include_raw=True)
+        estimated_tokens = sum(count_tokens(message.content) for message in messages)
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.limiter.acquire(estimated_tokens + completion_tokens)
+            try:
+                with track(stage):
+                    response = await structured_chat_groq.ainvoke(messages)
+                break
+            except Exception as e:
+                if getattr(e, "status_code", None) != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                self.limiter.penalize(retry_after(getattr(e, "response", None)))
+                logger.warning(f"{call} was rate limited, retrying (attempt {attempt + 1})")
+        return self.parse_structured(call, schema, estimated_tokens, response)
+
+    def parse_structured(self, call, schema, estimated_tokens, response):
+        self.token_usage.record(call, estimated_tokens, response.get("raw"))
+        if response.get("parsed") is None:
+            raise ValueError(f"Failed to parse {schema.__name__} response: {response.get('parsing_error')}")
+        return response["parsed"]
+
+    def learned_suggestions(self, dst_directory, summary):
+        """Suggestions for a recurring pattern from the committed-move history, if any."""
+        if self.history:
+            learned = self.history.lookup(summary["file_path"], summary.get("summary"), base_dir=dst_directory)
+            if learned:
+                return PathSuggestions(src_path=summary["file_path"], suggestions=learned).dict()
+        return None
+
+    def suggestion_prompt(self, prompt, dst_directory):
+        dst_directies = self.get_directories(dst_directory)
+        listing = compact_directory_listing(dst_directies, dst_directory, max_tokens=self.listing_token_budget)
+        return prompt.format(base_directory=dst_directory, destination_directories=listing or "(empty)")
+
+    def prompt_budget(self, completion_tokens):
+        """Tokens a prompt may use so that it and the expected completion fit the model context."""
+        budget = self.context_tokens - completion_tokens
+        if self.prompt_token_budget:
+            budget = min(budget, self.prompt_token_budget)
+        return budget
+
+    def suggestion_messages(self, formatted_prompt, summary):
+        from langchain_core.messages import SystemMessage, HumanMessage
+        summary_budget = max(self.prompt_budget(SUGGESTION_COMPLETION_TOKENS) - count_tokens(formatted_prompt), 64)
+        compact_summary = dict(summary, summary=truncate_to_tokens(summary.get("summary") or "", summary_budget))
+        return [
+            SystemMessage(content=formatted_prompt),
+            HumanMessage(content=dumps_compact(compact_summary))
+        ]
+
+    @staticmethod
+    def resolve_suggestions(dst_directory, response):
+        # Suggestions come back relative to the destination directory
+        response["suggestions"] = [
+            suggestion if os.path.isabs(suggestion) else os.path.join(dst_directory, suggestion)
+            for suggestion in response["suggestions"]
+        ]
+        return response
 
     def get_path_suggestions(self, dst_directory, summary: str):
         """
         Get path suggestions for a given summary.
+        Recurring patterns are answered from the committed-move history without calling the LLM.
         """
-        dst_directies = self.get_directories(dst_directory)
-        formatted_prompt = FILE_MOVE_SUGGESTION_PROMPT.format(destination_directories=json.dumps(dst_directies, indent=4))
-        structured_chat_groq = self.chat_groq.with_structured_output(PathSuggestions)
+        learned = self.learned_suggestions(dst_directory, summary)
+        if learned:
+            return learned
+        formatted_prompt = self.suggestion_prompt(FILE_MOVE_SUGGESTION_PROMPT, dst_directory)
+        messages = self.suggestion_messages(formatted_prompt, summary)
+        response = self.invoke_structured("get_path_suggestions", PathSuggestions, messages, stage="suggest").dict()
+        return self.resolve_suggestions(dst_directory, response)
+
+    async def aget_path_suggestions(self, dst_directory, summary):
+        """
+        Async get_path_suggestions. Requests for the same destination directory that arrive
+        together are answered by a single LLM call.
+        """
+        learned = self.learned_suggestions(dst_directory, summary)
+        if learned:
+            return learned
+        return await self.suggestion_coalescer.submit(dst_directory, summary)
+
+    async def suggest_batch(self, dst_directory, summaries):
+        """Path suggestions for summaries of files bound for the same destination directory."""
+        if len(summaries) == 1:
+            formatted_prompt = await asyncio.to_thread(self.suggestion_prompt, FILE_MOVE_SUGGESTION_PROMPT, dst_directory)
+            response = await self.ainvoke_structured(
+                "get_path_suggestions", PathSuggestions, self.suggestion_messages(formatted_prompt, summaries[0]),
+                stage="suggest", completion_tokens=SUGGESTION_COMPLETION_TOKENS,
+            )
+            return [self.resolve_suggestions(dst_directory, response.dict())]
+
+        from langchain_core.messages import SystemMessage, HumanMessage
+        # The directory listing is walked and sent once for the whole batch
+        formatted_prompt = await asyncio.to_thread(
+            self.suggestion_prompt, FILE_MOVE_BATCH_SUGGESTION_PROMPT, dst_directory
+        )
+        summary_budget = max(
+            self.prompt_budget(SUGGESTION_COMPLETION_TOKENS * len(summaries)) - count_tokens(formatted_prompt),
+            64 * len(summaries),
+        )
         messages = [
             SystemMessage(content=formatted_prompt),
-            HumanMessage(content=json.dumps(summary))
+            HumanMessage(content=dumps_compact(compact_summaries(summaries, summary_budget)))
         ]
-        response = structured_chat_groq.invoke(messages)
-        return response.dict()
+        response = await self.ainvoke_structured(
+            "get_path_suggestions_batch", BatchPathSuggestions, messages,
+            stage="suggest", completion_tokens=SUGGESTION_COMPLETION_TOKENS * len(summaries),
+        )
+        by_path = {entry.src_path: entry.dict() for entry in response.files}
+        results = []
+        for summary in summaries:
+            entry = by_path.get(summary["file_path"])
+            if entry is None:
+                # The model skipped this file; ask for it on its own
+                entry = (await self.suggest_batch(dst_directory, [summary]))[0]
+            else:
+                entry = self.resolve_suggestions(dst_directory, entry)
+            results.append(entry)
+        return results
     
     def get_directories(self, dst_directory):
         """
@@ -60,102 +279,161 @@ class DirectoryOrganizer:
 
         return directory_paths
     
+    def reorganization_messages(self, summaries):
+        from langchain_core.messages import SystemMessage, HumanMessage
+        summary_budget = (
+            self.prompt_budget(REORGANIZATION_COMPLETION_TOKENS * len(summaries)) - count_tokens(FILE_ORGANIZATION_PROMPT)
+        )
+        return [
+            SystemMessage(content=FILE_ORGANIZATION_PROMPT),
+            HumanMessage(content=dumps_compact(compact_summaries(summaries, summary_budget)))
+        ]
+
     def get_reorganization_actions(self, summaries: list):
         """
         Generate reorganization actions using the ChatGroq model.
         """
-        structured_chat_groq = self.chat_groq.with_structured_output(DirectoryTree)
-        messages = [
-            SystemMessage(content=FILE_ORGANIZATION_PROMPT),
-            HumanMessage(content=json.dumps(summaries))
-        ]
-        response = structured_chat_groq.invoke(messages)
+        messages = self.reorganization_messages(summaries)
+        response = self.invoke_structured("get_reorganization_actions", DirectoryTree, messages)
         return response.dict()
-    
-    def create_directory_structure(self, file_moves, summaries, base_path, agentops):
+
+    async def aget_reorganization_actions(self, summaries: list):
+        """
+        Async get_reorganization_actions, paced by the rate limiter.
         """
-        Create a directory tree structure and add summaries for visualization.
+        messages = self.reorganization_messages(summaries)
+        response = await self.ainvoke_structured(
+            "get_reorganization_actions", DirectoryTree, messages,
+            completion_tokens=REORGANIZATION_COMPLETION_TOKENS * len(summaries),
+        )
+        return response.dict()
+
+    async def astream_reorganization_actions(self, summaries: list):
         """
-        tree = {}
-        for file, summary in zip(file_moves, summaries):
-            parts = Path(file["dst_path"]).parts
-            current = tree
-            for part in parts:
-                current = current.setdefault(part, {})
-            current["__summary__"] = summary["summary"]
-            file["dst_path"] = file["dst_path"]
-            file["summary"] = summary["summary"]
+        Stream reorganization actions as the model generates them. Each FileMove is yielded
+        as a dict as soon as its JSON entry is complete and valid. Entries for unknown or
+        already moved source files are dropped.
+        """
+        messages = self.reorganization_messages(summaries)
+        estimated_tokens = sum(count_tokens(message.content) for message in messages)
+        pending = {summary["file_path"] for summary in summaries}
+        parser = ArrayObjectParser()
+        raw = None
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            await self.limiter.acquire(estimated_tokens + REORGANIZATION_COMPLETION_TOKENS * len(summaries))
+            try:
+                with track("organize"):
+                    async for chunk in self.async_chat_groq().astream(messages):
+                        raw = chunk if raw is None else raw + chunk
+                        for entry in parser.feed(chunk.content if isinstance(chunk.content, str) else ""):
+                            try:
+                                move = FileMove(**entry)
+                            except (TypeError, ValidationError) as e:
+                                logger.warning(f"Skipping invalid file move {entry}: {e}")
+                                continue
+                            if move.src_path not in pending:
+                                logger.warning(f"Skipping file move of unknown or already moved file {move.src_path}")
+                                continue
+                            pending.discard(move.src_path)
+                            yield move.dict()
+                break
+            except Exception as e:
+                # Only a call that has not produced anything yet can be retried
+                if getattr(e, "status_code", None) != 429 or raw is not None or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                self.limiter.penalize(retry_after(getattr(e, "response", None)))
+                logger.warning(f"get_reorganization_actions was rate limited, retrying (attempt {attempt + 1})")
+        self.token_usage.record("stream_reorganization_actions", estimated_tokens, raw)
+        if parser.errors:
+            logger.warning(f"{parser.errors} streamed file moves could not be parsed")
+        if pending:
+            logger.warning(f"No file move was generated for {len(pending)} files")
 
+    def create_directory_structure(self, plan, base_path, agentops):
+        """
+        Print the planned directory structure and end the AgentOps session.
+        """
+        from rich.tree import Tree
+        from rich import print as rprint
         root = Tree(base_path)
-        self.add_to_tree_visual(tree, root)
+        self.add_to_tree_visual(plan, 0, root, plan.children(), plan.files_by_directory())
         rprint(root)
 
-        agentops.end_session("Success", end_state_reason="Reorganized directory structure")
-        return tree
-    
-    def convert_to_tree_with_details(self, data, base_path):
-        """
-        Convert data into a tree structure with detailed file information.
-        """
-        def add_to_tree(tree, path_parts, file_data):
-            if not path_parts:
-                return
-            
-            current_part = path_parts[0]
-            remaining_parts = path_parts[1:]
-            
-            child = next((child for child in tree["children"] if child["name"] == current_part), None)
-            
-            if not child:
-                if remaining_parts:
-                    child = {
-                        "name": current_part,
-                        "type": "folder",
-                        "path": os.path.join(tree["path"], current_part),
-                        "children": [],
-                    }
-                else:
-                    src_abs_path = os.path.join(base_path, file_data["src_path"])
-                    size = os.path.getsize(src_abs_path) if os.path.exists(src_abs_path) else "Unknown"
-                    file_type = guess_type(src_abs_path)[0] or "Unknown"
-                    last_modified = (
-                        datetime.fromtimestamp(os.path.getmtime(src_abs_path)).strftime("%Y-%m-%d %H:%M:%S")
-                        if os.path.exists(src_abs_path) else "Unknown"
-                    )
-                    child = {
-                        "name": current_part,
-                        "type": "file",
-                        "path": os.path.join(tree["path"], current_part),
-                        "summary": file_data["summary"],
-                        "source": file_data["src_path"],
-                        "destination": file_data["dst_path"],
-                        "size": f"{size} bytes" if size != "Unknown" else size,
-                        "lastModified": last_modified,  
-                        "fileType": file_type,
-                        "status": "Ready to move",
-                    }
-                tree["children"].append(child)
-            
-            if child["type"] == "folder":
-                add_to_tree(child, remaining_parts, file_data)
-        
-        root_name = os.path.basename(base_path)
-        root = {"name": root_name, "type": "folder", "path": root_name, "children": []}
-        
-        for item in data:
-            dst_path = item["dst_path"]
-            path_parts = dst_path.split("/")
-            add_to_tree(root, path_parts, item)
-        
+        if agentops:
+            agentops.end_session("Success", end_state_reason="Reorganized directory structure")
         return root
-    
-    def add_to_tree_visual(self, tree, root_node):
+
+    def file_details(self, move, path, base_path):
+        """Response entry of a single planned file move."""
+        src_abs_path = os.path.join(base_path, move.src_path)
+        try:
+            stat = os.stat(src_abs_path)
+            size = f"{stat.st_size} bytes"
+            last_modified = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        except OSError:
+            size = last_modified = "Unknown"
+        details = {
+            "name": move.name,
+            "type": "file",
+            "path": path,
+            "summary": move.summary,
+            "source": move.src_path,
+            "destination": move.dst_path,
+            "size": size,
+            "lastModified": last_modified,
+            "fileType": guess_type(src_abs_path)[0] or "Unknown",
+            "status": "Ready to move",
+        }
+        if move.duplicate_of:
+            details["duplicateOf"] = move.duplicate_of
+        return details
+
+    def iter_tree_json(self, plan, base_path, chunk_size=64 * 1024):
+        """
+        Serialize a MovePlan as the JSON tree sent to the client, in chunks of about
+        chunk_size characters, so the whole response never has to exist in memory at once.
+        """
+        children = plan.children()
+        files = plan.files_by_directory()
+
+        def folder(node, name, path):
+            yield f'{{"name": {json.dumps(name)}, "type": "folder", "path": {json.dumps(path)}, "children": ['
+            separator = ""
+            for child in children.get(node, ()):
+                segment = plan.paths.segments[child]
+                yield separator
+                yield from folder(child, segment, os.path.join(path, segment))
+                separator = ", "
+            for index in files.get(node, ()):
+                move = plan[index]
+                yield separator
+                yield json.dumps(self.file_details(move, os.path.join(path, move.name), base_path))
+                separator = ", "
+            yield "]}"
+
+        root_name = os.path.basename(base_path)
+        buffer = []
+        buffered = 0
+        for part in folder(0, root_name, root_name):
+            buffer.append(part)
+            buffered += len(part)
+            if buffered >= chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+        yield "".join(buffer)
+
+    def convert_to_tree_with_details(self, plan, base_path):
+        """
+        Convert a MovePlan into a tree structure with detailed file information.
+        """
+        return json.loads("".join(self.iter_tree_json(plan, base_path)))
+
+    def add_to_tree_visual(self, plan, node, visual, children, files):
         """
-        Add nodes to a Rich Tree visual representation.
+        Add the directories and files under node to a Rich Tree visual representation.
         """
-        for key, value in tree.items():
-            if key == "__summary__":
-                continue
-            child = root_node.add(key)
-            if isinstance(value, dict):
-                self.add_to_tree_visual(value, child)
\ No newline at end of file
+        for child in children.get(node, ()):
+            self.add_to_tree_visual(plan, child, visual.add(plan.paths.segments[child]), children, files)
+        for index in files.get(node, ()):
+            visual.add(plan[index].name)
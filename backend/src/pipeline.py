@@ -0,0 +1,209 @@
+import asyncio
+import json
+import os
+import time
+
+from src.dedup import add_move_with_duplicates, expand_duplicate_moves
+from src.metrics import FILES_PROCESSED, job, record_stage
+from src.records import MovePlan
+from src.search import schedule_indexing
+
+
+class BatchContext:
+    """
+    State of a single batch organization request. Everything that differs between requests
+    lives here, so the shared summarizer and organizer never hold per-request state.
+    """
+    def __init__(self, base_path, session=None):
+        self.base_path = base_path
+        self.session = session
+        self.documents = []
+        self.unsupported_files = []
+        # Files that could not be summarized, as {"file": ..., "error": ...}
+        self.failed_files = []
+        self.summaries = []
+        # Map of representative file name to the names of its duplicates
+        self.duplicates = {}
+        self.plan = None
+        self.trace = None
+
+    def skipped_files_json(self):
+        """Response fields, with a leading comma, listing the files left out of the plan."""
+        return (
+            f', "unsupportedFiles": {json.dumps(self.unsupported_files)}'
+            f', "failedFiles": {json.dumps(self.failed_files)}'
+        )
+
+
+class BatchPipeline:
+    """
+    Runs batch organization for any number of concurrent requests with one shared
+    summarizer and organizer. Blocking stages run on worker threads so that concurrent
+    requests keep making progress on the event loop. With a dispatcher, extraction and
+    summarization run on remote workers instead of in this process. With a search index,
+    the summaries are indexed in the background for /search.
+    """
+    def __init__(self, summarizer, organizer, logger, trace_dir=None, dispatcher=None, search_index=None):
+        self.summarizer = summarizer
+        self.organizer = organizer
+        self.logger = logger
+        self.trace_dir = trace_dir
+        self.dispatcher = dispatcher
+        self.search_index = search_index
+
+    async def run(self, context):
+        """
+        Summarize and organize context.base_path. Returns an iterator over the JSON chunks of
+        the response tree, which is serialized while it is sent.
+        """
+        start_time = time.time()
+        with job("batch", trace_dir=self.trace_dir, logger=self.logger) as trace:
+            context.trace = trace
+            await self.summarize(context)
+
+            self.logger.info(f"[{trace.job_id}] Generating reorganization actions...")
+            file_moves = await self.organizer.aget_reorganization_actions(context.summaries)
+
+            # Duplicates follow the decision made for their representative file
+            context.plan = expand_duplicate_moves(file_moves["files"], context.summaries, context.duplicates)
+            # The plan holds the summaries from here on
+            context.summaries = []
+            if self.search_index:
+                self.index_summaries(context)
+
+            response_data = await asyncio.to_thread(self.build_tree, context)
+            FILES_PROCESSED.inc(len(context.plan), pipeline="batch")
+        self.logger.info(f"[{trace.job_id}] Time taken for batch organization: {time.time() - start_time:.2f} seconds")
+        return response_data
+
+    async def stream(self, context):
+        """
+        Summarize and organize context.base_path, yielding the response as NDJSON lines. A
+        {"type": "move"} line is sent for every file as soon as the organizer has generated
+        its move, followed by one {"type": "tree"} line with the complete tree and the
+        unsupported and failed files. If organizing fails part way, the stream ends with a
+        {"type": "error"} line listing the files that got no move instead.
+        """
+        start_time = time.time()
+        with job("batch", trace_dir=self.trace_dir, logger=self.logger) as trace:
+            context.trace = trace
+            await self.summarize(context)
+
+            self.logger.info(f"[{trace.job_id}] Streaming reorganization actions...")
+            summary_by_path = {summary["file_path"]: summary["summary"] for summary in context.summaries}
+            context.plan = MovePlan()
+            root_name = os.path.basename(context.base_path)
+            try:
+                async for move in self.organizer.astream_reorganization_actions(context.summaries):
+                    summary = summary_by_path.get(move["src_path"], "")
+                    for planned in add_move_with_duplicates(context.plan, move, summary, context.duplicates):
+                        details = self.organizer.file_details(
+                            planned, os.path.join(root_name, planned.dst_path), context.base_path
+                        )
+                        yield json.dumps({"type": "move", "file": details}) + "\n"
+            except Exception as e:
+                self.logger.error(f"[{trace.job_id}] Streaming reorganization failed: {e}")
+                yield json.dumps(self.stream_error(context, e)) + "\n"
+                return
+            # The plan holds the summaries from here on
+            context.summaries = []
+            if self.search_index:
+                self.index_summaries(context)
+
+            tree_chunks = await asyncio.to_thread(self.build_tree, context)
+            yield '{"type": "tree", "treeStructure": '
+            # Serializing the tree stats every file, so chunks are produced on a worker thread
+            while (chunk := await asyncio.to_thread(next, tree_chunks, None)) is not None:
+                yield chunk
+            yield context.skipped_files_json() + "}\n"
+            FILES_PROCESSED.inc(len(context.plan), pipeline="batch")
+        self.logger.info(f"[{trace.job_id}] Time taken for streamed batch organization: {time.time() - start_time:.2f} seconds")
+
+    @staticmethod
+    def stream_error(context, error):
+        """The final line of a stream that failed: the error and the files still without a move."""
+        moved = {planned.src_path for planned in context.plan}
+        pending = []
+        for summary in context.summaries:
+            if summary["file_path"] not in moved:
+                pending.append(summary["file_path"])
+                pending.extend(context.duplicates.get(summary["file_path"], []))
+        return {
+            "type": "error",
+            "error": str(error) or type(error).__name__,
+            "pendingFiles": pending,
+            "unsupportedFiles": context.unsupported_files,
+            "failedFiles": context.failed_files,
+        }
+
+    async def summarize(self, context):
+        if self.dispatcher:
+            self.logger.info(f"[{context.trace.job_id}] Distributing {context.base_path} to summarization workers...")
+            (context.summaries, context.duplicates,
+             context.unsupported_files, context.failed_files) = await self.dispatcher.summarize(context.base_path)
+        else:
+            await self.summarize_locally(context)
+
+    async def summarize_locally(self, context):
+        self.logger.info(f"[{context.trace.job_id}] Loading documents from {context.base_path}...")
+        # Files that fail to extract or summarize are reported instead of failing the batch
+        context.documents, context.unsupported_files = await asyncio.to_thread(
+            self.summarizer.load_documents, context.base_path, context.failed_files
+        )
+        context.duplicates = {
+            doc.metadata["file_name"]: doc.metadata["duplicates"]
+            for doc in context.documents if doc.metadata.get("duplicates")
+        }
+
+        self.logger.info(f"[{context.trace.job_id}] Summarizing {len(context.documents)} documents...")
+        context.summaries = await self.summarizer.summarize_documents(context.documents, context.failed_files)
+        for failed in context.failed_files:
+            self.logger.error(f"[{context.trace.job_id}] Failed to summarize {failed['file']}: {failed['error']}")
+        # Extracted contents are no longer needed once summarized
+        context.documents = []
+
+    def index_summaries(self, context):
+        entries = [
+            (os.path.join(context.base_path, move.src_path), move.summary, self.summarizer.get_file_category(move.src_path))
+            for move in context.plan
+        ]
+        schedule_indexing(self.search_index, entries, self.logger)
+
+    def build_tree(self, context):
+        """
+        Create the directory structure and return an iterator over the JSON chunks of the
+        tree. The tree_build stage covers both, up to the last chunk.
+        """
+        start = time.perf_counter()
+        self.logger.info("Creating directory structure...")
+        try:
+            self.organizer.create_directory_structure(context.plan, context.base_path, agentops=context.session)
+        except Exception as e:
+            record_stage("tree_build", start, time.perf_counter() - start, type(e).__name__)
+            raise
+        chunks = self.organizer.iter_tree_json(context.plan, base_path=context.base_path)
+        return timed_chunks("tree_build", chunks, start, time.perf_counter() - start)
+
+
+def timed_chunks(stage, chunks, start, elapsed=0.0):
+    """
+    Yield from chunks, recording the time spent producing them as stage once they are
+    exhausted. Time the consumer spends between chunks, e.g. sending them, is not counted.
+    """
+    chunks = iter(chunks)
+    error = None
+    try:
+        while True:
+            resumed = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                elapsed += time.perf_counter() - resumed
+            yield chunk
+    finally:
+        record_stage(stage, start, elapsed, error)
@@ -41,7 +41,9 @@ You will be provided with a file and its summary content. Suggest 3 possible des
 8. **Abbreviation and Encoding**: Use clear abbreviations or encoded metadata to save space while preserving clarity.
 9. **Limit the file name length**: Maximum of 2 to 3 words can be used to create the file name.
 
-**Destination Directory paths**:
+**Base destination directory**: {base_directory}
+
+**Destination Directory paths** (relative to the base destination directory, one directory per line, nested directories are indented under their parent and single-child chains are joined with `/`):
 {destination_directories}
 
 ** NOTE: ** If the destination path is not appropriate in the destination folder structure, suggest a new created path that is more appropriate in the same base destination directory.
@@ -52,10 +54,48 @@ You will be provided with a file and its summary content. Suggest 3 possible des
 {{
     "src_path": "original file path",
     "suggestions": [
-        "suggested path 1",
+        "suggested path 1 relative to the base destination directory",
         "suggested path 2",
         "suggested path 3"
     ]
 }}
 ```
 """
+
+FILE_MOVE_BATCH_SUGGESTION_PROMPT="""
+You will be provided with a JSON list of files and their summary contents. For every file, suggest 3 possible destination directory paths, which are most appropriate for the file based on its content and purpose. Consider the following factors when proposing the new directory paths:
+1. **Content Relevance**: Ensure the directory path reflects the content and purpose of the file for easy retrieval and categorization.
+2. **Contextual Relationship**: Place the file in a directory that relates to its content, project, or function.
+3. **Metadata Inclusion**: Include relevant metadata (e.g., date, version, project name) in the directory path to provide additional context.
+4. **Search Optimization**: Position the file in a directory that facilitates quick search and retrieval based on key information.
+5. **Consistency**: Maintain consistency with existing directory structures and naming conventions, and place related files of the list consistently.
+6. **File Type Identification**: Use the file type or category to determine the appropriate directory path.
+7. **Version Control**: If applicable, consider version numbers or identifiers in the directory path.
+8. **Abbreviation and Encoding**: Use clear abbreviations or encoded metadata to save space while preserving clarity.
+9. **Limit the file name length**: Maximum of 2 to 3 words can be used to create the file name.
+
+**Base destination directory**: {base_directory}
+
+**Destination Directory paths** (relative to the base destination directory, one directory per line, nested directories are indented under their parent and single-child chains are joined with `/`):
+{destination_directories}
+
+** NOTE: ** If the destination path is not appropriate in the destination folder structure, suggest a new created path that is more appropriate in the same base destination directory.
+
+**Output Requirements:**
+- Return one entry for every file in the list, with its file path unchanged.
+- Return a JSON object with the following schema:
+```json
+{{
+    "files": [
+        {{
+            "src_path": "original file path",
+            "suggestions": [
+                "suggested path 1 relative to the base destination directory",
+                "suggested path 2",
+                "suggested path 3"
+            ]
+        }}
+    ]
+}}
+```
+"""
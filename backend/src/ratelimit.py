@@ -0,0 +1,217 @@
+import asyncio
+import re
+import threading
+import time
+
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 6000
+# Waits are rounded up a little so a woken caller does not find the bucket just short
+WAIT_PADDING = 0.01
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+UNIT_SECONDS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def parse_duration(value):
+    """Parse a rate limit reset such as "2m59.56s", "7.66s", "250ms" or a plain number of seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(float(number) * UNIT_SECONDS[unit] for number, unit in parts)
+
+
+def header_number(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """A bucket of capacity units refilled continuously at rate units per second."""
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount units are available. Amounts above capacity wait for a full bucket."""
+        self.refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0
+
+    def take(self, amount, now):
+        self.refill(now)
+        # The level may go negative; the debt is paid back before the next caller proceeds
+        self.level -= amount
+
+    def update(self, limit, remaining, reset, now):
+        """Adopt the limit and remaining budget reported by the provider."""
+        if limit:
+            self.capacity = limit
+        if remaining is None:
+            return
+        self.level = min(remaining, self.capacity)
+        self.updated = now
+        # The budget is back to the limit after reset seconds
+        if reset and remaining < self.capacity:
+            self.rate = (self.capacity - remaining) / reset
+
+
+class QuotaLimiter:
+    """
+    Keeps LLM calls within the provider's request and token quotas. Each call reserves one
+    request and its estimated tokens before it is sent; the x-ratelimit-* headers of every
+    response then replace the local token estimate with the provider's own view of the
+    budget. Groq reports requests per day in its headers, so they bound calls as a separate
+    daily budget next to the configured requests per minute. Safe to share between event loops.
+    """
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 logger=None):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        # Created from the first response that reports a daily request quota
+        self.daily_requests = None
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.blocked_until = 0
+
+    def reserve(self, tokens):
+        """Take one request and tokens from the budget, or return the seconds to wait first."""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.request_wait(now), self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1, now)
+            self.tokens.take(tokens, now)
+            if self.daily_requests:
+                self.daily_requests.take(1, now)
+            return 0
+
+    def request_wait(self, now):
+        wait = max(self.blocked_until - now, self.requests.wait_time(1, now))
+        if self.daily_requests:
+            wait = max(wait, self.daily_requests.wait_time(1, now))
+        return wait
+
+    async def acquire(self, tokens=0):
+        """Wait until one request of about tokens tokens fits in the quota, then reserve it."""
+        waited = 0
+        while True:
+            wait = self.reserve(tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait + WAIT_PADDING)
+            waited += wait
+        if waited and self.logger:
+            self.logger.info(f"Waited {waited:.2f}s for the LLM rate limit")
+        return waited
+
+    async def wait_ready(self):
+        """Wait until a request could be sent, without reserving it."""
+        while True:
+            with self.lock:
+                wait = self.request_wait(time.monotonic())
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait + WAIT_PADDING)
+
+    def update_from_headers(self, headers):
+        """
+        Refresh the token budget from the x-ratelimit-*-tokens headers and the daily request
+        budget from the x-ratelimit-*-requests headers. The per-minute request budget keeps
+        its configured size.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens.update(*self.header_quota(headers, "tokens"), now)
+            limit, remaining, reset = self.header_quota(headers, "requests")
+            if limit and self.daily_requests is None:
+                self.daily_requests = TokenBucket(limit, limit / 86400)
+            if self.daily_requests:
+                self.daily_requests.update(limit, remaining, reset, now)
+
+    @staticmethod
+    def header_quota(headers, name):
+        return (
+            header_number(headers, f"x-ratelimit-limit-{name}"),
+            header_number(headers, f"x-ratelimit-remaining-{name}"),
+            parse_duration(headers.get(f"x-ratelimit-reset-{name}")),
+        )
+
+    def penalize(self, retry_after):
+        """Hold every call back after the provider rejected one with a 429."""
+        retry_after = retry_after if retry_after is not None else 1
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        if self.logger:
+            self.logger.warning(f"LLM rate limit reached, pausing calls for {retry_after:.2f}s")
+
+
+class RequestCoalescer:
+    """
+    Merges calls made with the same key into batches. The first call of a key opens a batch
+    that stays open for window seconds, and then for as long as the quota has no room for
+    another request, so bursts arriving while the limit is reached leave in one call.
+    handler(key, items) returns one result per item. Callers cancelled while they wait
+    are dropped from the batch before it is sent.
+    """
+    def __init__(self, handler, limiter=None, window=0.05, max_batch=16):
+        self.handler = handler
+        self.limiter = limiter
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = {}
+        self.tasks = set()
+
+    async def submit(self, key, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.get((loop, key))
+        if batch is None:
+            batch = self.pending[(loop, key)] = []
+            task = loop.create_task(self.flush(loop, key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        batch.append((item, future))
+        return await future
+
+    async def flush(self, loop, key):
+        await asyncio.sleep(self.window)
+        if self.limiter:
+            await self.limiter.wait_ready()
+        batch = self.pending.pop((loop, key))
+        waiting = [(item, future) for item, future in batch if not future.done()]
+        for start in range(0, len(waiting), self.max_batch):
+            chunk = [(item, future) for item, future in waiting[start:start + self.max_batch] if not future.done()]
+            if not chunk:
+                continue
+            try:
+                results = await self.handler(key, [item for item, _ in chunk])
+            except Exception as error:
+                for _, future in chunk:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            results = list(results)
+            for index, (_, future) in enumerate(chunk):
+                if future.done():
+                    continue
+                if index < len(results):
+                    future.set_result(results[index])
+                else:
+                    future.set_exception(RuntimeError(
+                        f"Batch handler returned {len(results)} results for {len(chunk)} items"
+                    ))
@@ -0,0 +1,151 @@
+import sys
+from array import array
+
+
+class Record:
+    """
+    Base of the slotted records used for summaries and planned moves. Slots avoid a
+    per-instance __dict__, and dict-style reads (record["summary"], record.get(...),
+    dict(record)) keep working where the records replaced plain dicts.
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class FileSummary(Record):
+    __slots__ = ("file_path", "summary")
+    FIELDS = __slots__
+
+    def __init__(self, file_path, summary):
+        self.file_path = file_path
+        self.summary = summary
+
+
+class PathTable:
+    """
+    Directory paths stored as (parent, segment) nodes, so shared prefixes are stored once
+    and repeated segment names are interned. Node 0 is the root.
+    """
+    __slots__ = ("parents", "segments", "index")
+
+    def __init__(self):
+        self.parents = array("l", [-1])
+        self.segments = [""]
+        self.index = {}
+
+    def intern(self, path):
+        """Return the node of a relative directory path, adding missing nodes."""
+        node = 0
+        for segment in path.split("/"):
+            if not segment or segment == ".":
+                continue
+            child = self.index.get((node, segment))
+            if child is None:
+                child = self.index[(node, segment)] = len(self.segments)
+                self.parents.append(node)
+                self.segments.append(sys.intern(segment))
+            node = child
+        return node
+
+    def parts(self, node):
+        parts = []
+        while node > 0:
+            parts.append(self.segments[node])
+            node = self.parents[node]
+        parts.reverse()
+        return parts
+
+    def path(self, node):
+        return "/".join(self.parts(node))
+
+    def __len__(self):
+        return len(self.segments)
+
+
+class PlannedMove(Record):
+    """A file move of a batch plan; the destination directory is a PathTable node."""
+    __slots__ = ("paths", "src_path", "directory", "name", "summary", "duplicate_of")
+    FIELDS = ("src_path", "dst_path", "summary", "duplicate_of")
+
+    def __init__(self, paths, src_path, directory, name, summary, duplicate_of=None):
+        self.paths = paths
+        self.src_path = src_path
+        self.directory = directory
+        self.name = name
+        self.summary = summary
+        self.duplicate_of = duplicate_of
+
+    @property
+    def dst_path(self):
+        directory = self.paths.path(self.directory)
+        return f"{directory}/{self.name}" if directory else self.name
+
+    def to_dict(self):
+        data = {"src_path": self.src_path, "dst_path": self.dst_path, "summary": self.summary}
+        if self.duplicate_of:
+            data["duplicate_of"] = self.duplicate_of
+        return data
+
+
+class MovePlan:
+    """
+    The moves of a batch. Plans of a million files stay compact: each move is a slotted
+    record and destination directories are shared PathTable nodes. JSON shapes are only
+    produced when the plan is sent to a client.
+    """
+    __slots__ = ("paths", "moves")
+
+    def __init__(self):
+        self.paths = PathTable()
+        self.moves = []
+
+    def add(self, src_path, dst_path, summary, duplicate_of=None):
+        directory, _, name = dst_path.strip("/").rpartition("/")
+        move = PlannedMove(self.paths, src_path, self.paths.intern(directory), name, summary, duplicate_of)
+        self.moves.append(move)
+        return move
+
+    def children(self):
+        """Map each directory node to its child directory nodes, in order of appearance."""
+        children = {}
+        for node in range(1, len(self.paths)):
+            children.setdefault(self.paths.parents[node], []).append(node)
+        return children
+
+    def files_by_directory(self):
+        """Map each directory node to the indexes of the moves into it, in plan order."""
+        files = {}
+        for index, move in enumerate(self.moves):
+            files.setdefault(move.directory, array("l")).append(index)
+        return files
+
+    def __iter__(self):
+        return iter(self.moves)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __getitem__(self, index):
+        return self.moves[index]
@@ -0,0 +1,281 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+EMBEDDING_MODEL = "nomic-embed-text"
+EMBEDDING_BATCH_SIZE = 64
+LSH_TABLES = 8
+LSH_BITS = 12
+# Up to this many matching documents are all scored; larger sets are narrowed by LSH first
+EXACT_SEARCH_LIMIT = 5000
+QUERY_CACHE_SIZE = 256
+# SQLite's default limit on bound parameters is 999
+SQL_CHUNK = 900
+
+# Indexing tasks run in the background; references are kept until they finish
+background_tasks = set()
+
+
+def parse_date(value):
+    """Parse a unix timestamp or an ISO date (2024-05-01) / datetime into a timestamp."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def schedule_indexing(index, entries, logger):
+    """Index entries on a worker thread without waiting for them; failures are logged."""
+    task = asyncio.ensure_future(asyncio.to_thread(index.add, entries))
+    background_tasks.add(task)
+
+    def done(task):
+        background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Failed to index {len(entries)} summaries for search: {task.exception()}")
+
+    task.add_done_callback(done)
+    return task
+
+
+class SummaryIndex:
+    """
+    On-disk semantic index of file summaries. Each summary's embedding is stored as a unit
+    vector next to the file's metadata in SQLite. Random-hyperplane LSH buckets, also in
+    SQLite, pick the candidates that are scored exactly, so a query never loads the whole
+    index into memory.
+    """
+    def __init__(self, db_path, embeddings=None, n_tables=LSH_TABLES, n_bits=LSH_BITS, seed=0, logger=None):
+        self.db_path = db_path
+        self._embeddings = embeddings
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+        self.logger = logger
+        self.hyperplanes = None
+        self.lock = threading.Lock()
+        self.client_lock = threading.Lock()
+        self.query_cache = OrderedDict()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "path TEXT NOT NULL UNIQUE, "
+            "category TEXT, "
+            "size INTEGER, "
+            "modified REAL, "
+            "summary TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "indexed_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS documents_category ON documents (category);"
+            "CREATE INDEX IF NOT EXISTS documents_modified ON documents (modified);"
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "table_no INTEGER NOT NULL, "
+            "bucket INTEGER NOT NULL, "
+            "doc_id INTEGER NOT NULL, "
+            "PRIMARY KEY (table_no, bucket, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS buckets_doc ON buckets (doc_id);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+        )
+        self.conn.commit()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'dimension'").fetchone()
+        if row:
+            self.hyperplanes = self.make_hyperplanes(int(row[0]))
+
+    @property
+    def embeddings(self):
+        """Local Ollama embedding client, constructed on first use."""
+        if self._embeddings is None:
+            with self.client_lock:
+                if self._embeddings is None:
+                    from langchain_community.embeddings import OllamaEmbeddings
+                    options = {"base_url": os.getenv("OLLAMA_BASE_URL")} if os.getenv("OLLAMA_BASE_URL") else {}
+                    self._embeddings = OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL", EMBEDDING_MODEL), **options)
+        return self._embeddings
+
+    def make_hyperplanes(self, dimension):
+        rng = np.random.default_rng(self.seed)
+        return rng.standard_normal((self.n_tables * self.n_bits, dimension)).astype(np.float32)
+
+    def bucket_keys(self, vectors):
+        """LSH bucket of each vector in each table, shape (len(vectors), n_tables)."""
+        bits = (vectors @ self.hyperplanes.T > 0).reshape(len(vectors), self.n_tables, self.n_bits)
+        return bits.astype(np.int64) @ (1 << np.arange(self.n_bits, dtype=np.int64))
+
+    @staticmethod
+    def normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add(self, entries):
+        """Index (path, summary, category) entries, replacing earlier entries of the same paths."""
+        entries = [(path, summary, category) for path, summary, category in entries if summary]
+        for start in range(0, len(entries), EMBEDDING_BATCH_SIZE):
+            batch = entries[start:start + EMBEDDING_BATCH_SIZE]
+            vectors = self.normalize(self.embeddings.embed_documents([summary for _, summary, _ in batch]))
+            with self.lock:
+                self._ensure_dimension(vectors.shape[1])
+                keys = self.bucket_keys(vectors)
+                for (path, summary, category), vector, doc_keys in zip(batch, vectors, keys):
+                    self._upsert(path, summary, category, vector, doc_keys)
+                self.conn.commit()
+
+    def _ensure_dimension(self, dimension):
+        if self.hyperplanes is not None and self.hyperplanes.shape[1] == dimension:
+            return
+        if self.hyperplanes is not None:
+            # A different embedding model was configured; old vectors cannot be compared
+            if self.logger:
+                self.logger.warning(f"Embedding dimension changed to {dimension}, clearing the search index")
+            self.conn.execute("DELETE FROM buckets")
+            self.conn.execute("DELETE FROM documents")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dimension', ?)", (str(dimension),))
+        self.hyperplanes = self.make_hyperplanes(dimension)
+
+    def _upsert(self, path, summary, category, vector, doc_keys):
+        try:
+            stat = os.stat(path)
+            size, modified = stat.st_size, stat.st_mtime
+        except OSError:
+            size = modified = None
+        row = self.conn.execute("SELECT id FROM documents WHERE path = ?", (path,)).fetchone()
+        values = (category, size, modified, summary, vector.tobytes(), time.time())
+        if row:
+            doc_id = row[0]
+            self.conn.execute(
+                "UPDATE documents SET category = ?, size = ?, modified = ?, summary = ?, vector = ?, indexed_at = ? "
+                "WHERE id = ?", values + (doc_id,),
+            )
+            self.conn.execute("DELETE FROM buckets WHERE doc_id = ?", (doc_id,))
+        else:
+            doc_id = self.conn.execute(
+                "INSERT INTO documents (path, category, size, modified, summary, vector, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (path,) + values,
+            ).lastrowid
+        self.conn.executemany(
+            "INSERT INTO buckets (table_no, bucket, doc_id) VALUES (?, ?, ?)",
+            [(table_no, int(key), doc_id) for table_no, key in enumerate(doc_keys)],
+        )
+
+    def move(self, src_path, dst_path):
+        """Follow a committed move of a file, or of a directory and everything below it."""
+        src_path, dst_path = src_path.rstrip(os.sep), dst_path.rstrip(os.sep)
+        prefix = src_path + os.sep
+        with self.lock:
+            self.conn.execute("UPDATE documents SET path = ? WHERE path = ?", (dst_path, src_path))
+            self.conn.execute(
+                "UPDATE documents SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+                (dst_path, len(src_path) + 1, len(prefix), prefix),
+            )
+            self.conn.commit()
+
+    def embed_query(self, query):
+        with self.lock:
+            vector = self.query_cache.get(query)
+            if vector is not None:
+                self.query_cache.move_to_end(query)
+                return vector
+        vector = self.normalize(self.embeddings.embed_query(query))
+        with self.lock:
+            self.query_cache[query] = vector
+            if len(self.query_cache) > QUERY_CACHE_SIZE:
+                self.query_cache.popitem(last=False)
+        return vector
+
+    def search(self, query, k=10, category=None, modified_after=None, modified_before=None,
+               min_size=None, max_size=None, path_prefix=None):
+        """Return the k summaries closest to query that match every given metadata filter."""
+        vector = self.embed_query(query)
+        conditions, params = [], []
+        for clause, value in (
+            ("category = ?", category),
+            ("modified >= ?", parse_date(modified_after)),
+            ("modified <= ?", parse_date(modified_before)),
+            ("size >= ?", min_size),
+            ("size <= ?", max_size),
+        ):
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        if path_prefix:
+            conditions.append("substr(path, 1, ?) = ?")
+            params.extend([len(path_prefix), path_prefix])
+        where = " AND ".join(conditions) or "1"
+
+        with self.lock:
+            if self.hyperplanes is None or self.hyperplanes.shape[1] != vector.shape[0]:
+                return []
+            matching = self.conn.execute(f"SELECT COUNT(*) FROM documents WHERE {where}", params).fetchone()[0]
+            if matching <= EXACT_SEARCH_LIMIT:
+                rows = self.conn.execute(f"SELECT id, vector FROM documents WHERE {where}", params).fetchall()
+            else:
+                rows = []
+                candidates = self._candidates(vector)
+                for start in range(0, len(candidates), SQL_CHUNK):
+                    chunk = candidates[start:start + SQL_CHUNK]
+                    rows.extend(self.conn.execute(
+                        f"SELECT id, vector FROM documents WHERE id IN ({','.join('?' * len(chunk))}) AND {where}",
+                        chunk + params,
+                    ))
+            if not rows:
+                return []
+
+            ids = np.array([row[0] for row in rows])
+            matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+            scores = matrix @ vector
+            top = np.argsort(-scores)[:k] if len(rows) <= k else np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top])]
+            by_id = {
+                row[0]: row for row in self.conn.execute(
+                    f"SELECT id, path, category, size, modified, summary FROM documents "
+                    f"WHERE id IN ({','.join('?' * len(top))})",
+                    [int(ids[i]) for i in top],
+                )
+            }
+        results = []
+        for i in top:
+            _, path, doc_category, size, modified, summary = by_id[int(ids[i])]
+            results.append({
+                "path": path,
+                "summary": summary,
+                "category": doc_category,
+                "size": size,
+                "lastModified": (
+                    datetime.fromtimestamp(modified).strftime("%Y-%m-%d %H:%M:%S") if modified is not None else None
+                ),
+                "score": round(float(scores[i]), 4),
+            })
+        return results
+
+    def _candidates(self, vector):
+        """Documents sharing a bucket with the query, or a bucket one bit away, in any table."""
+        keys = self.bucket_keys(vector[np.newaxis, :])[0]
+        probes = [(1 << bit) for bit in range(self.n_bits)]
+        candidates = set()
+        for table_no, key in enumerate(int(key) for key in keys):
+            buckets = [key] + [key ^ probe for probe in probes]
+            candidates.update(doc_id for (doc_id,) in self.conn.execute(
+                f"SELECT doc_id FROM buckets WHERE table_no = ? AND bucket IN ({','.join('?' * len(buckets))})",
+                [table_no] + buckets,
+            ))
+        return list(candidates)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,19 +1,24 @@
 import asyncio
+import csv
+import io
 import json
 import os
 import warnings
 import base64
+import threading
 from collections import defaultdict
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_community.chat_models import ChatOllama
-from langchain_core.documents import Document
-from langchain_community.document_loaders import (
-    PyMuPDFLoader,
-    AzureAIDocumentIntelligenceLoader,
-)
 from src.prompts import DOCUMENT_SUMMARY_PROMPT, IMAGE_SUMMARY_PROMPT
-import pandas as pd
+from src.dedup import find_duplicates
+from src.code_outline import build_code_outline, outline_code
+from src.image_meta import describe_image, downscaled_base64
+from src.archives import ARCHIVE_EXTENSIONS, inspect_archive, render_archive_listing
+from src.compaction import TokenUsage, truncate_to_tokens
+from src.records import FileSummary
+from src.metrics import record_tokens, track
+
+# langchain loaders, ChatOllama and pandas are imported where they are first used so the
+# backend can start serving before they are loaded.
 
 warnings.filterwarnings("ignore")
 load_dotenv()
@@ -26,15 +31,44 @@ SUPPORTED_EXTENSIONS = {
     "csv": {"csv"},
     "json": {"json", "geojson"},
     "misc": {"txt", "sh", "log", "md", "yaml", "yml", "xml"},
+    "archives": ARCHIVE_EXTENSIONS,
 }
+# Archive members of these categories can be extracted from a bounded prefix of their content
+ARCHIVE_SAMPLE_CATEGORIES = ("coding_files", "csv", "json", "misc")
+ARCHIVE_SAMPLE_TOKENS = 400
 
 
 class FileSummarizer:
-    def __init__(self, base_path, azure_api_key, tessdata_prefix=None):
+    def __init__(self, base_path, azure_api_key, tessdata_prefix=None, deduplicate=True, describe_images=True):
         self.base_path = base_path
         self.azure_api_key = azure_api_key
+        self.deduplicate = deduplicate
+        # Photos, screenshots and scans are described from their metadata instead of by llava
+        self.describe_images = describe_images
+        self.ollama_options = {"base_url": os.getenv("OLLAMA_BASE_URL")} if os.getenv("OLLAMA_BASE_URL") else {}
+        self.chat_clients = {}
+        self.client_lock = threading.Lock()
         if tessdata_prefix:
             os.environ["TESSDATA_PREFIX"] = tessdata_prefix
+
+    def get_chat(self, model):
+        """Return the ChatOllama client for model, constructing it on first use."""
+        chat = self.chat_clients.get(model)
+        if chat is None:
+            with self.client_lock:
+                chat = self.chat_clients.get(model)
+                if chat is None:
+                    from langchain_community.chat_models import ChatOllama
+                    chat = self.chat_clients[model] = ChatOllama(model=model, **self.ollama_options)
+        return chat
+
+    def warm_up(self):
+        """Load extractors and LLM clients ahead of the first request."""
+        import pandas  # noqa: F401
+        from langchain_core.documents import Document  # noqa: F401
+        from langchain_community.document_loaders import PyMuPDFLoader, AzureAIDocumentIntelligenceLoader  # noqa: F401
+        for model in ("llava", "llama3.2"):
+            self.get_chat(model)
     
     def get_file_category(self, file_path):
         ext = os.path.splitext(file_path)[1][1:].lower()
@@ -43,11 +77,12 @@ class FileSummarizer:
                 return category
         return None
     
-    def categorize_files(self):
+    def categorize_files(self, base_path=None):
+        base_path = base_path or self.base_path
         files = [
             f
-            for f in os.listdir(self.base_path)
-            if os.path.isfile(os.path.join(self.base_path, f))
+            for f in os.listdir(base_path)
+            if os.path.isfile(os.path.join(base_path, f))
         ]
         file_extensions = [(os.path.splitext(f)[1][1:].lower(), f) for f in files]
 
@@ -68,12 +103,16 @@ class FileSummarizer:
 
     def preprocess_csv(self, file_path):
         """Extract headers from CSV."""
+        import pandas as pd
         df = pd.read_csv(file_path)
         headers = df.columns
         return ", ".join(headers)
 
     def encode_image(self, image_path):
-        """Encode image as base64."""
+        """Encode image as base64, downscaled for llava when it can be decoded."""
+        downscaled = downscaled_base64(image_path)
+        if downscaled:
+            return downscaled
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode("utf-8")
 
@@ -82,14 +121,16 @@ class FileSummarizer:
         if category == "images":
             return self.encode_image(file_path)
         elif category == "pdfs":
+            from langchain_community.document_loaders import PyMuPDFLoader
             loader = PyMuPDFLoader(file_path)
             pages = loader.load()
             content = [page.page_content for page in pages[:5] if page.page_content.strip()]
             return "\n\n".join(content) if content else "No meaningful content found in the PDF."
         elif category == "coding_files":
-            with open(file_path, "r") as file:
-                return file.read()
+            # Large sources are reduced to an outline of their imports and signatures
+            return build_code_outline(file_path)
         elif category == "microsoft_files":
+            from langchain_community.document_loaders import AzureAIDocumentIntelligenceLoader
             loader = AzureAIDocumentIntelligenceLoader(
                 api_endpoint="https://cortexfs.cognitiveservices.azure.com/",
                 api_key=self.azure_api_key,
@@ -107,66 +148,176 @@ class FileSummarizer:
         elif category == "misc":
             with open(file_path, "r") as file:
                 return file.read()
+        elif category == "archives":
+            return self.describe_archive(file_path)
         return None
 
-    def load_documents(self):
-        categorized_files, unsupported_files = self.categorize_files()
-        documents = []
+    def describe_archive(self, file_path):
+        """
+        List an archive and extract a few sampled members in memory, without writing anything
+        to disk. A damaged or incomplete archive is described by its name only.
+        """
+        archive_name = os.path.basename(file_path)
+        sample_extensions = set().union(*(SUPPORTED_EXTENSIONS[c] for c in ARCHIVE_SAMPLE_CATEGORIES))
+        try:
+            listing = inspect_archive(file_path, sample_extensions)
+        except Exception as e:
+            return f'Archive "{archive_name}" could not be read ({type(e).__name__}: {e}); only its name is known.'
+        samples = []
+        for name, data in listing.samples:
+            content = self.extract_sample(name, data)
+            if content:
+                samples.append((name, truncate_to_tokens(content, ARCHIVE_SAMPLE_TOKENS)))
+        return render_archive_listing(listing, archive_name, samples)
 
-        for category, files in categorized_files.items():
-            for fname in files:
-                full_path = os.path.join(self.base_path, fname)
-                content = self.process_file(full_path, category)
-                if(isinstance(content, dict)):
-                    content = json.dumps(content, indent=4)
+    def extract_sample(self, name, data):
+        """Extract a sampled archive member from its bytes, as process_file does for the same category on disk."""
+        text = data.decode("utf-8", errors="replace")
+        category = self.get_file_category(name)
+        if category == "coding_files":
+            return outline_code(text, os.path.basename(name))
+        elif category == "csv":
+            return ", ".join(next(csv.reader(io.StringIO(text)), []))
+        elif category == "json":
+            try:
+                return json.dumps(json.loads(text))
+            except ValueError:
+                # e.g. JSON cut off by the bounded read
+                return text
+        return text
+
+    def plan_documents(self, base_path=None):
+        """
+        Scan base_path and decide which files to load. Returns a list of
+        (file_name, category, duplicates) entries and the unsupported file names.
+        """
+        base_path = base_path or self.base_path
+        with track("scan"):
+            categorized_files, unsupported_files = self.categorize_files(base_path)
+
+        # Duplicates are not extracted or summarized, they share the representative's document
+        with track("dedup"):
+            duplicates = find_duplicates(base_path, categorized_files) if self.deduplicate else {}
+        skipped = {fname for copies in duplicates.values() for fname in copies}
+
+        planned = [
+            (fname, category, duplicates.get(fname, []))
+            for category, files in categorized_files.items()
+            for fname in files
+            if fname not in skipped
+        ]
+        return planned, unsupported_files
+
+    def load_document(self, base_path, fname, category, duplicates=None):
+        """Extract a single file into a Document, or return None when it has no content."""
+        from langchain_core.documents import Document
+        full_path = os.path.join(base_path, fname)
+        metadata = {"file_name": fname, "source": base_path, "category": category}
+        with track("extract", span_attrs={"file": fname}, category=category):
+            content = None
+            if category == "images" and self.describe_images:
+                kind, content = describe_image(full_path)
                 if content:
-                    documents.append(
-                        Document(
-                            page_content=content,
-                            metadata={"file_name": fname, "source": self.base_path, "category": category},
-                        )
-                    )
+                    metadata["image_kind"] = kind
+            if not content:
+                content = self.process_file(full_path, category)
+        if content is not None and not isinstance(content, str):
+            # Parsed JSON files can be any JSON value, e.g. a top-level list
+            content = json.dumps(content, indent=4)
+        if not content:
+            return None
+        if duplicates:
+            metadata["duplicates"] = duplicates
+        return Document(page_content=content, metadata=metadata)
+
+    def load_documents(self, base_path=None, failed_files=None):
+        """
+        Load the supported files of base_path as documents. base_path defaults to the
+        summarizer's base_path; pass it explicitly when the summarizer is shared between requests.
+        With a failed_files list, a file that cannot be extracted is added to it as
+        {"file": ..., "error": ...}, together with its duplicates, instead of failing the batch.
+        """
+        base_path = base_path or self.base_path
+        planned, unsupported_files = self.plan_documents(base_path)
+        documents = []
+        for fname, category, duplicates in planned:
+            try:
+                document = self.load_document(base_path, fname, category, duplicates)
+            except Exception as e:
+                if failed_files is None:
+                    raise
+                add_failed_file(failed_files, fname, duplicates, e)
+                continue
+            if document:
+                documents.append(document)
 
         return documents, unsupported_files
 
-    async def summarize_documents(self, documents):
+    async def summarize_documents(self, documents, failed_files=None):
+        """
+        Summarize documents concurrently. With a failed_files list, documents that cannot be
+        summarized are added to it, as in load_documents, and left out of the summaries.
+        """
         tasks = [self.summarize_document(doc) for doc in documents]
-        return await asyncio.gather(*tasks)
+        if failed_files is None:
+            return await asyncio.gather(*tasks)
+        summaries = []
+        for doc, result in zip(documents, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, Exception):
+                add_failed_file(failed_files, doc.metadata["file_name"], doc.metadata.get("duplicates"), result)
+            else:
+                summaries.append(result)
+        return summaries
 
     async def summarize_document(self, doc):
+        if doc.metadata.get("image_kind"):
+            # Already described from its metadata, no model call needed
+            return FileSummary(doc.metadata["file_name"], doc.page_content)
         if doc.metadata["category"] == "images":
             return await self.summarize_image(doc)
         else:
             return await self.summarize_text_document(doc)
 
     async def summarize_image(self, doc):
-        chat = ChatOllama(model="llava")
+        from langchain_core.messages import HumanMessage
+        chat = self.get_chat("llava")
         image_url = f"data:image/jpeg;base64,{doc.page_content}"
-        msg = await chat.ainvoke(
-            [
-                HumanMessage(
-                    content=[
-                        {"type": "text", "text": f"{doc.metadata['file_name']}" + "\n" + IMAGE_SUMMARY_PROMPT},
-                        {"type": "image_url", "image_url": image_url},
-                    ]
-                )
-            ]
-        )
-        return {"file_path": doc.metadata["file_name"], "summary": msg.content}
+        with track("summarize", span_attrs={"file": doc.metadata["file_name"]}, model="llava"):
+            msg = await chat.ainvoke(
+                [
+                    HumanMessage(
+                        content=[
+                            {"type": "text", "text": f"{doc.metadata['file_name']}" + "\n" + IMAGE_SUMMARY_PROMPT},
+                            {"type": "image_url", "image_url": image_url},
+                        ]
+                    )
+                ]
+            )
+        record_tokens("summarize_image", *TokenUsage.usage_from_message(msg))
+        return FileSummary(doc.metadata["file_name"], msg.content)
 
     async def summarize_text_document(self, doc):
-        chat = ChatOllama(model="llama3.2")
-        msg = await chat.ainvoke(
-            [
-                SystemMessage(content=[{"type": "text", "text": DOCUMENT_SUMMARY_PROMPT}]),
-                HumanMessage(
-                    content=[
-                        {"type": "text", "text": json.dumps({"text": doc.page_content, "category": doc.metadata["category"]})},
-                    ]
-                ),
-            ]
-        )
-        return {"file_path": doc.metadata["file_name"], "summary": msg.content}
+        from langchain_core.messages import HumanMessage, SystemMessage
+        chat = self.get_chat("llama3.2")
+        with track("summarize", span_attrs={"file": doc.metadata["file_name"]}, model="llama3.2"):
+            msg = await chat.ainvoke(
+                [
+                    SystemMessage(content=[{"type": "text", "text": DOCUMENT_SUMMARY_PROMPT}]),
+                    HumanMessage(
+                        content=[
+                            {"type": "text", "text": json.dumps({"text": doc.page_content, "category": doc.metadata["category"]})},
+                        ]
+                    ),
+                ]
+            )
+        record_tokens("summarize_text", *TokenUsage.usage_from_message(msg))
+        return FileSummary(doc.metadata["file_name"], msg.content)
+
+
+def add_failed_file(failed_files, fname, duplicates, error):
+    """Record a file that could not be summarized, and its duplicates, which share its fate."""
+    failed_files.append({"file": fname, "error": str(error)})
+    failed_files.extend({"file": duplicate, "error": str(error)} for duplicate in duplicates or ())
 
 
 # Example Usage
@@ -3,8 +3,8 @@ import json
 from typing import Optional
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from langchain_core.documents import Document
-import pika
+from src.metrics import FILES_PROCESSED, QUEUE_WAIT, job, track
+from src.search import schedule_indexing
 import asyncio
 import aio_pika
 import time
@@ -16,12 +16,22 @@ class WatchdogHandler(FileSystemEventHandler):
 
     def on_created(self, event):
         self.producer.on_created(event)
-        
+
+    def on_deleted(self, event):
+        self.producer.on_removed(event.src_path)
+
+    def on_moved(self, event):
+        self.producer.on_removed(event.src_path)
+
 class FileEventProducer:
-    def __init__(self, rabbitmq_url, queue_name, organizer, summarizer, logger):
+    def __init__(self, rabbitmq_url, queue_name, organizer, summarizer, logger, history=None, trace_dir=None,
+                 search_index=None):
         self.logger = logger
         self.organizer = organizer
         self.summarizer = summarizer
+        self.history = history
+        self.search_index = search_index
+        self.trace_dir = trace_dir
         self.rabbitmq_url = rabbitmq_url
         self.queue_name = queue_name
         self.directory_to_watch = None
@@ -29,9 +39,15 @@ class FileEventProducer:
         self.connection = None
         self.channel = None
         self.event_loop = None
+        # Suggestion request of each file still in progress, by relative path
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
 
     def log_task_result(self, future):
         """Log the result of a completed task."""
+        if future.cancelled():
+            self.logger.info("Task cancelled")
+            return
         try:
             result = future.result()  # Will raise an exception if the task failed
             self.logger.info(f"Task completed successfully: {result}")
@@ -94,13 +110,14 @@ class FileEventProducer:
 
     async def _send_message(self, message):
         try:
-            await asyncio.wait_for(
-                self.channel.default_exchange.publish(
-                    aio_pika.Message(body=message.encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
-                    routing_key=self.queue_name,
-                ),
-                timeout=10,  # Set a timeout for the operation
-            )
+            with track("publish"):
+                await asyncio.wait_for(
+                    self.channel.default_exchange.publish(
+                        aio_pika.Message(body=message.encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                        routing_key=self.queue_name,
+                    ),
+                    timeout=10,  # Set a timeout for the operation
+                )
         except asyncio.TimeoutError:
             self.logger.error("Failed to send message: Operation timed out.")
 
@@ -109,24 +126,25 @@ class FileEventProducer:
         full_file_path = os.path.join(self.directory_to_watch, rel_file_path)
         category = self.summarizer.get_file_category(full_file_path)
         if category:
-            content = self.summarizer.process_file(full_file_path, category)
-            # if category is json then do json dump
-            if isinstance(content, dict):
-                content = json.dumps(content)
-            document = Document(
-                page_content=content,
-                metadata={"file_name": rel_file_path, "source": self.directory_to_watch, "category": category},
+            document = await asyncio.to_thread(
+                self.summarizer.load_document, self.directory_to_watch, rel_file_path, category
             )
+            if document is None:
+                return None
             self.logger.info("Summarizing document")
             summary = await self.summarizer.summarize_document(document)
             self.logger.info("Getting path suggestions")
-            response = self.organizer.get_path_suggestions(self.target_directory, summary)
+            response = await self.organizer.aget_path_suggestions(self.target_directory, summary)
             response["summary"] = summary.get("summary")
             response["fileName"] = rel_file_path
             response['srcPath'] = full_file_path
             response['size'] = os.path.getsize(full_file_path)
             response['downloadDate'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getctime(full_file_path)))
-            
+            if self.history:
+                self.history.remember_summary(full_file_path, response["summary"])
+            if self.search_index:
+                schedule_indexing(self.search_index, [(full_file_path, response["summary"], category)], self.logger)
+
             return response
         return None
 
@@ -139,24 +157,54 @@ class FileEventProducer:
             self.logger.info(f"File created: {file_path}")
             time.sleep(1)
             try:
-                future = asyncio.run_coroutine_threadsafe(self.process_file_async(file_path), self.event_loop)
+                future = asyncio.run_coroutine_threadsafe(self.process_file_async(file_path, queued_at=time.perf_counter()), self.event_loop)
                 future.add_done_callback(self.log_task_result)
+                self.track_request(file_path, future)
                 self.logger.info(f"Scheduled process_file_async for {file_path}")
             except Exception as e:
                 self.logger.info(f"Error scheduling process_file_async: {e}")
             # asyncio.create_task(self.process_file_async(file_path))  # Use create_task for non-blocking execution
             end_time = time.time()
             self.logger.info(f"Time taken for file processing: {end_time - start_time:.2f} seconds")
-    async def process_file_async(self, file_path):
+
+    def track_request(self, file_path, future):
+        """Remember the request of a file, cancelling an older one that is now stale."""
+        with self.in_flight_lock:
+            stale = self.in_flight.get(file_path)
+            self.in_flight[file_path] = future
+        if stale and stale.cancel():
+            self.logger.info(f"Cancelled stale suggestion request for {file_path}")
+        future.add_done_callback(lambda done: self.forget_request(file_path, done))
+
+    def forget_request(self, file_path, future):
+        with self.in_flight_lock:
+            if self.in_flight.get(file_path) is future:
+                del self.in_flight[file_path]
+
+    def on_removed(self, src_path):
+        """Callback for a file deleted or moved away; its pending suggestion is no longer wanted."""
+        if not self.directory_to_watch:
+            return
+        file_path = os.path.relpath(src_path, self.directory_to_watch)
+        with self.in_flight_lock:
+            future = self.in_flight.pop(file_path, None)
+        if future and future.cancel():
+            self.logger.info(f"Cancelled suggestion request for removed file {file_path}")
+
+    async def process_file_async(self, file_path, queued_at=None):
         """Process the file asynchronously and send suggestions."""
+        if queued_at is not None:
+            QUEUE_WAIT.observe(time.perf_counter() - queued_at, queue="watch")
         try:
-            self.logger.info(f"Started processing file: {file_path}")
-            suggestion = await self.get_suggestions(file_path)
-            if suggestion:
-                self.logger.info(f"Suggestion generated for {file_path}: {suggestion}")
-                await self.send_event(suggestion)
-            else:
-                self.logger.info(f"No suggestions found for file: {file_path}")
+            with job("watch", trace_dir=self.trace_dir, logger=self.logger):
+                self.logger.info(f"Started processing file: {file_path}")
+                suggestion = await self.get_suggestions(file_path)
+                FILES_PROCESSED.inc(pipeline="watch")
+                if suggestion:
+                    self.logger.info(f"Suggestion generated for {file_path}: {suggestion}")
+                    await self.send_event(suggestion)
+                else:
+                    self.logger.info(f"No suggestions found for file: {file_path}")
         except Exception as e:
             self.logger.error(f"Error in process_file_async for {file_path}: {e}")
 
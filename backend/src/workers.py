@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+import aio_pika
+from dotenv import load_dotenv
+
+from src.metrics import QUEUE_WAIT, track
+from src.records import FileSummary
+
+TASK_QUEUE = "summarize-tasks"
+
+
+class DistributedSummarizer:
+    """
+    Fans per-file extract+summarize tasks out to a durable RabbitMQ work queue and collects
+    the results from an exclusive callback queue. Any number of SummarizationWorker
+    processes, on this host or others, consume the work queue. Workers read the files by
+    path, so every worker host must see the batch directory under the same path.
+
+    A task may wait queue_timeout seconds for a worker, after which RabbitMQ drops it, and
+    then gets task_timeout seconds from the moment a worker reports that it started.
+    """
+    def __init__(self, rabbitmq_url, summarizer, logger, task_queue=TASK_QUEUE, task_timeout=600,
+                 queue_timeout=3600):
+        self.rabbitmq_url = rabbitmq_url
+        self.summarizer = summarizer
+        self.logger = logger
+        self.task_queue = task_queue
+        self.task_timeout = task_timeout
+        self.queue_timeout = queue_timeout
+        self.connection = None
+        self.channel = None
+        self.callback_queue = None
+        self.pending = {}
+        self.connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connect_lock:
+            if self.channel and not self.channel.is_closed:
+                return
+            self.connection = await aio_pika.connect_robust(self.rabbitmq_url)
+            self.channel = await self.connection.channel()
+            await self.channel.declare_queue(self.task_queue, durable=True)
+            self.callback_queue = await self.channel.declare_queue(exclusive=True, auto_delete=True)
+            await self.callback_queue.consume(self.on_result, no_ack=True)
+            self.logger.info(f"Distributing summarization tasks over queue '{self.task_queue}'")
+
+    async def on_result(self, message):
+        futures = self.pending.get(message.correlation_id)
+        if futures is None:
+            return
+        started, result = futures
+        body = json.loads(message.body)
+        if not started.done():
+            started.set_result(True)
+        if body.get("status") != "started" and not result.done():
+            result.set_result(body)
+
+    async def submit(self, base_path, fname, category, duplicates):
+        correlation_id = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        started, result = loop.create_future(), loop.create_future()
+        self.pending[correlation_id] = (started, result)
+        queued_at = time.time()
+        task = {
+            "base_path": base_path,
+            "file_name": fname,
+            "category": category,
+            "duplicates": duplicates,
+            "queued_at": queued_at,
+            # Workers skip tasks the dispatcher has stopped waiting for
+            "expires_at": queued_at + self.queue_timeout,
+            "timeout": self.task_timeout,
+        }
+        await self.channel.default_exchange.publish(
+            aio_pika.Message(
+                body=json.dumps(task).encode(),
+                correlation_id=correlation_id,
+                reply_to=self.callback_queue.name,
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                expiration=self.queue_timeout,
+            ),
+            routing_key=self.task_queue,
+        )
+        try:
+            try:
+                await asyncio.wait_for(started, timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.logger.error(f"No worker picked up {fname} within {self.queue_timeout} seconds")
+                return {"file_name": fname, "error": f"not picked up by a worker within {self.queue_timeout} seconds"}
+            try:
+                return await asyncio.wait_for(result, timeout=self.task_timeout)
+            except asyncio.TimeoutError:
+                self.logger.error(f"Summarization task for {fname} timed out after {self.task_timeout} seconds")
+                return {"file_name": fname, "error": f"timed out after {self.task_timeout} seconds"}
+        finally:
+            self.pending.pop(correlation_id, None)
+
+    async def summarize(self, base_path):
+        """
+        Plan the batch locally, summarize every file on the workers and aggregate the results.
+        Returns (summaries, duplicates, unsupported_files, failed_files), where failed_files
+        lists {"file": ..., "error": ...} for files that failed or timed out on the workers.
+        """
+        await self.connect()
+        planned, unsupported_files = await asyncio.to_thread(self.summarizer.plan_documents, base_path)
+        with track("distribute"):
+            results = await asyncio.gather(*(
+                self.submit(base_path, fname, category, duplicates)
+                for fname, category, duplicates in planned
+            ))
+
+        summaries = []
+        duplicates = {}
+        failed_files = []
+        for (fname, _, file_duplicates), result in zip(planned, results):
+            if result.get("error"):
+                self.logger.error(f"Failed to summarize {fname} on a worker: {result['error']}")
+                failed_files.append({"file": fname, "error": result["error"]})
+                failed_files.extend({"file": duplicate, "error": result["error"]} for duplicate in file_duplicates or ())
+                continue
+            if result.get("summary") is None:
+                # The file had no content to summarize
+                continue
+            summaries.append(FileSummary(fname, result["summary"]))
+            if file_duplicates:
+                duplicates[fname] = file_duplicates
+        return summaries, duplicates, unsupported_files, failed_files
+
+    async def close(self):
+        if self.connection:
+            await self.connection.close()
+
+
+class SummarizationWorker:
+    """
+    Consumes extract+summarize tasks from the work queue. The prefetch count bounds how many
+    tasks a worker holds at once, so RabbitMQ hands new tasks to whichever worker has room.
+    """
+    def __init__(self, rabbitmq_url, summarizer, logger, task_queue=TASK_QUEUE, prefetch=4):
+        self.rabbitmq_url = rabbitmq_url
+        self.summarizer = summarizer
+        self.logger = logger
+        self.task_queue = task_queue
+        self.prefetch = prefetch
+        self.connection = None
+        self.channel = None
+
+    async def run(self):
+        self.connection = await aio_pika.connect_robust(self.rabbitmq_url)
+        self.channel = await self.connection.channel()
+        await self.channel.set_qos(prefetch_count=self.prefetch)
+        queue = await self.channel.declare_queue(self.task_queue, durable=True)
+        await queue.consume(self.on_task)
+        self.logger.info(f"Worker consuming '{self.task_queue}' with prefetch {self.prefetch}")
+        try:
+            await asyncio.Future()
+        finally:
+            await self.connection.close()
+
+    async def on_task(self, message):
+        try:
+            task = json.loads(message.body)
+            if not isinstance(task, dict) or "file_name" not in task:
+                raise ValueError("task has no file_name")
+        except ValueError as e:
+            # A malformed task fails the same way on every worker, so it is rejected (and
+            # dead-lettered where the queue has a dead letter exchange) instead of requeued
+            self.logger.error(f"Rejecting malformed task {message.correlation_id}: {e!r}")
+            await message.reject(requeue=False)
+            await self.reply(message, {"file_name": None, "error": f"malformed task: {e!r}"})
+            return
+        # The message is acknowledged once processed; tasks of a crashed worker are redelivered
+        async with message.process(requeue=True):
+            if task.get("expires_at") and time.time() > task["expires_at"]:
+                # The dispatcher no longer waits for this task
+                self.logger.info(f"Skipping expired task for {task['file_name']}")
+                return
+            QUEUE_WAIT.observe(max(time.time() - task.get("queued_at", time.time()), 0.0), queue=self.task_queue)
+            # The dispatcher's task timeout starts when the task is picked up, not when it was queued
+            await self.reply(message, {"file_name": task["file_name"], "status": "started"})
+            try:
+                result = await asyncio.wait_for(self.process_task(task), timeout=task.get("timeout"))
+            except asyncio.TimeoutError:
+                result = {"file_name": task["file_name"], "error": f"timed out after {task['timeout']} seconds"}
+            await self.reply(message, result)
+
+    async def reply(self, message, body):
+        if message.reply_to:
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(body=json.dumps(body).encode(), correlation_id=message.correlation_id),
+                routing_key=message.reply_to,
+            )
+
+    async def process_task(self, task):
+        fname = task["file_name"]
+        try:
+            document = await asyncio.to_thread(
+                self.summarizer.load_document, task["base_path"], fname, task["category"], task.get("duplicates")
+            )
+            if document is None:
+                return {"file_name": fname, "summary": None}
+            summary = await self.summarizer.summarize_document(document)
+            self.logger.info(f"Summarized {fname}")
+            return {"file_name": fname, "summary": summary["summary"]}
+        except Exception as e:
+            self.logger.error(f"Failed to summarize {fname}: {e}")
+            return {"file_name": fname, "error": str(e)}
+
+
+def main():
+    from src.summarizer import FileSummarizer
+
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logger = logging.getLogger("cortexfs.worker")
+    summarizer = FileSummarizer(
+        base_path=None,
+        azure_api_key=os.getenv("AZURE_API_KEY"),
+        tessdata_prefix=os.getenv("TESSDATA_PREFIX"),
+    )
+    worker = SummarizationWorker(
+        rabbitmq_url=os.getenv("RABBITMQ_URL"),
+        summarizer=summarizer,
+        logger=logger,
+        prefetch=int(os.getenv("WORKER_PREFETCH", "4")),
+    )
+    asyncio.run(worker.run())
+
+
+if __name__ == "__main__":
+    main()
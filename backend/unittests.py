@@ -1,10 +1,33 @@
 import unittest
 from unittest.mock import MagicMock, patch, call, AsyncMock
 import os
+import shutil
+import tempfile
 import asyncio
+import time
 from src.watchdog import FileEventProducer, WatchdogHandler
 from src.organizer import DirectoryOrganizer
 from src.summarizer import FileSummarizer
+from src.history import SuggestionHistory
+from src.compaction import compact_directory_listing, compact_summaries, count_tokens
+from src.dedup import Image, find_duplicates, expand_duplicate_moves
+from src.metrics import STAGE_DURATION, STAGE_ERRORS, Counter, Histogram, job, track
+from benchmarks.dataset import generate_directory
+from src.pipeline import BatchContext, BatchPipeline
+from src.fileops import FileMover, MoveCancelled, MoveJob, MoveJobStore
+from src.workers import DistributedSummarizer, SummarizationWorker
+from src.code_outline import MAX_UNOUTLINED_TOKENS, MIN_OUTLINE_CHARS, build_code_outline, outline_code, outline_source
+from src.image_meta import describe_image, inspect_image
+from src.archives import MAX_SAMPLE_BYTES, inspect_archive
+from src.records import FileSummary, MovePlan
+from src.search import SummaryIndex
+from src.ratelimit import QuotaLimiter, RequestCoalescer, parse_duration
+from src.organizer import REORGANIZATION_COMPLETION_TOKENS, BatchPathSuggestions, PathSuggestions
+from src.json_stream import ArrayObjectParser
+import io
+import tarfile
+import zipfile
+import errno
 from fastapi.testclient import TestClient
 from server import create_app
 import json
@@ -67,9 +90,9 @@ class TestFileEventProducer(unittest.TestCase):
         mock_strftime.return_value = "2024-12-01 12:00:00"
 
         self.summarizer.get_file_category.return_value = "text"
-        self.summarizer.process_file.return_value = "Content of the file"
+        self.summarizer.load_document.return_value = MagicMock()
         self.summarizer.summarize_document = AsyncMock(return_value={"summary": "Test summary"})
-        self.organizer.get_path_suggestions.return_value = {"suggestions": ["path1", "path2", "path3"]}
+        self.organizer.aget_path_suggestions = AsyncMock(return_value={"suggestions": ["path1", "path2", "path3"]})
 
         with patch("os.path.join", return_value="/path/to/file.txt"):
             suggestion = asyncio.run(self.producer.get_suggestions("file.txt"))
@@ -79,6 +102,19 @@ class TestFileEventProducer(unittest.TestCase):
         self.assertEqual(suggestion["downloadDate"], "2024-12-01 12:00:00")
         self.summarizer.summarize_document.assert_called_once()
 
+    def test_new_event_cancels_stale_request(self):
+        stale = MagicMock()
+        stale.cancel.return_value = True
+        self.producer.track_request("file.txt", stale)
+        self.producer.track_request("file.txt", MagicMock())
+        stale.cancel.assert_called_once()
+
+        self.producer.directory_to_watch = "/downloads"
+        current = self.producer.in_flight["file.txt"]
+        self.producer.on_removed("/downloads/file.txt")
+        current.cancel.assert_called_once()
+        self.assertEqual(self.producer.in_flight, {})
+
 class TestWatchdogHandler(unittest.TestCase):
     def setUp(self):
         self.producer = MagicMock()
@@ -92,8 +128,980 @@ class TestWatchdogHandler(unittest.TestCase):
         self.handler.on_created(event)
         self.producer.on_created.assert_called_once_with(event)
         
+class TestSuggestionHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.history = SuggestionHistory(os.path.join(self.tmp_dir, "history.db"))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lookup_matches_filename_prefix(self):
+        self.history.record("/downloads/invoice_2024_03.pdf", "/documents/Finance/Invoices")
+        self.history.record("/downloads/invoice_2024_04.pdf", "/documents/Finance/Invoices")
+        suggestions = self.history.lookup("invoice_2024_05.pdf", base_dir="/documents")
+        self.assertEqual(suggestions, ["/documents/Finance/Invoices"])
+
+    def test_lookup_matches_sender_from_pending_summary(self):
+        self.history.remember_summary("/downloads/letter.txt", "Letter from: Acme Corp about renewal")
+        self.history.record("/downloads/letter.txt", "/documents/Acme")
+        self.history.record("/downloads/notice.txt", "/documents/Acme", summary="Notice from: Acme Corp")
+        suggestions = self.history.lookup("scan.txt", "Notice from: Acme Corp")
+        self.assertEqual(suggestions, ["/documents/Acme"])
+
+    def test_lookup_ignores_other_base_directories(self):
+        self.history.record("/downloads/invoice_2024_03.pdf", "/documents/Finance/Invoices")
+        self.assertEqual(self.history.lookup("invoice_2024_05.pdf", base_dir="/other"), [])
+
+    def test_history_is_persisted(self):
+        self.history.record("/downloads/IMG_0001.jpg", "/documents/Photos")
+        self.history.record("/downloads/IMG_0002.jpg", "/documents/Photos")
+        reloaded = SuggestionHistory(self.history.db_path)
+        self.assertEqual(reloaded.lookup("IMG_0003.jpg"), ["/documents/Photos"])
+        reloaded.close()
+
+    def test_organizer_answers_from_history(self):
+        organizer = DirectoryOrganizer(base_dir=None, model_name="test-model", history=self.history)
+        self.history.record("/downloads/invoice_2024_03.pdf", "/documents/Finance/Invoices")
+        self.history.record("/downloads/invoice_2024_04.pdf", "/documents/Finance/Invoices")
+        with patch.object(organizer, "invoke_structured") as invoke_structured:
+            response = organizer.get_path_suggestions("/documents", {"file_path": "invoice_2024_05.pdf", "summary": "Invoice"})
+        self.assertEqual(response["suggestions"], ["/documents/Finance/Invoices"])
+        invoke_structured.assert_not_called()
+
+    def test_single_move_is_not_generalized(self):
+        self.history.record("/downloads/invoice_2024_03.pdf", "/documents/Finance/Invoices")
+        self.assertEqual(self.history.lookup("invoice_2024_05.pdf", base_dir="/documents"), [])
+
+    def test_extension_alone_does_not_match(self):
+        for name in ("000123.pdf", "document.pdf", "20240101.pdf"):
+            self.history.record(f"/downloads/{name}", "/documents/Contracts")
+        self.assertEqual(self.history.lookup("000456.pdf"), [])
+        self.assertEqual(self.history.lookup("20250101.pdf", base_dir="/documents"), [])
+
+    def test_relative_destination_does_not_break_lookup(self):
+        self.history.conn.execute(
+            "INSERT INTO committed_moves (file_name, destination, features, committed_at) VALUES (?, ?, ?, ?)",
+            ("invoice_2024_01.pdf", "Invoices", "ext:pdf\nname:invoice\nprefix:invoice", 0),
+        )
+        self.history.conn.commit()
+        self.history.record("/downloads/invoice_2024_03.pdf", "/documents/Finance/Invoices")
+        self.history.record("/downloads/invoice_2024_04.pdf", "/documents/Finance/Invoices")
+        self.assertEqual(self.history.lookup("invoice_2024_05.pdf", base_dir="/documents"), ["/documents/Finance/Invoices"])
+
+class TestPromptCompaction(unittest.TestCase):
+    def test_directory_listing_is_relative_and_trie_compressed(self):
+        directories = ["/docs/Finance", "/docs/Finance/Invoices", "/docs/Finance/Taxes", "/docs/Photos", "/docs/Photos/2024"]
+        listing = compact_directory_listing(directories, "/docs")
+        self.assertEqual(listing, "Finance/\n Invoices/\n Taxes/\nPhotos/2024/")
+
+    def test_directory_listing_respects_budget(self):
+        directories = [f"/docs/Projects/p{i}/src/module{j}" for i in range(20) for j in range(10)]
+        listing = compact_directory_listing(directories, "/docs", max_tokens=200)
+        self.assertLessEqual(count_tokens(listing), 200)
+
+    def test_summaries_fit_budget(self):
+        summaries = [{"file_path": f"file{i}.txt", "summary": "lorem ipsum " * 200} for i in range(10)]
+        compacted = compact_summaries(summaries, 1000)
+        self.assertLessEqual(sum(count_tokens(s["summary"]) for s in compacted), 1000)
+        self.assertEqual([s["file_path"] for s in compacted], [s["file_path"] for s in summaries])
+
+    def test_summaries_within_budget_are_left_whole(self):
+        summaries = [{"file_path": f"file{i}.txt", "summary": f"Invoice {i} from ACME " * 5} for i in range(3)]
+        self.assertEqual(compact_summaries(summaries, 1000), summaries)
+
+    def test_large_batch_keeps_summaries_within_model_context(self):
+        summaries = [{"file_path": f"file{i}.txt", "summary": "lorem ipsum " * 100} for i in range(100)]
+        organizer = DirectoryOrganizer(base_dir=None, model_name="llama-3.1-70b-versatile")
+        messages = organizer.reorganization_messages(summaries)
+        self.assertEqual(json.loads(messages[1].content), summaries)
+
+        small = DirectoryOrganizer(base_dir=None, model_name="gemma2-9b-it")
+        messages = small.reorganization_messages(summaries)
+        self.assertLessEqual(
+            sum(count_tokens(m.content) for m in messages) + REORGANIZATION_COMPLETION_TOKENS * len(summaries),
+            small.context_tokens,
+        )
+
+class TestDeduplication(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        files = {
+            "report.pdf": b"%PDF" + b"x" * 200000,
+            "report (1).pdf": b"%PDF" + b"x" * 200000,
+            "report (2).pdf": b"%PDF" + b"x" * 199999 + b"y",
+            "notes copy.txt": b"meeting notes",
+            "notes.txt": b"meeting notes",
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.tmp_dir, name), "wb") as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_duplicates_groups_identical_files(self):
+        duplicates = find_duplicates(self.tmp_dir, {
+            "pdfs": ["report (1).pdf", "report.pdf", "report (2).pdf"],
+            "misc": ["notes copy.txt", "notes.txt"],
+        })
+        self.assertEqual(duplicates, {"report.pdf": ["report (1).pdf"], "notes.txt": ["notes copy.txt"]})
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_similar_screenshots_are_kept_apart(self):
+        screenshot = Image.new("RGB", (320, 200), "white")
+        for x in range(0, 320, 40):
+            screenshot.paste((30, 30, 120), (x, 0, x + 20, 200))
+        screenshot.save(os.path.join(self.tmp_dir, "screen.png"))
+        # The same screenshot saved again with other compression settings
+        screenshot.save(os.path.join(self.tmp_dir, "screen copy.png"), compress_level=1)
+        # A similar screenshot with a small part changed
+        screenshot.paste((200, 0, 0), (300, 190, 310, 200))
+        screenshot.save(os.path.join(self.tmp_dir, "screen 2.png"))
+        duplicates = find_duplicates(self.tmp_dir, {"images": ["screen.png", "screen copy.png", "screen 2.png"]})
+        self.assertEqual(duplicates, {"screen.png": ["screen copy.png"]})
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_reencoded_jpeg_copies_are_merged(self):
+        photo = Image.merge("RGB", [
+            Image.linear_gradient("L").resize((640, 480)),
+            Image.linear_gradient("L").rotate(90).resize((640, 480)),
+            Image.radial_gradient("L").resize((640, 480)),
+        ])
+        photo.save(os.path.join(self.tmp_dir, "photo.jpg"), quality=95)
+        with Image.open(os.path.join(self.tmp_dir, "photo.jpg")) as saved:
+            saved.save(os.path.join(self.tmp_dir, "photo (1).jpg"), quality=80)
+        # Same picture at another size is kept apart
+        photo.resize((320, 240)).save(os.path.join(self.tmp_dir, "photo small.jpg"), quality=95)
+        duplicates = find_duplicates(self.tmp_dir, {"images": ["photo (1).jpg", "photo.jpg", "photo small.jpg"]})
+        self.assertEqual(duplicates, {"photo.jpg": ["photo (1).jpg"]})
+
+    def test_expand_duplicate_moves_shares_decision(self):
+        moves = expand_duplicate_moves(
+            [{"src_path": "report.pdf", "dst_path": "Reports/q1_report.pdf"}],
+            [{"file_path": "report.pdf", "summary": "Quarterly report"}],
+            {"report.pdf": ["report (1).pdf"]},
+        )
+        self.assertEqual(moves[1]["dst_path"], "Reports/report (1).pdf")
+        self.assertEqual(moves[1]["summary"], "Quarterly report")
+        self.assertEqual(moves[1]["duplicate_of"], "report.pdf")
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("test_duration_seconds", "Test histogram.", ["stage"], buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="scan")
+        histogram.observe(0.5, stage="scan")
+        lines = histogram.render()
+        self.assertIn('test_duration_seconds_bucket{stage="scan",le="0.1"} 1', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="scan",le="1.0"} 2', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="scan",le="+Inf"} 2', lines)
+        self.assertIn('test_duration_seconds_count{stage="scan"} 2', lines)
+
+    def test_counter_rejects_unknown_labels(self):
+        counter = Counter("test_total", "Test counter.", ["call"])
+        with self.assertRaises(ValueError):
+            counter.inc(model="llava")
+
+    def test_job_trace_collects_stages(self):
+        trace_dir = tempfile.mkdtemp()
+        with job("batch", trace_dir=trace_dir) as trace:
+            with track("scan"):
+                pass
+            with track("extract", category="pdfs"):
+                pass
+        spans = trace.to_dict()["spans"]
+        self.assertEqual([span["stage"] for span in spans], ["scan", "extract"])
+        self.assertEqual(spans[1]["category"], "pdfs")
+        self.assertEqual(len(os.listdir(trace_dir)), 1)
+        shutil.rmtree(trace_dir)
+
+    def test_cancellation_is_not_a_stage_error(self):
+        def errors():
+            return STAGE_ERRORS.values.get(STAGE_ERRORS.label_key({"stage": "scan"}), 0)
+
+        before = errors()
+        with self.assertRaises(asyncio.CancelledError):
+            with track("scan"):
+                raise asyncio.CancelledError()
+        with self.assertRaises(GeneratorExit):
+            with track("scan"):
+                raise GeneratorExit()
+        self.assertEqual(errors(), before)
+        with self.assertRaises(ValueError):
+            with track("scan"):
+                raise ValueError("bad input")
+        self.assertEqual(errors(), before + 1)
+
+class TestBenchmarkDataset(unittest.TestCase):
+    def test_generate_directory_is_reproducible(self):
+        first, second = tempfile.mkdtemp(), tempfile.mkdtemp()
+        names = generate_directory(first, 30, mix={"txt": 1, "png": 1}, duplicate_ratio=0.2, seed=7)
+        self.assertEqual(names, generate_directory(second, 30, mix={"txt": 1, "png": 1}, duplicate_ratio=0.2, seed=7))
+        self.assertEqual(sorted(os.listdir(first)), sorted(names))
+        self.assertTrue(any("(" in name for name in names))
+        shutil.rmtree(first)
+        shutil.rmtree(second)
+
+    def test_benchmark_runs_with_default_mix(self):
+        from benchmarks.run_benchmark import main
+        report_path = os.path.join(tempfile.mkdtemp(), "report.json")
+        with patch.dict(os.environ):
+            exit_code = main([
+                "--files", "20", "--ollama-latency", "0", "--groq-latency", "0", "--output", report_path,
+            ])
+        self.assertEqual(exit_code, 0)
+        with open(report_path) as f:
+            report = json.load(f)
+        shutil.rmtree(os.path.dirname(report_path))
+        self.assertEqual(set(report["pipelines"]), {"batch", "watch"})
+        self.assertEqual(report["pipelines"]["batch"]["files"], 20)
+
+class TestBatchPipeline(unittest.TestCase):
+    def setUp(self):
+        self.summarizer = MagicMock()
+        self.organizer = MagicMock()
+        self.pipeline = BatchPipeline(self.summarizer, self.organizer, logger=MagicMock())
+
+    def test_concurrent_requests_keep_their_own_paths(self):
+        def load_documents(base_path, failed_files=None):
+            return [MagicMock(metadata={"file_name": f"{base_path}.txt"})], []
+
+        async def summarize_documents(documents, failed_files=None):
+            await asyncio.sleep(0.01)
+            return [{"file_path": doc.metadata["file_name"], "summary": "summary"} for doc in documents]
+
+        self.summarizer.load_documents.side_effect = load_documents
+        self.summarizer.summarize_documents.side_effect = summarize_documents
+        self.organizer.aget_reorganization_actions = AsyncMock(side_effect=lambda summaries: {
+            "files": [{"src_path": s["file_path"], "dst_path": f"docs/{s['file_path']}"} for s in summaries]
+        })
+        self.organizer.iter_tree_json.side_effect = lambda plan, base_path: (base_path, plan)
+
+        async def run_both():
+            return await asyncio.gather(
+                self.pipeline.run(BatchContext("first")),
+                self.pipeline.run(BatchContext("second")),
+            )
+
+        first, second = map(list, asyncio.run(run_both()))
+        self.assertEqual(first[0], "first")
+        self.assertEqual(first[1][0]["src_path"], "first.txt")
+        self.assertEqual(second[0], "second")
+        self.assertEqual(second[1][0]["src_path"], "second.txt")
+
+    def test_tree_build_is_timed_until_the_last_chunk(self):
+        def iter_tree_json(plan, base_path):
+            for chunk in ("{", "}"):
+                time.sleep(0.05)
+                yield chunk
+
+        def tree_build_seconds():
+            state = STAGE_DURATION.values.get(STAGE_DURATION.label_key({"stage": "tree_build"}))
+            return (state["sum"], state["counts"][-1]) if state else (0.0, 0)
+
+        self.organizer.iter_tree_json.side_effect = iter_tree_json
+        before, count = tree_build_seconds()
+        chunks = self.pipeline.build_tree(BatchContext("/batch"))
+        self.assertEqual(tree_build_seconds(), (before, count))
+        time.sleep(0.1)  # The consumer's own time between chunks is not counted
+        self.assertEqual("".join(chunks), "{}")
+        elapsed, new_count = tree_build_seconds()
+        self.assertEqual(new_count, count + 1)
+        self.assertGreaterEqual(elapsed - before, 0.1)
+        self.assertLess(elapsed - before, 0.19)
+
+    def test_local_failures_are_reported_like_worker_failures(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        for name, content in {"good.txt": "fine", "corrupt.txt": "bad", "corrupt copy.txt": "bad", "slow.txt": "slow"}.items():
+            with open(os.path.join(tmp_dir, name), "w") as f:
+                f.write(content)
+        summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+        process_file = summarizer.process_file
+
+        def extract(full_path, category):
+            if os.path.basename(full_path) == "corrupt.txt":
+                raise ValueError("unreadable")
+            return process_file(full_path, category)
+
+        async def summarize(doc):
+            if doc.metadata["file_name"] == "slow.txt":
+                raise TimeoutError("model timed out")
+            return FileSummary(doc.metadata["file_name"], "summary")
+
+        self.organizer.aget_reorganization_actions = AsyncMock(side_effect=lambda summaries: {
+            "files": [{"src_path": s["file_path"], "dst_path": f"docs/{s['file_path']}"} for s in summaries]
+        })
+        pipeline = BatchPipeline(summarizer, self.organizer, logger=MagicMock())
+        context = BatchContext(tmp_dir)
+        with patch.object(summarizer, "process_file", side_effect=extract), \
+                patch.object(summarizer, "summarize_document", side_effect=summarize):
+            asyncio.run(pipeline.run(context))
+        self.assertEqual([move.src_path for move in context.plan], ["good.txt"])
+        self.assertEqual(context.failed_files, [
+            {"file": "corrupt.txt", "error": "unreadable"},
+            {"file": "corrupt copy.txt", "error": "unreadable"},
+            {"file": "slow.txt", "error": "model timed out"},
+        ])
+        self.assertIn('"failedFiles": [{"file": "corrupt.txt"', context.skipped_files_json())
+
+class TestFileMover(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp_dir, "video.mp4")
+        with open(self.src, "wb") as f:
+            f.write(b"x" * 1000)
+        self.mover = FileMover(max_workers=2)
+
+    def tearDown(self):
+        self.mover.shutdown()
+        shutil.rmtree(self.tmp_dir)
+
+    def cross_device_rename(self, src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    def test_move_into_directory(self):
+        os.makedirs(os.path.join(self.tmp_dir, "videos"))
+        job = asyncio.run(self.mover.move(self.src, os.path.join(self.tmp_dir, "videos")))
+        self.assertEqual(job.status, "done")
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, "videos", "video.mp4")))
+
+    @patch("src.fileops.COPY_CHUNK_BYTES", 100)
+    def test_cross_device_move_reports_progress(self):
+        dst = os.path.join(self.tmp_dir, "moved.mp4")
+        with patch("os.rename", side_effect=self.cross_device_rename):
+            job = asyncio.run(self.mover.move(self.src, dst))
+        self.assertEqual(job.to_dict()["copiedBytes"], 1000)
+        self.assertEqual(job.to_dict()["totalBytes"], 1000)
+        self.assertFalse(os.path.exists(self.src))
+        self.assertTrue(os.path.exists(dst))
+
+    @patch("src.fileops.COPY_CHUNK_BYTES", 100)
+    def test_cancelled_move_keeps_source(self):
+        dst = os.path.join(self.tmp_dir, "moved.mp4")
+        add_progress = MoveJob.add_progress
+
+        def cancel_after_first_chunk(job, copied):
+            job.cancel()
+            add_progress(job, copied)
+
+        with patch("os.rename", side_effect=self.cross_device_rename), \
+                patch.object(MoveJob, "add_progress", cancel_after_first_chunk):
+            with self.assertRaises(MoveCancelled):
+                asyncio.run(self.mover.move(self.src, dst, job_id="job-1"))
+        self.assertTrue(os.path.exists(self.src))
+        self.assertFalse(os.path.exists(dst))
+        self.assertEqual(self.mover.get_job("job-1").status, "cancelled")
+
+    def test_cross_device_move_keeps_existing_directory(self):
+        src = os.path.join(self.tmp_dir, "src", "photos")
+        occupied = os.path.join(self.tmp_dir, "dst", "photos")
+        os.makedirs(src)
+        os.makedirs(occupied)
+        with open(os.path.join(occupied, "precious.txt"), "w") as f:
+            f.write("keep me")
+        with patch("os.rename", side_effect=self.cross_device_rename):
+            with self.assertRaises(FileExistsError):
+                asyncio.run(self.mover.move(src, os.path.join(self.tmp_dir, "dst")))
+        self.assertTrue(os.path.exists(os.path.join(occupied, "precious.txt")))
+        self.assertTrue(os.path.isdir(src))
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "dst")), ["photos"])
+
+    def test_cross_device_directory_move_keeps_symlinks(self):
+        src = os.path.join(self.tmp_dir, "album")
+        os.makedirs(src)
+        os.symlink(self.src, os.path.join(src, "latest.mp4"))
+        dst = os.path.join(self.tmp_dir, "moved")
+        with patch("os.rename", side_effect=self.cross_device_rename):
+            job = asyncio.run(self.mover.move(src, dst))
+        self.assertEqual(job.status, "done")
+        self.assertTrue(os.path.islink(os.path.join(dst, "latest.mp4")))
+        self.assertEqual(os.readlink(os.path.join(dst, "latest.mp4")), self.src)
+        self.assertEqual(job.total_bytes, 0)
+
+    @patch("src.fileops.COPY_CHUNK_BYTES", 100)
+    @patch("src.fileops.JOB_SYNC_INTERVAL", 0)
+    def test_jobs_are_shared_through_the_job_store(self):
+        db_path = os.path.join(self.tmp_dir, "jobs.db")
+        running = FileMover(max_workers=1, job_store=MoveJobStore(db_path))
+        other = FileMover(max_workers=1, job_store=MoveJobStore(db_path))
+        self.addCleanup(running.shutdown)
+        self.addCleanup(other.shutdown)
+        self.assertIsNone(other.job_state("job-1"))
+        self.assertFalse(other.cancel("job-1"))
+
+        dst = os.path.join(self.tmp_dir, "moved.mp4")
+        add_progress = MoveJob.add_progress
+        seen = []
+
+        def cancel_from_other_worker(job, copied):
+            seen.append(other.job_state(job.job_id))
+            if len(seen) == 2:
+                self.assertTrue(other.cancel(job.job_id))
+            add_progress(job, copied)
+
+        with patch("os.rename", side_effect=self.cross_device_rename), \
+                patch.object(MoveJob, "add_progress", cancel_from_other_worker):
+            with self.assertRaises(MoveCancelled):
+                asyncio.run(running.move(self.src, dst, job_id="job-1"))
+        self.assertEqual(seen[1]["status"], "running")
+        self.assertEqual(seen[1]["copiedBytes"], 100)
+        self.assertEqual(other.job_state("job-1")["status"], "cancelled")
+        self.assertTrue(os.path.exists(self.src))
+        self.assertFalse(os.path.exists(dst))
+
+class TestDistributedSummarization(unittest.TestCase):
+    def setUp(self):
+        self.summarizer = MagicMock()
+        self.logger = MagicMock()
+
+    def test_dispatcher_aggregates_worker_results(self):
+        dispatcher = DistributedSummarizer("amqp://localhost", self.summarizer, self.logger)
+        dispatcher.connect = AsyncMock()
+        self.summarizer.plan_documents.return_value = (
+            [("report.pdf", "pdfs", ["report (1).pdf"]), ("broken.txt", "misc", []), ("empty.txt", "misc", [])],
+            ["archive.zip"],
+        )
+        results = {
+            "report.pdf": {"file_name": "report.pdf", "summary": "Quarterly report"},
+            "broken.txt": {"file_name": "broken.txt", "error": "decode error"},
+            "empty.txt": {"file_name": "empty.txt", "summary": None},
+        }
+        dispatcher.submit = AsyncMock(side_effect=lambda base_path, fname, category, duplicates: results[fname])
+
+        summaries, duplicates, unsupported, failed = asyncio.run(dispatcher.summarize("/downloads"))
+        self.assertEqual(summaries, [{"file_path": "report.pdf", "summary": "Quarterly report"}])
+        self.assertEqual(duplicates, {"report.pdf": ["report (1).pdf"]})
+        self.assertEqual(unsupported, ["archive.zip"])
+        self.assertEqual(failed, [{"file": "broken.txt", "error": "decode error"}])
+
+    def reply(self, dispatcher, body):
+        message = MagicMock(correlation_id=next(iter(dispatcher.pending)), body=json.dumps(body).encode())
+        return dispatcher.on_result(message)
+
+    def test_task_timeout_starts_when_a_worker_picks_the_task_up(self):
+        dispatcher = DistributedSummarizer("amqp://localhost", self.summarizer, self.logger,
+                                           task_timeout=0.05, queue_timeout=1)
+        dispatcher.channel = MagicMock()
+        dispatcher.channel.default_exchange.publish = AsyncMock()
+        dispatcher.callback_queue = MagicMock()
+
+        async def run():
+            submitted = asyncio.ensure_future(dispatcher.submit("/downloads", "notes.txt", "misc", []))
+            # Queued for longer than the task timeout before a worker starts it
+            await asyncio.sleep(0.1)
+            await self.reply(dispatcher, {"file_name": "notes.txt", "status": "started"})
+            await asyncio.sleep(0.02)
+            await self.reply(dispatcher, {"file_name": "notes.txt", "summary": "Notes"})
+            return await submitted
+
+        self.assertEqual(asyncio.run(run()), {"file_name": "notes.txt", "summary": "Notes"})
+        message = dispatcher.channel.default_exchange.publish.call_args[0][0]
+        self.assertEqual(message.expiration, 1)
+
+    def test_task_never_picked_up_fails(self):
+        dispatcher = DistributedSummarizer("amqp://localhost", self.summarizer, self.logger,
+                                           task_timeout=1, queue_timeout=0.05)
+        dispatcher.channel = MagicMock()
+        dispatcher.channel.default_exchange.publish = AsyncMock()
+        dispatcher.callback_queue = MagicMock()
+        result = asyncio.run(dispatcher.submit("/downloads", "notes.txt", "misc", []))
+        self.assertIn("not picked up", result["error"])
+        self.assertEqual(dispatcher.pending, {})
+
+    def test_worker_skips_expired_task(self):
+        worker = SummarizationWorker("amqp://localhost", self.summarizer, self.logger)
+        worker.channel = MagicMock()
+        worker.channel.default_exchange.publish = AsyncMock()
+        message = MagicMock(reply_to="callback", correlation_id="task-1")
+        message.process.return_value.__aenter__ = AsyncMock()
+        message.process.return_value.__aexit__ = AsyncMock(return_value=False)
+        message.body = json.dumps({
+            "base_path": "/downloads", "file_name": "notes.txt", "category": "misc", "expires_at": 1,
+        }).encode()
+        asyncio.run(worker.on_task(message))
+        self.summarizer.load_document.assert_not_called()
+        worker.channel.default_exchange.publish.assert_not_called()
+
+    def test_worker_rejects_malformed_task_without_requeueing(self):
+        worker = SummarizationWorker("amqp://localhost", self.summarizer, self.logger)
+        worker.channel = MagicMock()
+        worker.channel.default_exchange.publish = AsyncMock()
+        for body in (b"not json", b'["notes.txt"]', b'{"base_path": "/downloads"}'):
+            message = MagicMock(reply_to="callback", correlation_id="task-1", body=body)
+            message.reject = AsyncMock()
+            asyncio.run(worker.on_task(message))
+            message.reject.assert_awaited_once_with(requeue=False)
+            message.process.assert_not_called()
+        self.summarizer.load_document.assert_not_called()
+        reply = json.loads(worker.channel.default_exchange.publish.call_args.args[0].body)
+        self.assertTrue(reply["error"].startswith("malformed task"))
+
+    def test_worker_processes_task(self):
+        worker = SummarizationWorker("amqp://localhost", self.summarizer, self.logger)
+        self.summarizer.load_document.return_value = MagicMock()
+        self.summarizer.summarize_document = AsyncMock(return_value={"file_path": "notes.txt", "summary": "Notes"})
+        result = asyncio.run(worker.process_task({"base_path": "/downloads", "file_name": "notes.txt", "category": "misc"}))
+        self.assertEqual(result, {"file_name": "notes.txt", "summary": "Notes"})
+        self.summarizer.load_document.assert_called_once_with("/downloads", "notes.txt", "misc", None)
+
+class TestCodeOutline(unittest.TestCase):
+    def test_python_outline_keeps_docstring_imports_and_signatures(self):
+        source = (
+            '"""Order handling."""\nimport os\nfrom typing import List\n\n'
+            'class OrderService(Base):\n    def find(self, limit: int = 10) -> List:\n        """Find orders."""\n        return []\n\n'
+            'async def main():\n    pass\n'
+        )
+        self.assertEqual(outline_source(source, "python"), [
+            '"""Order handling."""',
+            "imports: os, typing",
+            "class OrderService(Base)",
+            "    def find(self, limit: int=10) -> List  # Find orders.",
+            "async def main()",
+        ])
+
+    def test_c_like_outline_ignores_comments_strings_and_control_flow(self):
+        source = (
+            '#include <stdio.h>\n// void fake() {\n'
+            'static int add(int a, int b)\n{\n  if (a) { puts("void nope() {"); }\n  return a + b;\n}\n'
+        )
+        self.assertEqual(outline_source(source, "c"), ["imports: stdio.h", "static int add(int a, int b)"])
+
+    def test_large_files_are_outlined_and_small_files_sent_whole(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        small = os.path.join(tmp_dir, "small.go")
+        with open(small, "w") as f:
+            f.write("package main\nfunc main() {\n}\n")
+        self.assertEqual(build_code_outline(small), "package main\nfunc main() {\n}\n")
+
+        large = os.path.join(tmp_dir, "large.go")
+        body = "".join(f"func handler{i}(w http.ResponseWriter) {{\n\tw.Write(nil)\n}}\n" for i in range(100))
+        with open(large, "w") as f:
+            f.write('package main\nimport "net/http"\n' + body)
+        outline = build_code_outline(large)
+        self.assertGreater(len(body), MIN_OUTLINE_CHARS)
+        self.assertLess(len(outline), len(body))
+        self.assertIn("imports: net/http", outline)
+        self.assertIn("func handler99(w http.ResponseWriter)", outline)
+
+    def test_signature_patterns_do_not_backtrack_across_lines(self):
+        source = (
+            "public enum Color {\n" + "".join(f"    VALUE_{i},\n" for i in range(2000)) + "    LAST;\n"
+            "    public Color next() {\n        return LAST;\n    }\n}\n"
+        )
+        started = time.perf_counter()
+        outline = outline_code(source, "Color.java")
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertIn("public enum Color", outline)
+        self.assertIn("public Color next()", outline)
+
+    def test_sources_without_an_outline_are_capped(self):
+        bundle = "var a=function(){return 1};" * 30000
+        excerpt = outline_code(bundle, "bundle.min.js")
+        self.assertTrue(excerpt.startswith("Beginning of bundle.min.js (1 lines"))
+        self.assertLessEqual(count_tokens(excerpt), MAX_UNOUTLINED_TOKENS + 50)
+
+        python2 = "".join(f"print 'line {i}'\n" for i in range(20000))
+        self.assertLessEqual(count_tokens(outline_code(python2, "legacy.py")), MAX_UNOUTLINED_TOKENS + 50)
+
+class TestImageMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def write(self, name):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"not really an image")
+        return path
+
+    def test_file_names_classify_images(self):
+        self.assertEqual(inspect_image(self.write("Screenshot 2024-05-01 at 10.12.33.png"))["kind"], "screenshot")
+        self.assertEqual(inspect_image(self.write("scan_0001.jpg"))["kind"], "scan")
+        self.assertEqual(inspect_image(self.write("IMG_20240501_101233.jpg"))["kind"], "photo")
+        self.assertIsNone(inspect_image(self.write("holiday.png"))["kind"])
+
+    def test_description_includes_date_from_file_name(self):
+        kind, description = describe_image(self.write("PXL_20240501_101233.jpg"), ocr=False)
+        self.assertEqual(kind, "photo")
+        self.assertIn("2024-05-01", description)
+        self.assertEqual(describe_image(self.write("holiday.png")), (None, None))
+
+    def test_described_images_skip_llava(self):
+        self.write("Screenshot_20240501.png")
+        summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+        summarizer.get_chat = MagicMock()
+        document = summarizer.load_document(self.tmp_dir, "Screenshot_20240501.png", "images")
+        self.assertEqual(document.metadata["image_kind"], "screenshot")
+        summary = asyncio.run(summarizer.summarize_document(document))
+        self.assertTrue(summary["summary"].startswith("Screenshot from 2024-05-01"))
+        summarizer.get_chat.assert_not_called()
+
+class TestArchiveInspection(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+
+    def test_zip_listing_and_bounded_samples(self):
+        path = os.path.join(self.tmp_dir, "project.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("project/src/main.py", "print('hello')\n")
+            archive.writestr("project/README.md", "# Project\n" + "lorem ipsum\n" * 10000)
+            archive.writestr("project/logo.png", b"\x89PNG")
+        listing = inspect_archive(path, {"py", "md"})
+        self.assertEqual(listing.members, 3)
+        self.assertEqual(listing.top_level["project/"], 3)
+        samples = dict(listing.samples)
+        self.assertEqual(list(samples), ["project/README.md", "project/src/main.py"])
+        self.assertLessEqual(len(samples["project/README.md"]), MAX_SAMPLE_BYTES)
+        self.assertEqual(samples["project/src/main.py"], b"print('hello')\n")
+
+    def test_tar_is_read_as_a_stream(self):
+        path = os.path.join(self.tmp_dir, "logs.tar.gz")
+        with tarfile.open(path, "w:gz") as archive:
+            for i in range(5):
+                data = f"entry {i}\n".encode()
+                info = tarfile.TarInfo(f"./logs/day{i}.log")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        listing = inspect_archive(path, {"log"})
+        self.assertEqual(listing.members, 5)
+        self.assertEqual(listing.extensions["log"], 5)
+        self.assertEqual(listing.samples[0], ("logs/day0.log", b"entry 0\n"))
+
+    def test_archives_are_summarized_from_their_listing(self):
+        path = os.path.join(self.tmp_dir, "data.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("notes.txt", "Quarterly budget notes")
+        summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+        self.assertEqual(summarizer.get_file_category(path), "archives")
+        content = summarizer.process_file(path, "archives")
+        self.assertIn('zip archive "data.zip": 1 files', content)
+        self.assertIn("Content of notes.txt:\nQuarterly budget notes", content)
+
+    def test_truncated_tarball_is_not_read_as_a_compressed_file(self):
+        path = os.path.join(self.tmp_dir, "logs.tar.gz")
+        with tarfile.open(path, "w:gz") as archive:
+            for i in range(20):
+                data = os.urandom(4096)
+                info = tarfile.TarInfo(f"logs/day{i}.bin")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        with open(path, "rb") as file:
+            data = file.read()
+        with open(path, "wb") as file:
+            file.write(data[:len(data) // 2])
+        with self.assertRaises(ValueError):
+            inspect_archive(path, {"log"})
+        summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+        content = summarizer.process_file(path, "archives")
+        self.assertIn('Archive "logs.tar.gz" could not be read', content)
+
+    def test_damaged_zip_is_described_by_its_name(self):
+        path = os.path.join(self.tmp_dir, "data.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("notes.txt", "Quarterly budget notes" * 100)
+        with open(path, "rb") as file:
+            data = file.read()
+        with open(path, "wb") as file:
+            file.write(data[:len(data) // 2])
+        summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+        content = summarizer.process_file(path, "archives")
+        self.assertIn('Archive "data.zip" could not be read', content)
+
+    def test_samples_are_extracted_in_memory(self):
+        path = os.path.join(self.tmp_dir, "export.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("people.csv", "name,email\nAda,ada@example.com\n")
+            archive.writestr("config.json", '{"debug": true}')
+        summarizer = FileSummarizer(base_path=None, azure_api_key=None)
+        with patch("tempfile.TemporaryDirectory") as temporary_directory:
+            content = summarizer.process_file(path, "archives")
+        temporary_directory.assert_not_called()
+        self.assertIn("Content of people.csv:\nname, email", content)
+        self.assertIn('Content of config.json:\n{"debug": true}', content)
+
+class TestMovePlan(unittest.TestCase):
+    def test_directories_are_shared_between_moves(self):
+        plan = MovePlan()
+        plan.add("a.pdf", "Finance/2024/a.pdf", "Invoice A")
+        plan.add("b.pdf", "Finance/2024/b.pdf", "Invoice B")
+        plan.add("c.txt", "Notes/c.txt", "Notes")
+        self.assertIs(plan[0].directory, plan[1].directory)
+        self.assertEqual(len(plan.paths), 4)
+        self.assertEqual(plan[1].to_dict(), {"src_path": "b.pdf", "dst_path": "Finance/2024/b.pdf", "summary": "Invoice B"})
+
+    def test_records_support_dict_reads(self):
+        summary = FileSummary("notes.txt", "Meeting notes")
+        self.assertEqual(summary["summary"], "Meeting notes")
+        self.assertEqual(summary.get("missing", "default"), "default")
+        self.assertEqual(dict(summary), {"file_path": "notes.txt", "summary": "Meeting notes"})
+        self.assertFalse(hasattr(summary, "__dict__"))
+
+    def test_streamed_tree_matches_response_shape(self):
+        plan = MovePlan()
+        plan.add("a.pdf", "Finance/a.pdf", "Invoice A")
+        plan.add("a (1).pdf", "Finance/a (1).pdf", "Invoice A", duplicate_of="a.pdf")
+        plan.add("c.txt", "c.txt", "Notes")
+        organizer = DirectoryOrganizer(base_dir=None, model_name="test")
+        chunks = list(organizer.iter_tree_json(plan, "/missing/files", chunk_size=16))
+        self.assertGreater(len(chunks), 1)
+        tree = json.loads("".join(chunks))
+        self.assertEqual(tree, organizer.convert_to_tree_with_details(plan, "/missing/files"))
+        self.assertEqual(tree["path"], "files")
+        finance, notes = tree["children"]
+        self.assertEqual((finance["name"], finance["type"], finance["path"]), ("Finance", "folder", "files/Finance"))
+        self.assertEqual(finance["children"][1]["duplicateOf"], "a.pdf")
+        self.assertEqual(finance["children"][0]["destination"], "Finance/a.pdf")
+        self.assertEqual(notes["path"], "files/c.txt")
+        self.assertEqual(notes["size"], "Unknown")
+
+class FakeEmbeddings:
+    """Bag-of-words embeddings, enough to tell the test summaries apart."""
+    VOCABULARY = ["invoice", "acme", "march", "photo", "cat", "sofa", "meeting", "notes", "budget"]
+
+    def embed(self, text):
+        words = text.lower().split()
+        return [float(words.count(word)) for word in self.VOCABULARY]
+
+    def embed_documents(self, texts):
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed(text)
+
+class TestSummaryIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.invoice = os.path.join(self.tmp_dir, "invoice.pdf")
+        with open(self.invoice, "wb") as f:
+            f.write(b"x" * 2048)
+        self.index = SummaryIndex(os.path.join(self.tmp_dir, "search.db"), embeddings=FakeEmbeddings())
+        self.addCleanup(self.index.close)
+        self.index.add([
+            (self.invoice, "invoice from acme for march", "pdfs"),
+            (os.path.join(self.tmp_dir, "cat.png"), "photo of a cat on a sofa", "images"),
+            (os.path.join(self.tmp_dir, "notes.txt"), "meeting notes about the budget", "misc"),
+        ])
+
+    def test_search_ranks_by_meaning(self):
+        results = self.index.search("acme invoice", k=2)
+        self.assertEqual(results[0]["path"], self.invoice)
+        self.assertEqual(results[0]["size"], 2048)
+        self.assertEqual(len(results), 2)
+
+    def test_metadata_filters(self):
+        self.assertEqual([r["category"] for r in self.index.search("cat photo", category="misc")], ["misc"])
+        self.assertEqual([r["path"] for r in self.index.search("cat photo", min_size=1024)], [self.invoice])
+        self.assertEqual(self.index.search("cat photo", modified_before="2000-01-01"), [])
+
+    def test_lsh_candidates_and_moves(self):
+        with patch("src.search.EXACT_SEARCH_LIMIT", 0):
+            self.assertEqual(self.index.search("photo of a cat", k=1)[0]["path"], os.path.join(self.tmp_dir, "cat.png"))
+        moved = os.path.join(self.tmp_dir, "Finance")
+        self.index.move(self.tmp_dir, moved)
+        self.assertEqual(self.index.search("acme invoice", k=1)[0]["path"], os.path.join(moved, "invoice.pdf"))
+
+class TestRateLimiter(unittest.TestCase):
+    def test_parse_duration(self):
+        self.assertAlmostEqual(parse_duration("2m59.56s"), 179.56)
+        self.assertAlmostEqual(parse_duration("250ms"), 0.25)
+        self.assertEqual(parse_duration("7"), 7)
+        self.assertIsNone(parse_duration("soon"))
+
+    def test_waits_for_token_budget(self):
+        limiter = QuotaLimiter(requests_per_minute=600, tokens_per_minute=600)
+        self.assertEqual(limiter.reserve(590), 0)
+        # 10 tokens per second are refilled, so 100 more tokens take about 9 seconds
+        self.assertAlmostEqual(limiter.reserve(100), 9, delta=0.1)
+
+    def test_headers_replace_local_budget(self):
+        limiter = QuotaLimiter(requests_per_minute=600, tokens_per_minute=100000)
+        limiter.update_from_headers({
+            "x-ratelimit-limit-requests": "14400",
+            "x-ratelimit-remaining-requests": "14399",
+            "x-ratelimit-reset-requests": "6s",
+            "x-ratelimit-limit-tokens": "6000",
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "10s",
+        })
+        # Groq's request limit is per day; the configured per-minute budget is kept
+        self.assertEqual(limiter.requests.capacity, 600)
+        self.assertEqual(limiter.daily_requests.capacity, 14400)
+        self.assertEqual(limiter.tokens.capacity, 6000)
+        # The token budget refills 6000 tokens in 10 seconds
+        self.assertAlmostEqual(limiter.reserve(600), 1, delta=0.1)
+
+    def test_daily_request_quota_bounds_calls(self):
+        limiter = QuotaLimiter(requests_per_minute=600, tokens_per_minute=100000)
+        limiter.update_from_headers({
+            "x-ratelimit-limit-requests": "14400",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "1m30s",
+        })
+        # A single request is back after 90 s / 14400
+        self.assertAlmostEqual(limiter.reserve(10), 90 / 14400, delta=0.001)
+
+    def test_short_batch_result_fails_leftover_callers(self):
+        async def handler(key, items):
+            return items[:1]
+
+        async def submit_all():
+            coalescer = RequestCoalescer(handler, window=0.01)
+            return await asyncio.gather(
+                coalescer.submit("docs", "a"), coalescer.submit("docs", "b"), return_exceptions=True
+            )
+
+        first, second = asyncio.run(asyncio.wait_for(submit_all(), timeout=5))
+        self.assertEqual(first, "a")
+        self.assertIsInstance(second, RuntimeError)
+
+    def test_rate_limited_call_pauses_others(self):
+        limiter = QuotaLimiter()
+        limiter.penalize(2)
+        self.assertAlmostEqual(limiter.reserve(10), 2, delta=0.1)
+
+    def test_concurrent_suggestions_share_one_call(self):
+        organizer = DirectoryOrganizer(base_dir=None, model_name="test-model", suggestion_window=0.01)
+        tmp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(tmp_dir, "Finance"))
+
+        async def ainvoke_structured(call, schema, messages, **kwargs):
+            self.assertIs(schema, BatchPathSuggestions)
+            files = json.loads(messages[1].content)
+            return BatchPathSuggestions(files=[
+                PathSuggestions(src_path=file["file_path"], suggestions=["Finance"]) for file in files
+            ])
+
+        async def suggest_all():
+            with patch.object(organizer, "ainvoke_structured", side_effect=ainvoke_structured) as invoke:
+                results = await asyncio.gather(*[
+                    organizer.aget_path_suggestions(tmp_dir, {"file_path": f"invoice_{i}.pdf", "summary": "Invoice"})
+                    for i in range(3)
+                ])
+            return results, invoke.call_count
+
+        try:
+            results, calls = asyncio.run(suggest_all())
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(calls, 1)
+        self.assertEqual([result["src_path"] for result in results], ["invoice_0.pdf", "invoice_1.pdf", "invoice_2.pdf"])
+        self.assertEqual(results[0]["suggestions"], [os.path.join(tmp_dir, "Finance")])
+
+class TestOrganizerStreaming(unittest.TestCase):
+    OUTPUT = (
+        'Here is the plan:\n```json\n{"files": [{"src_path": "a.txt", "dst_path": "Docs/a}.txt"}, '
+        '{"src_path": "b.txt"}, {"src_path": "c \\"quoted\\".txt", "dst_path": "Notes/c.txt"}]}\n```'
+    )
+
+    def test_parser_yields_entries_as_they_complete(self):
+        parser = ArrayObjectParser()
+        entries = []
+        for i in range(0, len(self.OUTPUT), 5):
+            entries.extend(parser.feed(self.OUTPUT[i:i + 5]))
+        self.assertEqual(entries, [
+            {"src_path": "a.txt", "dst_path": "Docs/a}.txt"},
+            {"src_path": "b.txt"},
+            {"src_path": 'c "quoted".txt', "dst_path": "Notes/c.txt"},
+        ])
+
+    def test_objects_nested_in_an_entry_stay_part_of_it(self):
+        output = (
+            '{"files": [{"src_path": "a.txt", "tags": [{"a": 1}, {"b": [2]}], "dst_path": "Docs/a.txt"}, '
+            '{"src_path": "b.txt", "meta": {"c": [{"d": 3}]}}]}'
+        )
+        for size in (1, 4, len(output)):
+            parser = ArrayObjectParser()
+            entries = []
+            for i in range(0, len(output), size):
+                entries.extend(parser.feed(output[i:i + size]))
+            self.assertEqual(entries, [
+                {"src_path": "a.txt", "tags": [{"a": 1}, {"b": [2]}], "dst_path": "Docs/a.txt"},
+                {"src_path": "b.txt", "meta": {"c": [{"d": 3}]}},
+            ])
+            self.assertEqual(parser.errors, 0)
+
+    def test_invalid_and_unknown_moves_are_dropped(self):
+        organizer = DirectoryOrganizer(base_dir=None, model_name="test-model")
+        chunks = [MagicMock(content=self.OUTPUT[i:i + 7]) for i in range(0, len(self.OUTPUT), 7)]
+        chat = MagicMock()
+
+        async def astream(messages):
+            for chunk in chunks:
+                yield chunk
+
+        chat.astream = astream
+
+        async def collect():
+            summaries = [{"file_path": "a.txt", "summary": "A"}, {"file_path": "b.txt", "summary": "B"}]
+            return [move async for move in organizer.astream_reorganization_actions(summaries)]
+
+        with patch.object(organizer, "async_chat_groq", return_value=chat), \
+                patch.object(organizer.token_usage, "record"):
+            moves = asyncio.run(collect())
+        self.assertEqual(moves, [{"src_path": "a.txt", "dst_path": "Docs/a}.txt"}])
+
+    def test_pipeline_streams_moves_before_the_tree(self):
+        summarizer = MagicMock()
+        summarizer.load_documents.return_value = ([], [])
+        summarizer.summarize_documents = AsyncMock(return_value=[{"file_path": "a.txt", "summary": "A"}])
+        organizer = DirectoryOrganizer(base_dir=None, model_name="test-model")
+
+        async def astream_reorganization_actions(summaries):
+            yield {"src_path": "a.txt", "dst_path": "Docs/a.txt"}
+
+        async def collect():
+            return [line async for line in pipeline.stream(BatchContext("/nonexistent/batch"))]
+
+        pipeline = BatchPipeline(summarizer, organizer, logger=MagicMock())
+        with patch.object(organizer, "astream_reorganization_actions", astream_reorganization_actions), \
+                patch.object(organizer, "create_directory_structure"):
+            lines = "".join(asyncio.run(collect())).splitlines()
+        move, tree = [json.loads(line) for line in lines]
+        self.assertEqual(move["type"], "move")
+        self.assertEqual(move["file"]["destination"], "Docs/a.txt")
+        self.assertEqual(move["file"]["path"], "batch/Docs/a.txt")
+        self.assertEqual(tree["type"], "tree")
+        self.assertEqual(tree["treeStructure"]["children"][0]["name"], "Docs")
+
+    def test_failed_stream_ends_with_an_error_line(self):
+        summarizer = MagicMock()
+        summarizer.load_documents.return_value = ([MagicMock(metadata={"file_name": "c.txt", "duplicates": ["c copy.txt"]})], [])
+        summarizer.summarize_documents = AsyncMock(return_value=[
+            {"file_path": name, "summary": name} for name in ("a.txt", "b.txt", "c.txt")
+        ])
+        organizer = DirectoryOrganizer(base_dir=None, model_name="test-model")
+
+        async def astream_reorganization_actions(summaries):
+            yield {"src_path": "a.txt", "dst_path": "Docs/a.txt"}
+            raise RuntimeError("rate limited")
+
+        async def collect():
+            return [line async for line in pipeline.stream(BatchContext("/nonexistent/batch"))]
+
+        pipeline = BatchPipeline(summarizer, organizer, logger=MagicMock())
+        with patch.object(organizer, "astream_reorganization_actions", astream_reorganization_actions):
+            lines = [json.loads(line) for line in "".join(asyncio.run(collect())).splitlines()]
+        self.assertEqual([line["type"] for line in lines], ["move", "error"])
+        self.assertEqual(lines[1]["error"], "rate limited")
+        self.assertEqual(lines[1]["pendingFiles"], ["b.txt", "c.txt", "c copy.txt"])
+        self.assertEqual(lines[1]["failedFiles"], [])
+
 class TestFastAPIEndpoints(unittest.TestCase):
     def setUp(self):
+        # Keep the app's SQLite stores out of the working tree
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        env = patch.dict(os.environ, {
+            "HISTORY_DB_PATH": os.path.join(self.tmp_dir, "history.db"),
+            "SEARCH_DB_PATH": os.path.join(self.tmp_dir, "search.db"),
+        })
+        env.start()
+        self.addCleanup(env.stop)
         # Create a test client for the FastAPI app
         self.app = create_app()
         self.client = TestClient(self.app)
@@ -103,6 +1111,15 @@ class TestFastAPIEndpoints(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {"status": "ok"})
 
+    def test_metrics(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE cortexfs_stage_duration_seconds histogram", response.text)
+
+    def test_unknown_commit_job_is_not_found(self):
+        self.assertEqual(self.client.get("/commit-progress/missing").status_code, 404)
+        self.assertEqual(self.client.post("/commit-cancel/missing").status_code, 404)
+
     def test_batch_organize_path_not_found(self):
         response = self.client.post("/batch-organize", json={"path": "/invalid/path"})
         self.assertEqual(response.status_code, 404)